@@ -1,20 +1,200 @@
-from fastapi import APIRouter, Form
-from fastapi.responses import JSONResponse
-from services.generation import generate_document
+import asyncio
+import json
+import os
+from typing import Optional
+
+import anyio
+from fastapi import APIRouter, Form, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from services.generation import (
+    GENERATION_SCHEDULER,
+    DeadlineExceededError,
+    SchedulerBusyError,
+    generate_document,
+    stream_document,
+)
+from services.generation_cache import GENERATION_CACHE
+from services.ollama_client import OLLAMA
 
 router = APIRouter()
 
+# Période de sondage de la déconnexion client pendant un flux SSE
+SSE_DISCONNECT_POLL_S = float(os.getenv("NOXOZ_SSE_DISCONNECT_POLL_S", "0.5"))
+# Événements d'avance produits par la génération pour un client lent
+SSE_QUEUE_MAX = 256
+
 @router.post("/")
-def generate_doc(prompt: str = Form(...), template: str = Form("default")):
+async def generate_doc(
+    prompt: str = Form(...),
+    template: str = Form("default"),
+    model: Optional[str] = Form(None),
+    options: Optional[str] = Form(None),
+    priority: str = Form("interactive"),
+    deadline_s: Optional[float] = Form(None),
+    cache: bool = Form(True),
+):
     try:
-        doc_path = generate_document(prompt, template)
-        return JSONResponse({"status": "success", "file_path": doc_path})
+        # options: JSON Ollama (ex: {"temperature": 0.2, "num_ctx": 8192})
+        ollama_options = json.loads(options) if options else None
+        result = await generate_document(
+            prompt, template, model=model, options=ollama_options,
+            priority=priority, deadline_s=deadline_s, use_cache=cache,
+        )
+        return JSONResponse({
+            "status": "success",
+            "file_path": result["file_path"],
+            "message": result["message"],
+            "model": result["model"],
+            "stats": result["stats"],
+            "queue_wait_ms": result["queue_wait_ms"],
+            "cached": result["cached"],
+            "context": result["context"],
+        })
+    except SchedulerBusyError as e:
+        return JSONResponse({"status": "busy", "message": str(e)}, status_code=503, headers={"Retry-After": "5"})
+    except DeadlineExceededError as e:
+        return JSONResponse({"status": "timeout", "message": str(e)}, status_code=504)
+    except ValueError as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
     except Exception as e:
         return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _sse_error(e: Exception) -> str:
+    if isinstance(e, SchedulerBusyError):
+        return _sse("error", {"status": "busy", "message": str(e)})
+    if isinstance(e, DeadlineExceededError):
+        return _sse("error", {"status": "timeout", "message": str(e)})
+    return _sse("error", {"status": "error", "message": str(e)})
+
+
+def _sse_response(
+    request: Request,
+    prompt: str,
+    template: str,
+    model: Optional[str],
+    options: Optional[str],
+    priority: str = "interactive",
+    deadline_s: Optional[float] = None,
+    cache: bool = True,
+):
+    """
+    Server-Sent Events: retrieval -> scheduled -> token* -> done (ou error).
+    La génération tourne dans sa propre tâche (producteur -> file); la déconnexion
+    client est sondée toutes les SSE_DISCONNECT_POLL_S, y compris en file
+    d'attente du scheduler et avant le premier token => tâche annulée, slot
+    rendu et requête HTTP vers Ollama fermée.
+    """
+    async def _events():
+        try:
+            ollama_options = json.loads(options) if options else None
+        except ValueError as e:
+            yield _sse_error(e)
+            return
+
+        items: asyncio.Queue = asyncio.Queue(maxsize=SSE_QUEUE_MAX)
+
+        async def _produce():
+            stream = stream_document(
+                prompt, template, model=model, options=ollama_options,
+                priority=priority, deadline_s=deadline_s, use_cache=cache,
+            )
+            try:
+                async for item in stream:
+                    await items.put(item)
+                await items.put(None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await items.put(e)
+            finally:
+                await stream.aclose()
+
+        producer = asyncio.create_task(_produce())
+        getter = None
+        try:
+            while True:
+                if getter is None:
+                    getter = asyncio.ensure_future(items.get())
+                done, _ = await asyncio.wait({getter}, timeout=SSE_DISCONNECT_POLL_S)
+                if await request.is_disconnected():
+                    break
+                if not done:
+                    continue
+                item, getter = getter.result(), None
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    yield _sse_error(item)
+                    break
+                event = item.pop("event")
+                yield _sse(event, item)
+        finally:
+            # annulation possible (client parti): le nettoyage doit aller au bout
+            with anyio.CancelScope(shield=True):
+                if getter is not None:
+                    getter.cancel()
+                producer.cancel()
+                await asyncio.gather(producer, return_exceptions=True)
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/stream")
+async def generate_stream(
+    request: Request,
+    prompt: str = Form(...),
+    template: str = Form("default"),
+    model: Optional[str] = Form(None),
+    options: Optional[str] = Form(None),
+    priority: str = Form("interactive"),
+    deadline_s: Optional[float] = Form(None),
+    cache: bool = Form(True),
+):
+    return _sse_response(request, prompt, template, model, options, priority, deadline_s, cache)
+
+
+# GET: utilisable directement avec EventSource côté navigateur
+@router.get("/stream")
+async def generate_stream_get(
+    request: Request,
+    prompt: str,
+    template: str = "default",
+    model: Optional[str] = None,
+    options: Optional[str] = None,
+    priority: str = "interactive",
+    deadline_s: Optional[float] = None,
+    cache: bool = True,
+):
+    return _sse_response(request, prompt, template, model, options, priority, deadline_s, cache)
+
+
 @router.get("/status")
 async def status_generate():
-    return JSONResponse({"status": "ok", "endpoint": "generate"})
+    return JSONResponse({
+        "status": "ok",
+        "endpoint": "generate",
+        "ollama": OLLAMA.stats(),
+        "scheduler": GENERATION_SCHEDULER.stats(),
+        "cache": GENERATION_CACHE.stats(),
+    })
+
+
+# File d'attente des générations: profondeur, attente, durée par priorité
+@router.get("/metrics")
+async def metrics_generate():
+    return JSONResponse({
+        "status": "ok",
+        "scheduler": GENERATION_SCHEDULER.stats(),
+        "cache": GENERATION_CACHE.stats(),
+    })
 
 # Endpoint health
 @router.get("/health")
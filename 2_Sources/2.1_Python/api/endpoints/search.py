@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# PATH: api/endpoints/search.py
+# Auteur: Bruno DELNOZ
+# Version: v1.0.0 – Date: 2026-02-09
+# Target usage: Recherche de chunks filtrée (fichier, extension, langue, dates, dernière version)
+#
+# v1.0.0:
+# - POST /search/ (JSON) et GET /search/?q=... (query params)
+# - Filtres compilés en where Chroma (réponse: where effectif + elapsed_ms)
+
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter, Query
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
+
+from services.search_filters import SearchFilters
+from services.vector_store import scoped_where, search_similar
+
+router = APIRouter()
+
+
+class SearchRequest(BaseModel):
+    query: str = Field(..., min_length=1)
+    k: int = Field(5, ge=1, le=100)
+    mode: Optional[str] = Field(None, description="vector | lexical | hybrid (défaut: NOXOZ_SEARCH_MODE)")
+    filters: Dict[str, Any] = Field(default_factory=dict, description="file_id, ext, original_name, "
+                                    "language, ingested_after, ingested_before, latest_only")
+
+
+def _run(query: str, k: int, mode: Optional[str], raw_filters: Dict[str, Any]) -> Dict:
+    filters = SearchFilters.from_dict(raw_filters)
+    start = time.perf_counter()
+    results = search_similar(query, k, mode=mode, filters=filters)
+    return {
+        "status": "ok",
+        "count": len(results),
+        "results": results,
+        "filters": filters.to_dict(),
+        "where": scoped_where(filters),
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 3),
+    }
+
+
+async def _search(query: str, k: int, mode: Optional[str], raw_filters: Dict[str, Any]) -> JSONResponse:
+    try:
+        return JSONResponse(await asyncio.to_thread(_run, query, k, mode, raw_filters))
+    except ValueError as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+    except Exception as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
+
+
+@router.post("/")
+async def search_post(req: SearchRequest):
+    return await _search(req.query, req.k, req.mode, req.filters)
+
+
+@router.get("/")
+async def search_get(
+    q: str = Query(..., min_length=1),
+    k: int = Query(5, ge=1, le=100),
+    mode: Optional[str] = None,
+    file_id: Optional[List[str]] = Query(None),
+    ext: Optional[List[str]] = Query(None),
+    original_name: Optional[List[str]] = Query(None),
+    language: Optional[List[str]] = Query(None),
+    ingested_after: Optional[str] = None,
+    ingested_before: Optional[str] = None,
+    latest_only: bool = False,
+):
+    raw = {
+        "file_id": file_id,
+        "ext": ext,
+        "original_name": original_name,
+        "language": language,
+        "ingested_after": ingested_after,
+        "ingested_before": ingested_before,
+        "latest_only": latest_only,
+    }
+    return await _search(q, k, mode, {key: v for key, v in raw.items() if v not in (None, [], False)})
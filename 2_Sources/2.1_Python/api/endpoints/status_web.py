@@ -14,24 +14,59 @@ PYTHON_FILES = [
     "api/dependencies.py",
     "api/router.py",
     "api/endpoints/generate.py",
+    "api/endpoints/search.py",
     "api/endpoints/status.py",
     "api/endpoints/upload.py",
     "api/endpoints/status_web.py",
     "api/monitor.py",
+    "bench_vector_backends.py",
+    "bulk_ingest.py",
     "chroma_integration.py",
     "main_agent.py",
+    "rebuild_index.py",
+    "services/chunking.py",
+    "services/context_builder.py",
+    "services/embedding_cache.py",
+    "services/embeddings.py",
     "services/generation.py",
+    "services/generation_cache.py",
+    "services/health_snapshot.py",
     "services/ingestion.py",
+    "services/jobs.py",
+    "services/metadata_repository.py",
+    "services/metrics.py",
+    "services/numpy_index.py",
+    "services/ollama_client.py",
+    "services/search_cache.py",
+    "services/search_filters.py",
     "services/vector_store.py",
+    "services/watcher.py",
     "temp.py",
+    "test_chunking.py",
+    "test_context_builder.py",
     "test_db_huffing.py",
-    "test_sentence_transformers.py"
+    "test_embedding_cache.py",
+    "test_embedding_dispatcher.py",
+    "test_embeddings.py",
+    "test_generate_stream.py",
+    "test_generation_cache.py",
+    "test_generation_scheduler.py",
+    "test_health_snapshot.py",
+    "test_jobs.py",
+    "test_metadata_repository.py",
+    "test_numpy_index.py",
+    "test_ollama_client.py",
+    "test_search_filters.py",
+    "test_sentence_transformers.py",
+    "test_vector_store.py",
+    "test_watcher.py"
 ]
 
 BASE_API_URL = "https://127.0.0.1:8443/api"
 ENDPOINT_BASES = [
     {"name": "Generate", "path": "/generate"},
     {"name": "Upload", "path": "/upload"},
+    {"name": "Search", "path": "/search"},
     {"name": "Status", "path": "/status"},
     {"name": "Monitor", "path": "/monitor"},
 ]
@@ -41,6 +76,7 @@ MONITOR_COMPONENTS = [
     {"name": "ChromaDB", "key": "chroma"},
     {"name": "SQLite", "key": "sqlite"},
     {"name": "Ollama", "key": "ollama"},
+    {"name": "Embeddings", "key": "embeddings"},
     {"name": "Logs", "key": "logs"},
     {"name": "Last Prompt", "key": "last_prompt"},
 ]
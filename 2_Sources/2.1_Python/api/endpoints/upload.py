@@ -1,21 +1,41 @@
 #!/usr/bin/env python3
 # PATH: api/endpoints/upload.py
 # Auteur: Bruno DELNOZ
-# Version: v2.0.1 – Date: 2026-02-08
+# Version: v2.3.1 – Date: 2026-02-09
 # Target usage: Upload + ingestion + journaux en mémoire (ring buffer)
 #
+# v2.3.1:
+# - GET /watcher: stats() du watcher lu dans un thread (verrou du watcher => jamais sur l'event loop)
+#
+# v2.3.0:
+# - POST /rebuild: rebuild complet de l'index depuis SQLite en job d'arrière-plan
+#   (progression dans /api/monitor/full "rebuild"; 409 si un rebuild tourne déjà)
+#
+# v2.2.0:
+# - GET /watcher: état du dossier de dépôt surveillé (backend, fichiers en attente, compteurs)
+#
+# v2.1.0:
+# - Upload asynchrone: octets persistés puis 202 + job_id, ingestion dans un pool borné
+# - GET /jobs/{job_id} (statut, timings par étape, résultat) + GET /jobs
+# - 503 si la file d'ingestion est pleine
+# - Les logs sont mis à jour à la fin du job (status queued -> success/error)
+#
 # Fix v2.0.1:
 # - IDs de logs stables (NEXT_LOG_ID) même quand on pop(0)
 # - steps toujours une liste
 # - expose file_id/file_path au top-level en succès
 # - logs: copie défensive pour éviter effets de bord
 
+import asyncio
+import time
 from datetime import datetime, timezone
 from fastapi import APIRouter, UploadFile, File
 from pydantic import BaseModel
 from fastapi.responses import JSONResponse
 
-from services.ingestion import parse_and_store_file, parse_and_store_local_file
+from services.ingestion import INBOX_WATCHER, ingest_server_file, ingest_stored_file, resolve_server_file, store_upload
+from services.jobs import INGEST_JOBS, Job, QueueFullError
+from services.vector_store import REBUILD_STATUS, rebuild_chroma_from_sqlite
 
 router = APIRouter()
 
@@ -31,6 +51,7 @@ class ServerFileRequest(BaseModel):
 def _push_log(entry: dict):
     """
     Ring buffer simple en mémoire (non persistant).
+    L'entrée est mise à jour en place par le job (lecture via /logs = copies).
     """
     UPLOAD_LOGS.append(entry)
     if len(UPLOAD_LOGS) > MAX_LOGS:
@@ -51,51 +72,92 @@ def _new_log_entry(filename: str) -> dict:
     return entry
 
 
-@router.post("/")
-async def upload_file(file: UploadFile = File(...)):
-    log_entry = _new_log_entry(file.filename or "uploaded_file")
+def _log_finisher(log_entry: dict):
+    """
+    Callback de fin de job: reporte le résultat dans l'entrée de log.
+    """
+    def _on_done(job: Job):
+        result = job.result or {}
+        if job.status == "success":
+            steps = result.get("steps") or []
+            if not isinstance(steps, list):
+                steps = [steps]
+            log_entry["steps"] = steps
+            log_entry["result"] = result.get("message")
+            log_entry["file_path"] = result.get("file_path")
+            log_entry["file_id"] = result.get("file_id")
+        else:
+            log_entry["error"] = job.error
+            log_entry["steps"] = log_entry["steps"] + [{
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "message": f"Erreur ingestion: {job.error}",
+                "status": "error",
+            }]
+        log_entry["status"] = job.status
+        log_entry["finished_at"] = datetime.now(timezone.utc).isoformat()
+    return _on_done
 
-    try:
-        result = await parse_and_store_file(file)
 
-        steps = result.get("steps") or []
-        if not isinstance(steps, list):
-            steps = [steps]
+def _accepted(job: Job, log_entry: dict, filename: str, file_id=None, file_path=None) -> JSONResponse:
+    return JSONResponse({
+        "status": "accepted",
+        "filename": filename,
+        "job_id": job.id,
+        "job_url": f"/api/upload/jobs/{job.id}",
+        "file_id": file_id,
+        "file_path": file_path,
+        "steps": log_entry["steps"],
+        "log_id": log_entry["id"],
+    }, status_code=202)
+
+
+def _rejected(e: Exception, log_entry: dict, label: str) -> JSONResponse:
+    log_entry["status"] = "error"
+    log_entry["error"] = str(e)
+    log_entry["steps"].append({
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "message": f"{label}: {e}",
+        "status": "error",
+    })
+    log_entry["finished_at"] = datetime.now(timezone.utc).isoformat()
+    _push_log(log_entry)
+
+    return JSONResponse({
+        "status": "error",
+        "message": str(e),
+        "steps": log_entry["steps"],
+        "log_id": log_entry["id"],
+    }, status_code=503 if isinstance(e, QueueFullError) else 500)
 
-        log_entry["status"] = "success"
-        log_entry["steps"] = steps
-        log_entry["result"] = result.get("message")
-        log_entry["file_path"] = result.get("file_path")
-        log_entry["file_id"] = result.get("file_id")
-        log_entry["finished_at"] = datetime.now(timezone.utc).isoformat()
-        _push_log(dict(log_entry))  # copie défensive
 
-        return JSONResponse({
-            "status": "success",
-            "filename": file.filename,
-            "file_id": result.get("file_id"),
-            "file_path": result.get("file_path"),
-            "result": result,
-            "log_id": log_entry["id"],
-        })
+@router.post("/")
+async def upload_file(file: UploadFile = File(...)):
+    filename = file.filename or "uploaded_file"
+    log_entry = _new_log_entry(filename)
+
+    try:
+        t0 = time.perf_counter()
+        stored = await store_upload(file)
+        job = Job("upload", filename)
+        job.add_stage("store", (time.perf_counter() - t0) * 1000.0)
+
+        log_entry["steps"] = list(stored["steps"])
+        log_entry["file_path"] = stored["file_path"]
+        log_entry["file_id"] = stored["file_id"]
+        log_entry["job_id"] = job.id
+        log_entry["status"] = "queued"
+
+        INGEST_JOBS.submit(
+            "upload", filename,
+            lambda j: ingest_stored_file(stored, job=j),
+            on_done=_log_finisher(log_entry),
+            job=job,
+        )
+        _push_log(log_entry)
+        return _accepted(job, log_entry, filename, stored["file_id"], stored["file_path"])
 
     except Exception as e:
-        log_entry["status"] = "error"
-        log_entry["error"] = str(e)
-        log_entry["steps"].append({
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "message": f"Erreur upload: {e}",
-            "status": "error",
-        })
-        log_entry["finished_at"] = datetime.now(timezone.utc).isoformat()
-        _push_log(dict(log_entry))  # copie défensive
-
-        return JSONResponse({
-            "status": "error",
-            "message": str(e),
-            "steps": log_entry["steps"],
-            "log_id": log_entry["id"],
-        }, status_code=500)
+        return _rejected(e, log_entry, "Erreur upload")
 
 
 @router.post("/server-file")
@@ -103,46 +165,58 @@ async def upload_server_file(payload: ServerFileRequest):
     log_entry = _new_log_entry(payload.relative_path)
 
     try:
-        result = await parse_and_store_local_file(payload.relative_path)
+        abs_path = resolve_server_file(payload.relative_path)
+        job = Job("server-file", payload.relative_path)
+        log_entry["file_path"] = str(abs_path)
+        log_entry["job_id"] = job.id
+        log_entry["status"] = "queued"
+
+        INGEST_JOBS.submit(
+            "server-file", payload.relative_path,
+            lambda j: ingest_server_file(abs_path, job=j),
+            on_done=_log_finisher(log_entry),
+            job=job,
+        )
+        _push_log(log_entry)
+        return _accepted(job, log_entry, payload.relative_path, file_path=str(abs_path))
 
-        steps = result.get("steps") or []
-        if not isinstance(steps, list):
-            steps = [steps]
+    except Exception as e:
+        return _rejected(e, log_entry, "Erreur upload serveur")
 
-        log_entry["status"] = "success"
-        log_entry["steps"] = steps
-        log_entry["result"] = result.get("message")
-        log_entry["file_path"] = result.get("file_path")
-        log_entry["file_id"] = result.get("file_id")
-        log_entry["finished_at"] = datetime.now(timezone.utc).isoformat()
-        _push_log(dict(log_entry))  # copie défensive
 
-        return JSONResponse({
-            "status": "success",
-            "filename": payload.relative_path,
-            "file_id": result.get("file_id"),
-            "file_path": result.get("file_path"),
-            "result": result,
-            "log_id": log_entry["id"],
-        })
+@router.post("/rebuild")
+async def rebuild_index(reset: bool = False):
+    if REBUILD_STATUS.get("state") in ("waiting_writers", "running"):
+        return JSONResponse({"status": "error", "message": "Rebuild déjà en cours",
+                             "rebuild": dict(REBUILD_STATUS)}, status_code=409)
+    try:
+        job = INGEST_JOBS.submit("rebuild", "index", lambda j: rebuild_chroma_from_sqlite(resume=not reset))
+    except QueueFullError as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=503)
+    return JSONResponse({
+        "status": "accepted",
+        "job_id": job.id,
+        "job_url": f"/api/upload/jobs/{job.id}",
+    }, status_code=202)
+
 
-    except Exception as e:
-        log_entry["status"] = "error"
-        log_entry["error"] = str(e)
-        log_entry["steps"].append({
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "message": f"Erreur upload serveur: {e}",
-            "status": "error",
-        })
-        log_entry["finished_at"] = datetime.now(timezone.utc).isoformat()
-        _push_log(dict(log_entry))  # copie défensive
-
-        return JSONResponse({
-            "status": "error",
-            "message": str(e),
-            "steps": log_entry["steps"],
-            "log_id": log_entry["id"],
-        }, status_code=500)
+@router.get("/jobs")
+async def list_jobs(limit: int = 50):
+    limit = max(1, min(limit, 500))
+    return JSONResponse({"status": "ok", "queue": INGEST_JOBS.stats(), "jobs": INGEST_JOBS.list(limit)})
+
+
+@router.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = INGEST_JOBS.get(job_id)
+    if job is None:
+        return JSONResponse({"status": "error", "message": f"Job inconnu: {job_id}"}, status_code=404)
+    return JSONResponse(job.to_dict())
+
+
+@router.get("/watcher")
+async def watcher_status():
+    return JSONResponse({"status": "ok", "watcher": await asyncio.to_thread(INBOX_WATCHER.stats)})
 
 
 @router.get("/status")
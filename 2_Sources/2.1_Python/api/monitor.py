@@ -1,18 +1,41 @@
 # PATH: 2_Sources/2.1_Python/api/monitor.py
 # Auteur: Bruno DELNOZ
 # Email: bruno.delnoz@protonmail.com
-# Version: v2.0.1 - Date: 2026-02-08
+# Version: v2.2.0 - Date: 2026-02-09
 # Target usage: Monitoring complet des composants NoXoZ_job (FastAPI, Chroma, SQLite, Ollama)
+#
+# v2.2.0:
+# - check_ollama(): sonde async sur le client Ollama partagé (OLLAMA.probe) au lieu d'un "curl"
+#   en subprocess: modèles installés / chargés (/api/ps), latence, stats du client
+#
+# v2.1.0:
+# - /full: checks exécutés en parallèle hors event loop, timeout par check, snapshot en cache
+#   (services/health_snapshot.py, marqueur "snapshot.cached") rafraîchi en tâche de fond
+# - /full?refresh=true force un nouveau tour de checks; /snapshot: statistiques du cache
 
 from fastapi import APIRouter
 from fastapi.responses import JSONResponse
-import chromadb
 import sqlite3
 import os
-import subprocess
 from pathlib import Path
 
-from services.vector_store import METADATA_DB, VECTORS_DIR, DEFAULT_COLLECTION
+from services.vector_store import (
+    CHROMA,
+    METADATA_DB,
+    VECTORS_DIR,
+    DEFAULT_COLLECTION,
+    EMBEDDING_DISPATCHER,
+    EMBEDDING_CACHE,
+    METADATA_REPO,
+    NUMPY_INDEX,
+    REBUILD_STATUS,
+    VECTOR_BACKEND,
+    active_collection_name,
+)
+from services.embeddings import EMBEDDINGS
+from services.health_snapshot import HealthSnapshot
+from services.ollama_client import OLLAMA
+from services.search_cache import SEARCH_CACHE
 
 router = APIRouter()
 
@@ -28,13 +51,15 @@ def check_chroma():
         if not os.path.exists(CHROMA_DIR):
             return {"status": "error", "error": f"Chroma directory not found: {CHROMA_DIR}"}
 
-        chroma_client = chromadb.PersistentClient(path=CHROMA_DIR)
+        # client partagé (ouvert au démarrage): plus de PersistentClient par hit /monitor
+        chroma_client = CHROMA.client()
         collections = chroma_client.list_collections()
-        names = [c.name for c in collections]
+        names = [getattr(c, "name", c) for c in collections]
 
+        active = active_collection_name()
         count_default = None
-        if DEFAULT_COLLECTION in names:
-            col = chroma_client.get_collection(DEFAULT_COLLECTION)
+        if active in names:
+            col = CHROMA.collection(active)
             try:
                 count_default = col.count()
             except Exception:
@@ -45,7 +70,12 @@ def check_chroma():
             "collections": names,
             "collections_count": len(names),
             "default_collection": DEFAULT_COLLECTION,
+            "active_collection": active,
             "default_count": count_default,
+            "rebuild": dict(REBUILD_STATUS),
+            "client": CHROMA.stats(),
+            "vector_backend": VECTOR_BACKEND,
+            "numpy_index": NUMPY_INDEX.stats() if VECTOR_BACKEND == "numpy" else None,
         }
     except Exception as e:
         return {"status": "error", "error": str(e)}
@@ -72,35 +102,32 @@ def check_sqlite():
 
         conn.close()
 
-        return {"status": "ok", "database": SQLITE_DB, "tables": tables, "counts": counts}
+        return {
+            "status": "ok",
+            "database": SQLITE_DB,
+            "tables": tables,
+            "counts": counts,
+            "writer": METADATA_REPO.writer.stats(),
+        }
     except Exception as e:
         return {"status": "error", "error": str(e)}
 
 
-def check_ollama():
-    try:
-        result = subprocess.run(
-            ["curl", "-s", "http://localhost:11434/api/tags"],
-            capture_output=True,
-            text=True,
-            timeout=3,
-        )
-
-        if result.returncode != 0:
-            return {"status": "error", "error": "Ollama service not responding"}
-
-        import json
-        try:
-            data = json.loads(result.stdout or "{}")
-            models = [m.get("name", "unknown") for m in data.get("models", [])]
-            return {"status": "ok", "endpoint": "http://localhost:11434", "models": models, "models_count": len(models)}
-        except json.JSONDecodeError:
-            return {"status": "ok", "endpoint": "http://localhost:11434", "note": "Service running but response not JSON"}
-
-    except subprocess.TimeoutExpired:
-        return {"status": "error", "error": "Ollama ping timeout"}
-    except Exception as e:
-        return {"status": "error", "error": str(e)}
+async def check_ollama():
+    # connexions keep-alive du client de génération: ni fork/exec ni handshake TCP par sonde
+    result = await OLLAMA.probe()
+    result["client"] = OLLAMA.stats()
+    return result
+
+
+def check_embeddings():
+    stats = EMBEDDINGS.stats()
+    stats["dispatcher"] = EMBEDDING_DISPATCHER.stats()
+    stats["cache"] = EMBEDDING_CACHE.stats() if EMBEDDING_CACHE is not None else {"enabled": False}
+    stats["search_cache"] = SEARCH_CACHE.stats()
+    if stats.get("error"):
+        return {"status": "error", **stats}
+    return {"status": "ok" if stats.get("ready") else "warming_up", **stats}
 
 
 def get_recent_logs():
@@ -140,17 +167,25 @@ def get_last_prompt():
         return {"status": "error", "error": str(e)}
 
 
+MONITOR_SNAPSHOT = HealthSnapshot({
+    "chroma": check_chroma,
+    "sqlite": check_sqlite,
+    "ollama": check_ollama,
+    "embeddings": check_embeddings,
+    "logs": get_recent_logs,
+    "last_prompt": get_last_prompt,
+})
+
+
 @router.get("/full")
-async def full_monitor():
-    response = {
-        "fastapi": {"status": "ok"},
-        "chroma": check_chroma(),
-        "sqlite": check_sqlite(),
-        "ollama": check_ollama(),
-        "logs": get_recent_logs(),
-        "last_prompt": get_last_prompt(),
-    }
-    return JSONResponse(content=response)
+async def full_monitor(refresh: bool = False):
+    snapshot = await MONITOR_SNAPSHOT.get(force=refresh)
+    return JSONResponse(content={"fastapi": {"status": "ok"}, **snapshot})
+
+
+@router.get("/snapshot")
+async def snapshot_stats():
+    return JSONResponse({"status": "ok", "snapshot": MONITOR_SNAPSHOT.stats()})
 
 
 @router.get("/status")
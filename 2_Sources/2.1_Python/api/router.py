@@ -3,13 +3,14 @@
 
 from fastapi import APIRouter
 
-from api.endpoints import generate, status, upload, status_web, sqlite_info
+from api.endpoints import generate, search, status, upload, status_web, sqlite_info
 from api import monitor
 
 router = APIRouter()
 
 router.include_router(generate.router, prefix="/generate")
 router.include_router(upload.router, prefix="/upload")
+router.include_router(search.router, prefix="/search")
 router.include_router(status.router, prefix="/status")
 router.include_router(monitor.router, prefix="/monitor")
 router.include_router(status_web.router, prefix="/monitor")  # si ton status_web est sous /api/monitor/...
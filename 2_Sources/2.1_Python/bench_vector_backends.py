@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# PATH: 2_Sources/2.1_Python/bench_vector_backends.py
+# Auteur: Bruno DELNOZ
+# Email: bruno.delnoz@protonmail.com
+# Version: v1.2.0 – Date: 2026-02-09
+# Target usage: Benchmark latence / recall des backends vectoriels (Chroma HNSW vs NumPy exact)
+#
+# Changelog:
+# v1.2.0 - 2026-02-09 - Re-score mesuré via NumpyIndex.search (sidecar float32 réel, plus de dict en mémoire);
+#                      coût de l'ancien re-score Chroma get() rapporté à part (core.chroma_get_rescore)
+# v1.1.0 - 2026-02-09 - Rapport de quantification (float32 / float16 / int8): recall@k avant et après re-score
+# v1.0.0 - 2026-02-09 - Version initiale (requêtes = extraits de chunks, p50/p95, recall@k vs exact)
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+SCRIPT_NAME = "bench_vector_backends"
+VERSION = "v1.2.0"
+
+CHANGELOG = """
+v1.2.0 - 2026-02-09 - Re-score mesuré via NumpyIndex.search (sidecar float32 réel, plus de dict en mémoire);
+                      coût de l'ancien re-score Chroma get() rapporté à part (core.chroma_get_rescore)
+v1.1.0 - 2026-02-09 - Rapport de quantification (float32 / float16 / int8): recall@k avant et après re-score
+v1.0.0 - 2026-02-09 - Version initiale (requêtes = extraits de chunks, p50/p95, recall@k vs exact)
+"""
+
+HELP = """
+### BENCH VECTOR BACKENDS - HELP
+Author: Bruno DELNOZ
+Version: v1.2.0
+
+USAGE:
+  python3 bench_vector_backends.py --exec [OPTIONS]
+
+ARGUMENTS OBLIGATOIRES:
+  --exec, -exe            : Exécuter le benchmark sur le corpus ingéré (Chroma + SQLite)
+
+ARGUMENTS DE CONFIGURATION:
+  --queries, -q [INT]     : Nombre de requêtes (extraits de chunks tirés au hasard) (Défaut: 50)
+  --k, -k [INT]           : Top-k demandé (Défaut: 10)
+  --seed [INT]            : Graine du tirage des requêtes (Défaut: 42)
+  --output, -o [PATH]     : Écrire aussi le rapport JSON dans ce fichier
+  --dtypes [LIST]         : Représentations comparées dans le rapport de quantification
+                            (Défaut: float32,float16,int8; vide => pas de rapport)
+  --rescore-factor [INT]  : Candidats re-scorés = k * facteur (Défaut: NOXOZ_NUMPY_RESCORE_FACTOR=4)
+
+ARGUMENTS SYSTEME:
+  --help, -h              : Afficher cette aide
+  --simulate, -s          : Dry-run: taille du corpus et état de la matrice NumPy
+  --changelog, -ch        : Afficher l'historique des modifications
+
+NOTES:
+  - La matrice NumPy est d'abord synchronisée depuis Chroma (sync_numpy_index), quel que soit
+    NOXOZ_VECTOR_BACKEND.
+  - "core": appel brut du moteur (collection.query / NumpyIndex.search) sur un embedding déjà calculé.
+  - "end_to_end": recherche complète (métadonnées + texte), embedding de requête en cache.
+  - recall@k: part du top-k exact (NumPy, cosinus) retrouvée par Chroma (HNSW approché).
+  - quantization: index temporaires (un par dtype) construits depuis les embeddings Chroma;
+    recall@k du premier passage compact seul ("first_pass") et après re-score pleine précision
+    ("rescored": lignes candidates lues dans le sidecar float32, comme en production).
+  - core.chroma_get_rescore: collection.get(include=["embeddings"]) de k * facteur ids, coût
+    par requête d'un re-score depuis Chroma (référence, plus utilisé par le moteur).
+
+EXEMPLES:
+  1. Benchmark par défaut:
+     python3 bench_vector_backends.py --exec
+  2. 200 requêtes, top-5, rapport JSON:
+     python3 bench_vector_backends.py --exec -q 200 -k 5 -o ../../4_Logs/bench_vector_backends.json
+"""
+
+
+def _summary(samples_ms):
+    ordered = sorted(samples_ms)
+    if not ordered:
+        return {"count": 0}
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "p50_ms": round(ordered[len(ordered) // 2], 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        "max_ms": round(ordered[-1], 3),
+    }
+
+
+def _dir_bytes(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file()) if path.exists() else 0
+
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - t0) * 1000
+
+
+def quantization_report(chunk_ids, embeddings, file_ids, queries, k: int, dtypes, rescore_factor: int) -> dict:
+    """
+    recall@k / latence / taille par dtype, vérité terrain = cosinus exact float32 en mémoire.
+    """
+    import tempfile
+
+    import numpy as np
+    from services.metadata_repository import MetadataRepository
+    from services.numpy_index import NumpyIndex, normalize_rows
+
+    matrix = normalize_rows(embeddings)
+    truth = []
+    for q in queries:
+        scores = matrix @ normalize_rows(q)[0]
+        truth.append({chunk_ids[i] for i in np.argsort(-scores)[:k]})
+
+    report = {}
+    for dtype in dtypes:
+        with tempfile.TemporaryDirectory() as tmp:
+            repo = MetadataRepository(Path(tmp) / "bench.db")
+            index = NumpyIndex(Path(tmp) / "index", repo, dtype=dtype, rescore_factor=rescore_factor)
+            index.add(chunk_ids, embeddings, file_ids)
+            stats = index.stats()
+            entry = {"bytes_per_vector": stats["bytes_per_vector"], "rescore_bytes": stats["rescore_bytes"]}
+            modes = {"first_pass": False}
+            if dtype != "float32":
+                modes["rescored"] = True
+            for mode, rescore in modes.items():
+                recalls, latencies = [], []
+                for q, expected in zip(queries, truth):
+                    hits, ms = _timed(lambda: index.search(q, k, rescore=rescore))
+                    latencies.append(ms)
+                    recalls.append(len({c for c, _ in hits} & expected) / max(1, len(expected)))
+                entry[mode] = {"recall_at_k": round(statistics.fmean(recalls), 4), **_summary(latencies)}
+            report[dtype] = entry
+            repo.close_all()
+    return report
+
+
+def run_benchmark(vs, queries: int, k: int, seed: int, dtypes=(), rescore_factor: int = 4) -> dict:
+    sync = vs.sync_numpy_index()
+    _, collection = vs.init_chroma()
+
+    chunk_ids = [r[0] for r in vs.METADATA_REPO.connection().execute(
+        "SELECT chunk_id FROM documents WHERE chunk_id IS NOT NULL;"
+    )]
+    if not chunk_ids:
+        return {"status": "error", "error": "Corpus vide (aucun chunk dans documents)"}
+    rng = random.Random(seed)
+    sample = rng.sample(chunk_ids, min(queries, len(chunk_ids)))
+    got = collection.get(ids=sample, include=["documents"])
+    texts = [" ".join((t or "").split()[:30]) for t in (got.get("documents") or [])]
+    texts = [t for t in texts if t]
+
+    # embeddings de requête calculés une fois (hors chrono des moteurs)
+    embeddings = [vs.embed_query_cached(t) for t in texts]
+
+    core = {"chroma": [], "numpy": [], "chroma_get_rescore": []}
+    e2e = {"chroma": [], "numpy": []}
+    recalls = []
+    for text, q_emb in zip(texts, embeddings):
+        res, ms = _timed(lambda: collection.query(query_embeddings=[q_emb], n_results=k, include=["distances"]))
+        core["chroma"].append(ms)
+        chroma_ids = list((res.get("ids") or [[]])[0])
+
+        hits, ms = _timed(lambda: vs.NUMPY_INDEX.search(q_emb, k))
+        core["numpy"].append(ms)
+        exact_ids = [chunk_id for chunk_id, _ in hits]
+        candidates = rng.sample(chunk_ids, min(k * max(1, rescore_factor), len(chunk_ids)))
+        _, ms = _timed(lambda: collection.get(ids=candidates, include=["embeddings"]))
+        core["chroma_get_rescore"].append(ms)
+        if exact_ids:
+            recalls.append(len(set(chroma_ids) & set(exact_ids)) / len(exact_ids))
+
+        _, ms = _timed(lambda: vs._chroma_search(text, k))
+        e2e["chroma"].append(ms)
+        _, ms = _timed(lambda: vs._numpy_search(text, k))
+        e2e["numpy"].append(ms)
+
+    quantization = None
+    if dtypes and embeddings:
+        ids, vectors, files = [], [], []
+        for i in range(0, len(chunk_ids), 500):
+            page = collection.get(ids=chunk_ids[i:i + 500], include=["embeddings", "metadatas"])
+            if page.get("embeddings") is None:
+                continue
+            ids.extend(page.get("ids") or [])
+            vectors.extend(list(page["embeddings"]))
+            files.extend((m or {}).get("file_id") for m in (page.get("metadatas") or [{}] * len(page["ids"])))
+        if ids:
+            quantization = quantization_report(ids, vectors, files, embeddings, k, dtypes, rescore_factor)
+
+    return {
+        "status": "ok",
+        "chunks": len(chunk_ids),
+        "queries": len(texts),
+        "k": k,
+        "sync": sync,
+        "core": {name: _summary(v) for name, v in core.items()},
+        "end_to_end": {name: _summary(v) for name, v in e2e.items()},
+        "chroma_recall_at_k": round(statistics.fmean(recalls), 4) if recalls else None,
+        "index_bytes": {
+            "chroma_dir": _dir_bytes(vs.VECTORS_DIR),
+            "numpy_matrix": vs.NUMPY_INDEX.stats()["bytes"],
+        },
+        "numpy_index": vs.NUMPY_INDEX.stats(),
+        "quantization": quantization,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--help", "-h", action="store_true")
+    parser.add_argument("--exec", "-exe", action="store_true")
+    parser.add_argument("--simulate", "-s", action="store_true")
+    parser.add_argument("--changelog", "-ch", action="store_true")
+    parser.add_argument("--queries", "-q", type=int, default=50)
+    parser.add_argument("--k", "-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", "-o", type=str)
+    parser.add_argument("--dtypes", type=str, default="float32,float16,int8")
+    parser.add_argument("--rescore-factor", type=int)
+    args = parser.parse_args()
+
+    if args.help or len(sys.argv) == 1:
+        print(HELP)
+        return 0
+    if args.changelog:
+        print(CHANGELOG)
+        return 0
+    if not args.exec:
+        print("[ERREUR] --exec est obligatoire (voir --help).")
+        return 2
+
+    # import tardif: chromadb / embeddings seulement si on exécute vraiment
+    from services import vector_store as vs
+
+    if args.simulate:
+        missing, orphans = vs.METADATA_REPO.vector_rows_sync_counts()
+        total = vs.METADATA_REPO.fts_counts()[1]
+        print(f"[SIMULATE] {total} chunk(s) — matrice NumPy: {len(vs.NUMPY_INDEX)} ligne(s), "
+              f"{missing} à charger depuis Chroma, {orphans} orpheline(s)")
+        return 0
+
+    from services.numpy_index import NUMPY_INDEX_DTYPES, NUMPY_RESCORE_FACTOR
+
+    dtypes = [d.strip() for d in args.dtypes.split(",") if d.strip()]
+    unknown = [d for d in dtypes if d not in NUMPY_INDEX_DTYPES]
+    if unknown:
+        print(f"[ERREUR] dtype(s) inconnu(s): {', '.join(unknown)} (attendu: {', '.join(NUMPY_INDEX_DTYPES)})")
+        return 2
+    factor = args.rescore_factor if args.rescore_factor is not None else NUMPY_RESCORE_FACTOR
+
+    report = run_benchmark(vs, max(1, args.queries), max(1, args.k), args.seed, dtypes, factor)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(text, encoding="utf-8")
+    return 0 if report.get("status") == "ok" else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
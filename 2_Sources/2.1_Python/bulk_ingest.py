@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# PATH: 2_Sources/2.1_Python/bulk_ingest.py
+# Auteur: Bruno DELNOZ
+# Email: bruno.delnoz@protonmail.com
+# Version: v1.0.0 – Date: 2026-02-09
+# Target usage: Ingestion massive hors API (dossier ou glob) avec reprise sur checkpoint
+#
+# Changelog:
+# v1.0.0 - 2026-02-09 - Version initiale (pool d'extraction, gros lots, checkpoint, barre de progression)
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+try:
+    from tqdm import tqdm
+except ImportError:  # pragma: no cover - tqdm optionnel
+    tqdm = None
+
+SCRIPT_NAME = "bulk_ingest"
+VERSION = "v1.0.0"
+
+CHANGELOG = """
+v1.0.0 - 2026-02-09 - Version initiale (pool d'extraction, gros lots, checkpoint, barre de progression)
+"""
+
+HELP = """
+### BULK INGEST - HELP
+Author: Bruno DELNOZ
+Version: v1.0.0
+
+USAGE:
+  python3 bulk_ingest.py --exec --source [DIR|GLOB] [OPTIONS]
+
+ARGUMENTS OBLIGATOIRES:
+  --exec, -exe            : Exécuter l'ingestion
+  --source, -src [PATH]   : Dossier (récursif) ou glob, ex: ../../3_Data/uploads/by_sha256
+
+ARGUMENTS DE CONFIGURATION:
+  --workers, -w [INT]     : Process d'extraction (Défaut: NOXOZ_REBUILD_WORKERS ou min(4, CPU))
+  --batch, -b [INT]       : Chunks par lot d'embeddings / transaction (Défaut: NOXOZ_REBUILD_EMBED_BATCH=512)
+  --checkpoint, -cp [PATH]: Fichier checkpoint (Défaut: 3_Data/Cache/bulk_ingest/<hash source>.json)
+  --reset                 : Ignorer le checkpoint existant (repart de zéro)
+  --reingest              : Réingérer aussi le contenu déjà présent dans SQLite
+
+ARGUMENTS SYSTEME:
+  --help, -h              : Afficher cette aide
+  --simulate, -s          : Dry-run: liste ce qui serait ingéré
+  --changelog, -ch        : Afficher l'historique des modifications
+
+EXEMPLES:
+  1. Backfill complet du stockage content-addressed:
+     python3 bulk_ingest.py --exec --source ../../3_Data/uploads/by_sha256
+  2. Glob + reprise après interruption (même commande):
+     python3 bulk_ingest.py --exec --source "../../3_Data/uploads/by_name/**/*.pdf"
+  3. Simulation:
+     python3 bulk_ingest.py --exec --source ../../3_Data/uploads --simulate
+"""
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--help", "-h", action="store_true")
+    parser.add_argument("--exec", "-exe", action="store_true")
+    parser.add_argument("--simulate", "-s", action="store_true")
+    parser.add_argument("--changelog", "-ch", action="store_true")
+    parser.add_argument("--source", "-src", type=str)
+    parser.add_argument("--workers", "-w", type=int)
+    parser.add_argument("--batch", "-b", type=int)
+    parser.add_argument("--checkpoint", "-cp", type=str)
+    parser.add_argument("--reset", action="store_true")
+    parser.add_argument("--reingest", action="store_true")
+    args = parser.parse_args()
+
+    if args.help or len(sys.argv) == 1:
+        print(HELP)
+        return 0
+    if args.changelog:
+        print(CHANGELOG)
+        return 0
+    if not args.exec or not args.source:
+        print("[ERREUR] --exec et --source sont obligatoires (voir --help).")
+        return 2
+
+    # import tardif: chromadb / embeddings seulement si on exécute vraiment
+    from services import vector_store as vs
+
+    checkpoint = Path(args.checkpoint) if args.checkpoint else vs.default_bulk_checkpoint(args.source)
+
+    if args.simulate:
+        candidates = vs.iter_ingest_candidates(args.source)
+        print(f"[SIMULATE] {len(candidates)} fichier(s) candidat(s) — checkpoint: {checkpoint}")
+        for path in candidates[:50]:
+            print(f"  {path}")
+        if len(candidates) > 50:
+            print(f"  ... (+{len(candidates) - 50})")
+        return 0
+
+    if args.reset and checkpoint.exists():
+        checkpoint.unlink()
+
+    bar = None
+
+    def on_progress(done: int, total: int, stats: dict):
+        nonlocal bar
+        if tqdm is not None:
+            if bar is None:
+                bar = tqdm(total=total, initial=stats.get("resumed", 0), unit="file", desc=SCRIPT_NAME)
+            bar.n = done
+            bar.set_postfix(ingested=stats["ingested"], skipped=stats["skipped"],
+                            failed=stats["failed"], chunks=stats["chunks"], refresh=False)
+            bar.refresh()
+        elif done == total or done % 25 == 0:
+            print(f"[PROGRESS] {done}/{total} ingested={stats['ingested']} "
+                  f"skipped={stats['skipped']} failed={stats['failed']} chunks={stats['chunks']}")
+
+    kwargs = {"checkpoint_path": checkpoint, "reingest": args.reingest, "progress": on_progress}
+    if args.workers:
+        kwargs["workers"] = args.workers
+    if args.batch:
+        kwargs["embed_batch"] = args.batch
+
+    try:
+        result = vs.bulk_ingest(args.source, **kwargs)
+    except KeyboardInterrupt:
+        print(f"\n[INTERROMPU] relancer la même commande pour reprendre (checkpoint: {checkpoint})")
+        return 130
+    finally:
+        if bar is not None:
+            bar.close()
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    return 0 if result.get("status") == "ok" else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
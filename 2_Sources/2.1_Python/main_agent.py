@@ -4,7 +4,45 @@
 # Auteur: Bruno DELNOZ
 # Email: bruno.delnoz@protonmail.com
 # Target usage: Entrypoint FastAPI (API + UI manuelle)
-# Version: v1.1.0 – Date: 2026-02-08
+# Version: v1.7.3 – Date: 2026-02-09
+#
+# Fix v1.7.3:
+# - Uploads jamais ingérés (jobs annulés au dernier arrêt) remis en file au démarrage
+#
+# Fix v1.7.2:
+# - Changelog: entrées v1.3.x séparées (une version par évolution)
+#
+# Fix v1.7.1:
+# - /ready relance le warm-up des embeddings s'il a échoué (plus de 503 jusqu'au redémarrage)
+#
+# v1.7.0:
+# - Snapshot /api/monitor/full rafraîchi en tâche de fond (MONITOR_SNAPSHOT), arrêté au shutdown
+#
+# v1.6.0:
+# - Dossier de dépôt surveillé (INBOX_WATCHER, NOXOZ_WATCH_ENABLED): démarré / arrêté avec l'app
+#
+# v1.5.0:
+# - Backend vectoriel numpy: job de synchronisation de la matrice au démarrage si désalignée
+#
+# v1.4.0:
+# - Index plein texte: job de backfill (texte des chunks déjà dans Chroma) au démarrage si incomplet
+#
+# v1.3.3:
+# - Fermeture du pool HTTP Ollama au shutdown
+#
+# v1.3.2:
+# - Client Chroma partagé ouvert au démarrage (temps d'ouverture dans /ready), fermé au shutdown
+#
+# v1.3.1:
+# - Migrations SQLite au démarrage (METADATA_REPO), connexions fermées au shutdown
+#
+# v1.3.0:
+# - Upload asynchrone: l'UI suit le job d'ingestion (202 + /api/upload/jobs/{id})
+# - Arrêt du pool de jobs d'ingestion au shutdown
+#
+# v1.2.0:
+# - Lifespan FastAPI: chargement + warm-up du modèle d'embeddings au démarrage
+# - Endpoint /ready (503 tant que le warm-up n'est pas terminé)
 #
 # Fix v1.1.0:
 # - CORS configurable (ENV) + mode dev
@@ -14,11 +52,27 @@
 ################################################################################
 
 import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
 
+from api.monitor import MONITOR_SNAPSHOT
 from api.router import router as api_router
+from services.embeddings import EMBEDDINGS
+from services.ingestion import INBOX_WATCHER, recover_pending_uploads
+from services.jobs import INGEST_JOBS
+from services.ollama_client import OLLAMA
+from services.vector_store import (
+    CHROMA,
+    METADATA_REPO,
+    backfill_fts_from_chroma,
+    fts_needs_backfill,
+    numpy_index_needs_sync,
+    sync_numpy_index,
+)
+from services.watcher import WATCH_ENABLED
 
 APP_TITLE = "NoXoZ_job API"
 APP_VERSION = "1.0"
@@ -44,7 +98,38 @@ def _get_allowed_origins() -> list[str]:
     return origins
 
 
-app = FastAPI(title=APP_TITLE, version=APP_VERSION)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm-up en thread: l'app démarre tout de suite, /ready reste "not ready" jusqu'à la fin
+    EMBEDDINGS.start_warm_up()
+    # migrations SQLite jouées une fois, avant la première requête
+    METADATA_REPO.migrate()
+    # client Chroma unique du process (ouverture chronométrée, voir /ready)
+    CHROMA.start()
+    # chunks ingérés avant l'index FTS5: texte rechargé depuis Chroma en tâche de fond (/api/upload/jobs)
+    if fts_needs_backfill():
+        INGEST_JOBS.submit("fts_backfill", "documents_fts", lambda job: backfill_fts_from_chroma())
+    # backend numpy (NOXOZ_VECTOR_BACKEND): vecteurs absents de la matrice rechargés depuis Chroma
+    if numpy_index_needs_sync():
+        INGEST_JOBS.submit("numpy_index_sync", "vector_rows", lambda job: sync_numpy_index())
+    # uploads acceptés mais jamais ingérés (jobs annulés au dernier arrêt): remis en file
+    INGEST_JOBS.submit("upload_recovery", "by_sha256", lambda job: recover_pending_uploads())
+    # fichiers déposés dans 3_Data/inbox (NOXOZ_WATCH_DIR) ingérés au fil de l'eau
+    if WATCH_ENABLED:
+        INBOX_WATCHER.start()
+    # checks de /api/monitor/full gardés au chaud: les dashboards lisent le cache
+    MONITOR_SNAPSHOT.start()
+    yield
+    await MONITOR_SNAPSHOT.stop()
+    INBOX_WATCHER.stop()
+    # jobs en file annulés ("cancelled"): uploads repris au prochain démarrage (recover_pending_uploads)
+    INGEST_JOBS.shutdown(wait=False)
+    METADATA_REPO.close_all()
+    CHROMA.close()
+    await OLLAMA.aclose()
+
+
+app = FastAPI(title=APP_TITLE, version=APP_VERSION, lifespan=lifespan)
 
 # Middleware CORS (au cas où UI/clients ne sont pas same-origin)
 allowed_origins = _get_allowed_origins()
@@ -68,6 +153,18 @@ async def health():
     return JSONResponse({"status": "ok", "app": "main_agent", "version": APP_VERSION})
 
 
+@app.get("/ready", include_in_schema=False)
+async def ready():
+    if not EMBEDDINGS.is_ready():
+        # warm-up en échec: nouvelle tentative (bornée par NOXOZ_EMBEDDING_RETRY_S)
+        EMBEDDINGS.start_warm_up()
+    embeddings = EMBEDDINGS.stats()
+    chroma = CHROMA.stats()
+    if not EMBEDDINGS.is_ready() or not chroma["open"]:
+        return JSONResponse({"status": "not_ready", "embeddings": embeddings, "chroma": chroma}, status_code=503)
+    return JSONResponse({"status": "ready", "embeddings": embeddings, "chroma": chroma})
+
+
 # ----------------------------------------------------------------------
 # UI: Manual Operation
 # ----------------------------------------------------------------------
@@ -205,6 +302,14 @@ async def manual_operation():
                         return;
                     }
 
+                    if (response.status === 202 && result.job_url) {
+                        status.textContent = `Statut : fichier reçu, ingestion en file (job ${result.job_id})`;
+                        details.textContent = `Détails : ${result.filename || ""}`;
+                        renderSteps(result.steps, false);
+                        await pollJob(result);
+                        return;
+                    }
+
                     status.textContent = `Statut : ${result.status} - ${result.filename || ""}`;
                     if (result.result && result.result.message) details.textContent = `Détails : ${result.result.message}`;
                     else details.textContent = "Détails : upload terminé.";
@@ -213,6 +318,52 @@ async def manual_operation():
                     renderSteps(steps, false);
                 }
 
+                function formatStages(stages) {
+                    return (stages || []).map((s) => `${s.name}=${s.duration_ms}ms`).join(", ");
+                }
+
+                async function pollJob(accepted) {
+                    const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+                    let delay = 500;
+                    while (true) {
+                        await sleep(delay);
+                        delay = Math.min(delay * 1.5, 3000);
+
+                        let job = null;
+                        try {
+                            const response = await fetch(`${API_BASE}${accepted.job_url}`);
+                            job = await response.json();
+                            if (!response.ok) {
+                                status.textContent = `Statut : erreur (${response.status})`;
+                                details.textContent = `Détails : ${job.message || "Job introuvable"}`;
+                                return;
+                            }
+                        } catch (err) {
+                            status.textContent = "Statut : erreur réseau (suivi du job).";
+                            details.textContent = `Détails : ${err}`;
+                            return;
+                        }
+
+                        const timings = formatStages(job.stages);
+                        if (job.status === "queued" || job.status === "running") {
+                            status.textContent = `Statut : ${job.status} - ${accepted.filename || ""}`;
+                            details.textContent = `Détails : ${timings || "en attente d'un worker"}`;
+                            continue;
+                        }
+
+                        if (job.status === "success") {
+                            status.textContent = `Statut : success - ${accepted.filename || ""}`;
+                            details.textContent = `Détails : ${(job.result && job.result.message) || "ingestion terminée"} (${timings})`;
+                            renderSteps((job.result && job.result.steps) || [], false);
+                        } else {
+                            status.textContent = `Statut : erreur - ${accepted.filename || ""}`;
+                            details.textContent = `Détails : ${job.error || "Erreur inconnue"} (${timings})`;
+                            renderSteps(accepted.steps, true);
+                        }
+                        return;
+                    }
+                }
+
                 async function uploadServerFile(relativePath) {
                     if (!relativePath || !relativePath.trim()) {
                         status.textContent = "Statut : donne un chemin relatif serveur.";
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# PATH: 2_Sources/2.1_Python/rebuild_index.py
+# Auteur: Bruno DELNOZ
+# Email: bruno.delnoz@protonmail.com
+# Version: v1.0.0 – Date: 2026-02-09
+# Target usage: Rebuild complet de l'index vectoriel depuis SQLite (collection shadow + bascule)
+#
+# Changelog:
+# v1.0.0 - 2026-02-09 - Version initiale (rebuild_chroma_from_sqlite, reprise sur checkpoint, progression)
+
+import argparse
+import json
+import sys
+
+SCRIPT_NAME = "rebuild_index"
+VERSION = "v1.0.0"
+
+CHANGELOG = """
+v1.0.0 - 2026-02-09 - Version initiale (rebuild_chroma_from_sqlite, reprise sur checkpoint, progression)
+"""
+
+HELP = """
+### REBUILD INDEX - HELP
+Author: Bruno DELNOZ
+Version: v1.0.0
+
+USAGE:
+  python3 rebuild_index.py --exec [OPTIONS]
+
+ARGUMENTS OBLIGATOIRES:
+  --exec, -exe            : Exécuter le rebuild
+
+ARGUMENTS DE CONFIGURATION:
+  --workers, -w [INT]     : Process d'extraction (Défaut: NOXOZ_REBUILD_WORKERS ou min(4, CPU))
+  --batch, -b [INT]       : Chunks par lot d'embeddings (Défaut: NOXOZ_REBUILD_EMBED_BATCH=512)
+  --reset                 : Ignorer le checkpoint existant (nouvelle collection shadow)
+
+ARGUMENTS SYSTEME:
+  --help, -h              : Afficher cette aide
+  --simulate, -s          : Dry-run: collection active, nombre de fichiers, checkpoint
+  --changelog, -ch        : Afficher l'historique des modifications
+
+NOTES:
+  - Les ingestions / purges (API, watcher, bulk_ingest.py) attendent la fin du rebuild
+    (verrou d'index exclusif), puis écrivent dans la nouvelle collection.
+  - Interrompu: relancer la même commande reprend après le dernier lot checkpointé.
+
+EXEMPLES:
+  1. Rebuild complet (ou reprise):
+     python3 rebuild_index.py --exec
+  2. Repartir de zéro avec 8 process d'extraction:
+     python3 rebuild_index.py --exec --reset --workers 8
+  3. Simulation:
+     python3 rebuild_index.py --exec --simulate
+"""
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--help", "-h", action="store_true")
+    parser.add_argument("--exec", "-exe", action="store_true")
+    parser.add_argument("--simulate", "-s", action="store_true")
+    parser.add_argument("--changelog", "-ch", action="store_true")
+    parser.add_argument("--workers", "-w", type=int)
+    parser.add_argument("--batch", "-b", type=int)
+    parser.add_argument("--reset", action="store_true")
+    args = parser.parse_args()
+
+    if args.help or len(sys.argv) == 1:
+        print(HELP)
+        return 0
+    if args.changelog:
+        print(CHANGELOG)
+        return 0
+    if not args.exec:
+        print("[ERREUR] --exec est obligatoire (voir --help).")
+        return 2
+
+    # import tardif: chromadb / embeddings seulement si on exécute vraiment
+    from services import vector_store as vs
+
+    if args.simulate:
+        vs.ensure_sqlite_schema()
+        total = vs.METADATA_REPO.connection().execute("SELECT COUNT(*) FROM files;").fetchone()[0]
+        checkpoint = None if args.reset else vs._read_checkpoint()
+        print(f"[SIMULATE] collection active: {vs.active_collection_name()} — {total} fichier(s) à réindexer")
+        if checkpoint:
+            print(f"[SIMULATE] reprise: shadow={checkpoint.get('shadow')} "
+                  f"après file_id={checkpoint.get('last_file_id')}")
+        return 0
+
+    def on_progress(status: dict):
+        print(f"[PROGRESS] {status.get('files_done', 0)}/{status.get('files_total', 0)} "
+              f"failed={status.get('files_failed', 0)} chunks={status.get('chunks', 0)} "
+              f"elapsed={status.get('elapsed_seconds', 0)}s")
+
+    kwargs = {"resume": not args.reset, "progress": on_progress}
+    if args.workers:
+        kwargs["workers"] = args.workers
+    if args.batch:
+        kwargs["embed_batch"] = args.batch
+
+    try:
+        result = vs.rebuild_chroma_from_sqlite(**kwargs)
+    except KeyboardInterrupt:
+        print(f"\n[INTERROMPU] relancer la même commande pour reprendre (checkpoint: {vs.REBUILD_CHECKPOINT})")
+        return 130
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    return 0 if result.get("status") == "ok" else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
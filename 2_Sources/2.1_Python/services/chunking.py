@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+# PATH: services/chunking.py
+# Auteur: Bruno DELNOZ
+# Version: v1.1.1 – Date: 2026-02-09
+# Target usage: Découpage des documents en chunks (budget tokens + overlap) avant embeddings
+#
+# v1.1.1:
+# - Fix: regex de detect_language() renommée (_LANG_WORD_RE); elle écrasait _WORD_RE (\S+) et le
+#   découpage par fenêtres de mots perdait chiffres / ponctuation (bloc numérique => 0 chunk)
+#
+# v1.1.0:
+# - detect_language(): langue dominante (fr/en/nl/de) par mots outils, pour les filtres de recherche
+#
+# v1.0.0:
+# - Chunks bornés en tokens (MiniLM tronque à 256 word-pieces => tout le reste était perdu)
+# - Respect de la structure: titres/paragraphes (MD, DOCX), pages (PDF)
+# - Offsets (char_start/char_end) dans le texte extrait complet => stockés dans SQLite
+
+from __future__ import annotations
+
+import os
+import re
+import threading
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+# MiniLM: 256 word-pieces max, dont [CLS]/[SEP] => marge
+CHUNK_MAX_TOKENS = int(os.getenv("NOXOZ_CHUNK_MAX_TOKENS", "240"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("NOXOZ_CHUNK_OVERLAP_TOKENS", "32"))
+TOKENIZER_NAME = os.getenv(
+    "NOXOZ_TOKENIZER",
+    os.getenv("NOXOZ_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"),
+)
+
+BLOCK_SEPARATOR = "\n\n"
+
+
+# ==============================================================================
+# 1) TOKENS: tokenizer local (transformers) ou approximation
+# ==============================================================================
+
+_TOKENIZER = None
+_TOKENIZER_LOADED = False
+_TOKENIZER_LOCK = threading.Lock()
+_APPROX_TOKEN_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+def _get_tokenizer():
+    """
+    Tokenizer HF du modèle d'embeddings (chargé une fois).
+    None si transformers/le modèle ne sont pas dispo => approximation.
+    """
+    global _TOKENIZER, _TOKENIZER_LOADED
+    if _TOKENIZER_LOADED:
+        return _TOKENIZER
+    with _TOKENIZER_LOCK:
+        if not _TOKENIZER_LOADED:
+            try:
+                from transformers import AutoTokenizer
+                _TOKENIZER = AutoTokenizer.from_pretrained(TOKENIZER_NAME)
+            except Exception:
+                _TOKENIZER = None
+            _TOKENIZER_LOADED = True
+    return _TOKENIZER
+
+
+def approx_token_count(text: str) -> int:
+    """
+    Approximation word-piece: mots + ponctuation, +25% pour les mots découpés.
+    """
+    n = len(_APPROX_TOKEN_RE.findall(text))
+    return n + (n // 4)
+
+
+def count_tokens(text: str) -> int:
+    tokenizer = _get_tokenizer()
+    if tokenizer is None:
+        return approx_token_count(text)
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+
+# ==============================================================================
+# 2) STRUCTURES
+# ==============================================================================
+
+@dataclass
+class Block:
+    """
+    Bloc issu de l'extraction (avant découpage).
+    kind: "heading" | "paragraph"
+    page: numéro de page (PDF, 1-based) sinon None
+    """
+    text: str
+    kind: str = "paragraph"
+    page: Optional[int] = None
+
+
+@dataclass
+class Chunk:
+    text: str
+    index: int
+    char_start: int
+    char_end: int
+    token_count: int
+    page: Optional[int] = None
+    section: Optional[str] = None
+
+
+@dataclass
+class _Unit:
+    start: int
+    end: int
+    tokens: int
+    section_id: int
+    is_heading: bool
+    page: Optional[int]
+    section: Optional[str]
+
+
+# ==============================================================================
+# 3) EXTRACTION -> BLOCS (texte brut / markdown)
+# ==============================================================================
+
+_MD_HEADING_RE = re.compile(r"^\s{0,3}#{1,6}\s+\S")
+_MD_FENCE_RE = re.compile(r"^\s{0,3}(```|~~~)")
+
+
+def split_paragraphs(text: str, page: Optional[int] = None) -> List[Block]:
+    """
+    Paragraphes séparés par une ligne vide (txt, json, xml, pages PDF).
+    """
+    return [Block(p, "paragraph", page) for p in re.split(r"\n\s*\n", text) if p.strip()]
+
+
+def markdown_blocks(text: str) -> List[Block]:
+    """
+    Titres (#...) = blocs "heading", le reste en paragraphes.
+    Les blocs de code (```) ne sont jamais coupés sur un '#'.
+    """
+    blocks: List[Block] = []
+    buf: List[str] = []
+    in_fence = False
+
+    def flush():
+        if buf and "".join(buf).strip():
+            blocks.append(Block("\n".join(buf), "paragraph"))
+        buf.clear()
+
+    for line in text.splitlines():
+        if _MD_FENCE_RE.match(line):
+            in_fence = not in_fence
+            buf.append(line)
+            continue
+        if in_fence:
+            buf.append(line)
+            continue
+        if _MD_HEADING_RE.match(line):
+            flush()
+            blocks.append(Block(line.strip(), "heading"))
+        elif not line.strip():
+            flush()
+        else:
+            buf.append(line)
+    flush()
+    return blocks
+
+
+# ==============================================================================
+# 4) DÉCOUPAGE
+# ==============================================================================
+
+_SENTENCE_RE = re.compile(r"[^.!?;:\n]+(?:[.!?;:]+|$)", re.MULTILINE)
+_LINE_RE = re.compile(r"[^\n]+")
+_WORD_RE = re.compile(r"\S+")
+
+
+def _spans(pattern: re.Pattern, text: str, offset: int) -> List[Tuple[int, int]]:
+    out = []
+    for m in pattern.finditer(text):
+        s, e = m.start(), m.end()
+        # on retire les espaces de bord pour garder des offsets "propres"
+        while s < e and text[s].isspace():
+            s += 1
+        while e > s and text[e - 1].isspace():
+            e -= 1
+        if e > s:
+            out.append((offset + s, offset + e))
+    return out
+
+
+def _split_oversized(
+    text: str, base: int, max_tokens: int, count: Callable[[str], int]
+) -> List[Tuple[int, int, int]]:
+    """
+    Découpe un segment trop grand: lignes -> phrases -> mots.
+    Retourne des (start, end, tokens) absolus (base = offset du segment),
+    chacun tenant dans max_tokens.
+    """
+    tokens = count(text)
+    if tokens <= max_tokens:
+        return [(base, base + len(text), tokens)]
+
+    for pattern in (_LINE_RE, _SENTENCE_RE):
+        parts = _spans(pattern, text, 0)
+        if len(parts) > 1:
+            out: List[Tuple[int, int, int]] = []
+            for s, e in parts:
+                out.extend(_split_oversized(text[s:e], base + s, max_tokens, count))
+            return out
+
+    # Dernier recours: fenêtres de mots
+    out = []
+    win_start = None
+    win_end = 0
+    win_tokens = 0
+    for s, e in _spans(_WORD_RE, text, 0):
+        w_tokens = count(text[s:e])
+        if win_start is not None and win_tokens + w_tokens > max_tokens:
+            out.append((base + win_start, base + win_end, win_tokens))
+            win_start, win_tokens = None, 0
+        if win_start is None:
+            win_start = s
+        win_end = e
+        win_tokens += w_tokens
+    if win_start is not None:
+        out.append((base + win_start, base + win_end, win_tokens))
+    return out
+
+
+def chunk_blocks(
+    blocks: List[Block],
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+    count: Callable[[str], int] = count_tokens,
+) -> Tuple[str, List[Chunk]]:
+    """
+    Assemble les blocs en chunks de <= max_tokens.
+    - un titre (MD/DOCX) ou un changement de page (PDF) ouvre une nouvelle section:
+      un chunk ne chevauche jamais deux sections
+    - dans une section, les paragraphes sont empilés jusqu'au budget
+    - overlap: les dernières unités du chunk précédent (<= overlap_tokens) sont répétées
+    Retourne (texte_complet, chunks) — les offsets pointent dans texte_complet.
+    """
+    max_tokens = max(8, max_tokens)
+    overlap_tokens = max(0, min(overlap_tokens, max_tokens // 2))
+
+    # --- texte complet + unités ---
+    parts: List[str] = []
+    units: List[_Unit] = []
+    pos = 0
+    section_id = 0
+    section_title: Optional[str] = None
+    prev_page: Optional[int] = None
+
+    for block in blocks:
+        text = block.text.strip()
+        if not text:
+            continue
+        if parts:
+            parts.append(BLOCK_SEPARATOR)
+            pos += len(BLOCK_SEPARATOR)
+        start = pos
+        parts.append(text)
+        pos += len(text)
+
+        is_heading = block.kind == "heading"
+        if is_heading or (units and block.page != prev_page):
+            section_id += 1
+        if is_heading:
+            section_title = text.lstrip("#").strip()[:200]
+        prev_page = block.page
+
+        for s, e, tok in _split_oversized(text, start, max_tokens, count):
+            units.append(_Unit(s, e, tok, section_id, is_heading, block.page, section_title))
+
+    full = "".join(parts)
+
+    # --- packing ---
+    chunks: List[Chunk] = []
+    current: List[_Unit] = []
+    current_tokens = 0
+    fresh = 0  # nb d'unités non-overlap dans current
+
+    def emit():
+        first, last = current[0], current[-1]
+        chunks.append(Chunk(
+            text=full[first.start:last.end],
+            index=len(chunks),
+            char_start=first.start,
+            char_end=last.end,
+            token_count=current_tokens,
+            page=first.page,
+            section=current[-fresh].section if fresh else first.section,
+        ))
+
+    for unit in units:
+        if current:
+            new_section = unit.section_id != current[-1].section_id
+            only_headings = all(u.is_heading for u in current)
+            over_budget = current_tokens + unit.tokens > max_tokens
+            if (new_section and not only_headings) or over_budget:
+                if fresh:
+                    emit()
+                tail: List[_Unit] = []
+                if not new_section and overlap_tokens and len(current) > 1:
+                    tail_tokens = 0
+                    for u in reversed(current[1:]):
+                        if tail_tokens + u.tokens > overlap_tokens:
+                            break
+                        tail.insert(0, u)
+                        tail_tokens += u.tokens
+                while tail and sum(u.tokens for u in tail) + unit.tokens > max_tokens:
+                    tail.pop(0)
+                current = tail
+                current_tokens = sum(u.tokens for u in tail)
+                fresh = 0
+        current.append(unit)
+        current_tokens += unit.tokens
+        fresh += 1
+
+    if current and fresh:
+        emit()
+
+    return full, chunks
+
+
+# ==============================================================================
+# 5) LANGUE (métadonnée de filtre, heuristique sans dépendance)
+# ==============================================================================
+
+_STOPWORDS = {
+    "fr": {"le", "la", "les", "des", "est", "et", "une", "du", "pour", "dans", "que", "qui", "sur", "avec", "pas"},
+    "en": {"the", "and", "is", "of", "to", "in", "for", "with", "that", "on", "are", "as", "this", "by", "be"},
+    "nl": {"de", "het", "een", "en", "van", "is", "voor", "met", "op", "dat", "niet", "zijn", "te", "bij", "ook"},
+    "de": {"der", "die", "das", "und", "ist", "nicht", "mit", "von", "für", "auf", "ein", "eine", "den", "zu", "sich"},
+}
+_LANG_WORD_RE = re.compile(r"[^\W\d_]+", re.UNICODE)
+
+
+def detect_language(text: str, sample_chars: int = 5000, min_hits: int = 5) -> Optional[str]:
+    """
+    Langue dominante d'un texte (fr/en/nl/de) d'après la fréquence des mots outils.
+    None si le texte est trop court / ambigu (la métadonnée est alors omise).
+    """
+    words = [w.lower() for w in _LANG_WORD_RE.findall(text[:sample_chars])]
+    if not words:
+        return None
+    scores = {lang: sum(1 for w in words if w in stop) for lang, stop in _STOPWORDS.items()}
+    best = max(scores, key=scores.get)
+    ranked = sorted(scores.values(), reverse=True)
+    if ranked[0] < min_hits or ranked[0] < 1.5 * ranked[1]:
+        return None
+    return best
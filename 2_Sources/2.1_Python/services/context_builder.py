@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# PATH: services/context_builder.py
+# Auteur: Bruno DELNOZ
+# Version: v1.1.1 – Date: 2026-02-09
+# Target usage: Assemblage du contexte des prompts de génération sous budget de tokens
+#
+# Fix v1.1.1:
+# - Journal configurable (NOXOZ_CONTEXT_LOG), lu à la création du handler (tests hors 4_Logs)
+#
+# v1.1.0:
+# - Classement selon le mode de recherche: rrf_score (hybride), distance (vecteur), bm25 (lexical)
+#
+# v1.0.0:
+# - Fenêtre par modèle lue dans 1_Documentation/1.2_Technical/OLLAMA_all_models_with_token_limits.md
+# - num_ctx fixe (NOXOZ_CONTEXT_NUM_CTX, plafonné à la limite du modèle) => pas de rechargement Ollama
+# - Chunks classés par score, ajoutés entiers tant que le budget le permet (jamais coupés)
+# - Chunks écartés (budget / doublon / vide) journalisés dans 4_Logs/context_builder.log
+
+from __future__ import annotations
+
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from services.chunking import count_tokens as _embedding_token_count
+
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
+MODEL_LIMITS_DOC = Path(os.getenv(
+    "NOXOZ_MODEL_LIMITS_DOC",
+    str(PROJECT_ROOT / "1_Documentation" / "1.2_Technical" / "OLLAMA_all_models_with_token_limits.md"),
+))
+DEFAULT_LOG_FILE = PROJECT_ROOT / "4_Logs" / "context_builder.log"
+
+# Fenêtre envoyée à Ollama (num_ctx) si la requête n'en fixe pas: constante => pas de reload du modèle
+CONTEXT_NUM_CTX = int(os.getenv("NOXOZ_CONTEXT_NUM_CTX", "4096"))
+# Fenêtre supposée pour un modèle absent de la doc
+CONTEXT_DEFAULT_WINDOW = int(os.getenv("NOXOZ_CONTEXT_DEFAULT_WINDOW", "4096"))
+# Tokens gardés libres pour la réponse
+CONTEXT_RESERVE_TOKENS = int(os.getenv("NOXOZ_CONTEXT_RESERVE_TOKENS", "1024"))
+# Nombre de chunks candidats demandés à search_similar avant sélection
+CONTEXT_CANDIDATES = int(os.getenv("NOXOZ_CONTEXT_CANDIDATES", "8"))
+# Tokenizer HF du modèle de génération (local); vide => tokenizer de chunking / approximation
+GEN_TOKENIZER_NAME = os.getenv("NOXOZ_GEN_TOKENIZER", "")
+
+# "Contexte:\n" + "Prompt:\n" de build_prompt()
+PROMPT_OVERHEAD_TOKENS = 16
+
+_LIMIT_ROW_RE = re.compile(r"^\|\s*\*\*([^*|]+?)\*\*\s*\|[^|]*\|[^|]*\|\s*([\d][\d,.\s]*)\|")
+
+_log = logging.getLogger("noxoz.context_builder")
+
+
+def log_file() -> Path:
+    return Path(os.getenv("NOXOZ_CONTEXT_LOG", str(DEFAULT_LOG_FILE)))
+
+
+def _logger() -> logging.Logger:
+    if not _log.handlers:
+        path = log_file()
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            handler: logging.Handler = logging.FileHandler(path, encoding="utf-8")
+        except OSError:
+            handler = logging.NullHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+        _log.addHandler(handler)
+        _log.setLevel(logging.INFO)
+        _log.propagate = False
+    return _log
+
+
+# ==============================================================================
+# 1) LIMITES PAR MODÈLE
+# ==============================================================================
+
+_LIMITS: Optional[Dict[str, int]] = None
+_LIMITS_LOCK = threading.Lock()
+
+
+def parse_model_limits(markdown: str) -> Dict[str, int]:
+    """
+    Lignes de tableau "| **mistral:7b** | 4.1 | `ollama pull ...` | 8,192 | ... |" => {"mistral:7b": 8192}.
+    """
+    limits: Dict[str, int] = {}
+    for line in markdown.splitlines():
+        m = _LIMIT_ROW_RE.match(line.strip())
+        if m:
+            digits = re.sub(r"\D", "", m.group(2))
+            if digits:
+                limits[m.group(1).strip()] = int(digits)
+    return limits
+
+
+def model_limits() -> Dict[str, int]:
+    global _LIMITS
+    if _LIMITS is None:
+        with _LIMITS_LOCK:
+            if _LIMITS is None:
+                try:
+                    _LIMITS = parse_model_limits(MODEL_LIMITS_DOC.read_text(encoding="utf-8"))
+                except OSError:
+                    _LIMITS = {}
+    return _LIMITS
+
+
+def model_max_tokens(model: str) -> int:
+    limits = model_limits()
+    name = (model or "").strip()
+    if name in limits:
+        return limits[name]
+    if name.endswith(":latest") and name[: -len(":latest")] in limits:
+        return limits[name[: -len(":latest")]]
+    return CONTEXT_DEFAULT_WINDOW
+
+
+def context_window(model: str, options: Optional[Dict] = None) -> int:
+    """
+    num_ctx effectif: celui de la requête, sinon NOXOZ_CONTEXT_NUM_CTX; plafonné à la limite du modèle.
+    """
+    requested = (options or {}).get("num_ctx") or CONTEXT_NUM_CTX
+    return max(1, min(int(requested), model_max_tokens(model)))
+
+
+# ==============================================================================
+# 2) TOKENS
+# ==============================================================================
+
+_GEN_TOKENIZER = None
+_GEN_TOKENIZER_LOADED = False
+_GEN_TOKENIZER_LOCK = threading.Lock()
+
+
+def _get_gen_tokenizer():
+    global _GEN_TOKENIZER, _GEN_TOKENIZER_LOADED
+    if _GEN_TOKENIZER_LOADED:
+        return _GEN_TOKENIZER
+    with _GEN_TOKENIZER_LOCK:
+        if not _GEN_TOKENIZER_LOADED:
+            if GEN_TOKENIZER_NAME:
+                try:
+                    from transformers import AutoTokenizer
+                    _GEN_TOKENIZER = AutoTokenizer.from_pretrained(GEN_TOKENIZER_NAME, local_files_only=True)
+                except Exception:
+                    _GEN_TOKENIZER = None
+            _GEN_TOKENIZER_LOADED = True
+    return _GEN_TOKENIZER
+
+
+def count_tokens(text: str) -> int:
+    tokenizer = _get_gen_tokenizer()
+    if tokenizer is None:
+        return _embedding_token_count(text)
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+
+# ==============================================================================
+# 3) SÉLECTION
+# ==============================================================================
+
+@dataclass
+class ContextPlan:
+    docs: List[Dict]
+    model: str
+    window: int
+    budget: int
+    used_tokens: int
+    question_tokens: int
+    dropped: List[Dict] = field(default_factory=list)
+
+    def to_dict(self) -> Dict:
+        return {
+            "model": self.model,
+            "num_ctx": self.window,
+            "budget_tokens": self.budget,
+            "used_tokens": self.used_tokens,
+            "question_tokens": self.question_tokens,
+            "kept": [d.get("id") for d in self.docs],
+            "dropped": self.dropped,
+        }
+
+
+def _rank_key(doc: Dict):
+    # hybride: rrf_score (plus grand = mieux); vecteur: distance Chroma (plus petit = plus proche);
+    # lexical: bm25 (négatif, plus petit = mieux); sinon en fin de liste
+    if doc.get("rrf_score") is not None:
+        return (0, -doc["rrf_score"])
+    if doc.get("distance") is not None:
+        return (1, doc["distance"])
+    if doc.get("bm25") is not None:
+        return (2, doc["bm25"])
+    return (3, 0.0)
+
+
+def build_context(
+    question: str,
+    candidates: Sequence[Dict],
+    model: str,
+    options: Optional[Dict] = None,
+    reserve_tokens: int = CONTEXT_RESERVE_TOKENS,
+) -> ContextPlan:
+    """
+    Sélectionne les chunks du contexte:
+    - budget = num_ctx - réserve réponse - question - gabarit
+    - chunks classés par score, ajoutés entiers s'ils tiennent (sinon écartés, on tente les suivants)
+    - doublons de texte (overlap, même doc ingéré deux fois) écartés
+    """
+    window = context_window(model, options)
+    question_tokens = count_tokens(question)
+    budget = max(0, window - reserve_tokens - question_tokens - PROMPT_OVERHEAD_TOKENS)
+
+    kept: List[Dict] = []
+    dropped: List[Dict] = []
+    seen = set()
+    used = 0
+    for doc in sorted(candidates, key=_rank_key):
+        text = (doc.get("text") or "").strip()
+        if not text:
+            dropped.append({"id": doc.get("id"), "reason": "empty", "tokens": 0})
+            continue
+        if text in seen:
+            dropped.append({"id": doc.get("id"), "reason": "duplicate", "tokens": 0})
+            continue
+        tokens = count_tokens(text) + 1  # + séparateur
+        if used + tokens > budget:
+            dropped.append({"id": doc.get("id"), "reason": "budget", "tokens": tokens})
+            continue
+        seen.add(text)
+        kept.append(doc)
+        used += tokens
+
+    plan = ContextPlan(
+        docs=kept, model=model, window=window, budget=budget,
+        used_tokens=used, question_tokens=question_tokens, dropped=dropped,
+    )
+    if dropped:
+        _logger().info(
+            "model=%s num_ctx=%d budget=%d used=%d kept=%d dropped=%s",
+            model, window, budget, used, len(kept),
+            ", ".join(f"{d['id']}({d['reason']},{d['tokens']})" for d in dropped),
+        )
+    return plan
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# PATH: services/embedding_cache.py
+# Auteur: Bruno DELNOZ
+# Version: v1.0.0 – Date: 2026-02-09
+# Target usage: Cache disque des embeddings, adressé par contenu (model id + sha256 du texte)
+#
+# v1.0.0:
+# - Clé = (model_id, sha256(texte normalisé)) => re-ingestion / doublons = zéro forward pass
+# - Stockage SQLite dédié (float32 en BLOB), éviction LRU bornée (entrées + Mo)
+# - Compteurs hits / misses / évictions pour /monitor
+
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
+CACHE_DIR = PROJECT_ROOT / "3_Data" / "Cache"
+
+EMBED_CACHE_ENABLED = os.getenv("NOXOZ_EMBED_CACHE", "1") == "1"
+EMBED_CACHE_DB = Path(os.getenv("NOXOZ_EMBED_CACHE_DB", str(CACHE_DIR / "embeddings.db")))
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("NOXOZ_EMBED_CACHE_MAX_ENTRIES", "200000"))
+EMBED_CACHE_MAX_MB = float(os.getenv("NOXOZ_EMBED_CACHE_MAX_MB", "512"))
+
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalisation pour la clé: NFC + espaces compactés + trim.
+    (Deux extractions du même CV qui ne diffèrent que par des espaces => même clé.)
+    """
+    return _WS_RE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def _pack(vector: Sequence[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _unpack(blob: bytes) -> List[float]:
+    vec = array("f")
+    vec.frombytes(blob)
+    return vec.tolist()
+
+
+class EmbeddingCache:
+    """
+    Cache persistant des embeddings de chunks.
+    - get_many(): lookup groupé, met à jour last_used_at des hits
+    - put_many(): insert groupé puis éviction LRU si au-delà des bornes
+    - embed_documents(): lookup -> embed uniquement les misses -> put
+    """
+
+    def __init__(
+        self,
+        model_id: str,
+        db_path: Path = EMBED_CACHE_DB,
+        max_entries: int = EMBED_CACHE_MAX_ENTRIES,
+        max_bytes: int = int(EMBED_CACHE_MAX_MB * 1024 * 1024),
+    ):
+        self.model_id = model_id
+        self.db_path = Path(db_path)
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max(1, max_bytes)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._entries = 0
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # --------------------------------------------------------------------------
+    # Connexion (lazy) + schéma
+    # --------------------------------------------------------------------------
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS embedding_cache (
+                    model_id TEXT NOT NULL,
+                    text_sha256 TEXT NOT NULL,
+                    dim INTEGER NOT NULL,
+                    vector BLOB NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL,
+                    PRIMARY KEY (model_id, text_sha256)
+                ) WITHOUT ROWID
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_embedding_cache_lru ON embedding_cache(last_used_at)"
+            )
+            conn.commit()
+            row = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embedding_cache"
+            ).fetchone()
+            self._entries, self._bytes = int(row[0]), int(row[1])
+            self._conn = conn
+        return self._conn
+
+    # --------------------------------------------------------------------------
+    # API
+    # --------------------------------------------------------------------------
+    def get_many(self, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        keys = [text_key(t) for t in texts]
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            conn = self._connect()
+            unique = list(dict.fromkeys(keys))
+            # SQLite: max 999 variables par requête sur les vieilles versions
+            for i in range(0, len(unique), 500):
+                part = unique[i:i + 500]
+                marks = ",".join("?" * len(part))
+                rows = conn.execute(
+                    f"SELECT text_sha256, vector FROM embedding_cache "
+                    f"WHERE model_id = ? AND text_sha256 IN ({marks})",
+                    [self.model_id, *part],
+                ).fetchall()
+                for sha, blob in rows:
+                    found[sha] = _unpack(blob)
+            if found:
+                now = time.time()
+                conn.executemany(
+                    "UPDATE embedding_cache SET last_used_at = ? WHERE model_id = ? AND text_sha256 = ?",
+                    [(now, self.model_id, sha) for sha in found],
+                )
+                conn.commit()
+            out = [found.get(k) for k in keys]
+            hits = sum(1 for v in out if v is not None)
+            self.hits += hits
+            self.misses += len(out) - hits
+        return out
+
+    def put_many(self, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        if not texts:
+            return
+        now = time.time()
+        rows = {}
+        for text, vec in zip(texts, vectors):
+            key = text_key(text)
+            rows[key] = (self.model_id, key, len(vec), _pack(vec), now, now)
+        with self._lock:
+            conn = self._connect()
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO embedding_cache "
+                "(model_id, text_sha256, dim, vector, created_at, last_used_at) VALUES (?, ?, ?, ?, ?, ?)",
+                list(rows.values()),
+            )
+            inserted = conn.total_changes - before
+            if inserted:
+                # approximation: tous les vecteurs d'un modèle ont la même taille
+                self._entries += inserted
+                self._bytes += inserted * len(next(iter(rows.values()))[3])
+            conn.commit()
+            self._evict_locked(conn)
+
+    def _evict_locked(self, conn: sqlite3.Connection) -> None:
+        """
+        Éviction LRU jusqu'à 90% des bornes (évite d'évincer à chaque insert).
+        """
+        if self._entries <= self.max_entries and self._bytes <= self.max_bytes:
+            return
+        avg = (self._bytes / self._entries) if self._entries else 1
+        target_entries = min(int(self.max_entries * 0.9), int(self.max_bytes * 0.9 / max(avg, 1)))
+        to_delete = max(0, self._entries - target_entries)
+        if not to_delete:
+            return
+        conn.execute("""
+            DELETE FROM embedding_cache WHERE (model_id, text_sha256) IN (
+                SELECT model_id, text_sha256 FROM embedding_cache ORDER BY last_used_at ASC LIMIT ?
+            )
+        """, (to_delete,))
+        conn.commit()
+        self.evictions += to_delete
+        row = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embedding_cache"
+        ).fetchone()
+        self._entries, self._bytes = int(row[0]), int(row[1])
+
+    def embed_documents(
+        self, texts: Sequence[str], embed_fn: Callable[[List[str]], List[List[float]]]
+    ) -> List[List[float]]:
+        """
+        Embeddings de texts en passant par le cache: seuls les misses vont au modèle.
+        """
+        if not texts:
+            return []
+        cached = self.get_many(texts)
+        missing = [i for i, v in enumerate(cached) if v is None]
+        if missing:
+            fresh = embed_fn([texts[i] for i in missing])
+            for i, vec in zip(missing, fresh):
+                cached[i] = list(vec)
+            self.put_many([texts[i] for i in missing], fresh)
+        return cached  # type: ignore[return-value]
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "enabled": EMBED_CACHE_ENABLED,
+            "db_path": str(self.db_path),
+            "model_id": self.model_id,
+            "entries": self._entries,
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else None,
+            "evictions": self.evictions,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
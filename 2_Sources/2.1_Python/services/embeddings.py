@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# PATH: services/embeddings.py
+# Auteur: Bruno DELNOZ
+# Version: v1.0.1 – Date: 2026-02-09
+# Target usage: Registre process-wide du modèle d'embeddings (chargé une seule fois)
+#
+# Fix v1.0.1:
+# - Warm-up en échec: erreur effacée et nouvelle tentative au prochain get() / start_warm_up()
+#   (au plus une tentative toutes les NOXOZ_EMBEDDING_RETRY_S) => /ready n'est plus bloqué en 503
+#
+# v1.0.0:
+# - Un seul HuggingFaceEmbeddings partagé (thread-safe) au lieu d'un par requête
+# - warm_up() : chargement + encode factice, lancé depuis le lifespan FastAPI
+# - stats() : temps de chargement / warm-up + mémoire (RSS) consommée
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+try:
+    import psutil
+except ImportError:  # pragma: no cover - psutil optionnel
+    psutil = None
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    resource = None
+
+from langchain_community.embeddings import HuggingFaceEmbeddings
+
+EMBEDDING_MODEL_NAME = os.getenv("NOXOZ_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+# Délai minimal entre deux tentatives de warm-up après un échec
+EMBEDDING_RETRY_S = float(os.getenv("NOXOZ_EMBEDDING_RETRY_S", "30"))
+
+
+def _rss_bytes() -> Optional[int]:
+    """
+    Mémoire résidente du process (psutil si dispo, sinon ru_maxrss en fallback).
+    """
+    if psutil is not None:
+        try:
+            return int(psutil.Process().memory_info().rss)
+        except Exception:
+            pass
+    if resource is not None:
+        # Linux: ru_maxrss est en KB
+        return int(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss) * 1024
+    return None
+
+
+class EmbeddingRegistry:
+    """
+    Détient LE modèle d'embeddings du process.
+    - get(): charge à la première demande (double-checked lock), puis réutilise
+    - warm_up(): get() + encode factice => premier vrai appel sans latence de chargement
+    - is_ready(): True uniquement quand le warm-up est terminé
+    - échec du warm-up: relancé par le prochain get() / start_warm_up() (après retry_s)
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME, retry_s: float = EMBEDDING_RETRY_S):
+        self.model_name = model_name
+        self.retry_s = retry_s
+        self._model: Optional[HuggingFaceEmbeddings] = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._warmup_thread: Optional[threading.Thread] = None
+        self.load_seconds: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+        self.memory_bytes: Optional[int] = None
+        self.loaded_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self._failed_at: Optional[float] = None  # dernier warm-up en échec (monotonic)
+
+    def get(self) -> HuggingFaceEmbeddings:
+        model = self._model
+        if model is not None:
+            if self._failed_at is not None:
+                # modèle chargé mais warm-up en échec: on retente en tâche de fond
+                self.start_warm_up()
+            return model
+        if self._failed_at is not None:
+            self.start_warm_up()
+        with self._lock:
+            if self._model is None:
+                rss_before = _rss_bytes()
+                t0 = time.perf_counter()
+                try:
+                    self._model = HuggingFaceEmbeddings(model_name=self.model_name)
+                except Exception as exc:
+                    self.error = str(exc)
+                    raise
+                self.load_seconds = time.perf_counter() - t0
+                rss_after = _rss_bytes()
+                if rss_before is not None and rss_after is not None:
+                    self.memory_bytes = max(0, rss_after - rss_before)
+                self.loaded_at = time.time()
+                self.error = None
+            return self._model
+
+    def warm_up(self) -> None:
+        """
+        Charge le modèle et force un premier forward (tokenizer + poids en cache).
+        """
+        try:
+            model = self.get()
+            t0 = time.perf_counter()
+            model.embed_query("warm-up")
+            self.warmup_seconds = time.perf_counter() - t0
+            self._failed_at = None
+            self._ready.set()
+        except Exception as exc:
+            self.error = str(exc)
+            self._failed_at = time.monotonic()
+        finally:
+            with self._lock:
+                if self._warmup_thread is threading.current_thread():
+                    self._warmup_thread = None
+
+    def start_warm_up(self) -> None:
+        """
+        Lance warm_up() dans un thread daemon (non bloquant pour le démarrage FastAPI).
+        Sans effet si prêt, si un warm-up tourne déjà ou si le dernier échec date de moins de retry_s.
+        """
+        with self._lock:
+            if self._warmup_thread is not None or self._ready.is_set():
+                return
+            if self._failed_at is not None and time.monotonic() - self._failed_at < self.retry_s:
+                return
+            self._failed_at = None
+            self.error = None
+            self._warmup_thread = threading.Thread(
+                target=self.warm_up, name="embeddings-warmup", daemon=True
+            )
+            self._warmup_thread.start()
+
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
+
+    def stats(self) -> Dict:
+        return {
+            "model": self.model_name,
+            "ready": self.is_ready(),
+            "loaded": self._model is not None,
+            "load_seconds": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            "warmup_seconds": round(self.warmup_seconds, 3) if self.warmup_seconds is not None else None,
+            "memory_bytes": self.memory_bytes,
+            "error": self.error,
+        }
+
+
+# Instance unique du process
+EMBEDDINGS = EmbeddingRegistry()
+
+
+def get_embeddings() -> HuggingFaceEmbeddings:
+    """
+    Raccourci: modèle d'embeddings partagé (chargé au besoin).
+    """
+    return EMBEDDINGS.get()
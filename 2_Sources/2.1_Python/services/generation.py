@@ -1,45 +1,437 @@
+#!/usr/bin/env python3
+# PATH: services/generation.py
+# Auteur: Bruno DELNOZ
+# Version: v1.5.1 – Date: 2026-02-09
+# Target usage: Génération de documents (contexte Chroma + Ollama) -> DOCX
+#
+# v1.5.1:
+# - Fix write_docx(): nom unique (horodatage + suffixe aléatoire, création exclusive); deux
+#   générations du même template dans la même seconde écrasaient le même DOCX (cache => mauvais fichier)
+#
+# v1.5.0:
+# - Contexte assemblé sous budget de tokens (services/context_builder.py): NOXOZ_CONTEXT_CANDIDATES
+#   chunks candidats, classés par score, gardés entiers; num_ctx envoyé à Ollama
+# - Plan de contexte (gardés / écartés / tokens) renvoyé avec le résultat
+#
+# v1.4.0:
+# - Cache de génération persistant (services/generation_cache.py): même prompt / template /
+#   chunks+versions / modèle / options => texte + DOCX renvoyés sans appeler Ollama
+# - use_cache=False pour forcer une nouvelle génération
+#
+# v1.3.0:
+# - GenerationScheduler: N générations simultanées max (= slots Ollama, NOXOZ_GEN_CONCURRENCY),
+#   file d'attente à priorités (interactive avant batch), deadline par requête
+# - Histogrammes attente / durée / profondeur de file (GENERATION_SCHEDULER.stats())
+#
+# v1.2.0:
+# - stream_document(): événements retrieval -> token* -> done (pour l'endpoint SSE)
+#
+# v1.1.0:
+# - Ollama via client HTTP async poolé (services/ollama_client.py) au lieu de "ollama run"
+# - generate_document() async: modèle / options configurables, stats tokens renvoyées
+
+import asyncio
+import heapq
+import itertools
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
 from pathlib import Path
 from datetime import datetime
-import subprocess
-from .vector_store import search_similar
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from .vector_store import METADATA_REPO, search_similar
+from .ollama_client import OLLAMA
+from .generation_cache import GENERATION_CACHE, generation_key
+from .context_builder import CONTEXT_CANDIDATES, ContextPlan, build_context
+from .metrics import Histogram
 from docx import Document
 
 PROJECT_ROOT = Path(__file__).resolve().parents[3]
 OUTPUT_DIR = PROJECT_ROOT / "5_Outputs" / "DOCX"
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
-def generate_document(prompt: str, template: str = "default"):
+# ==============================================================================
+# 1. Ordonnanceur des générations
+# ==============================================================================
+# Aligné sur OLLAMA_NUM_PARALLEL: au-delà, Ollama sérialise de toute façon et
+# toutes les requêtes finissent ensemble... au timeout.
+GEN_CONCURRENCY = max(1, int(os.getenv("NOXOZ_GEN_CONCURRENCY", "1")))
+GEN_QUEUE_MAX = int(os.getenv("NOXOZ_GEN_QUEUE_MAX", "32"))
+GEN_DEADLINES_S = {
+    "interactive": float(os.getenv("NOXOZ_GEN_DEADLINE_INTERACTIVE_S", "120")),
+    "batch": float(os.getenv("NOXOZ_GEN_DEADLINE_BATCH_S", "900")),
+}
+# Rang de priorité (plus petit = servi en premier)
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+_WAIT_BUCKETS_MS = (10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 120000)
+_DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64)
+
+
+class SchedulerBusyError(RuntimeError):
+    """File d'attente des générations pleine: la requête est refusée tout de suite."""
+
+
+class DeadlineExceededError(TimeoutError):
+    """Deadline de la requête dépassée (en file ou pendant la génération)."""
+
+
+class GenerationTicket:
+    """Une requête admise: priorité, deadline absolue (monotonic), attente mesurée."""
+
+    def __init__(self, priority: str, deadline_s: float):
+        self.priority = priority
+        self.deadline_s = deadline_s
+        self.enqueued_at = time.monotonic()
+        self.deadline = self.enqueued_at + deadline_s
+        self.wait_ms: Optional[float] = None
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def check(self) -> None:
+        if self.remaining() <= 0:
+            raise DeadlineExceededError(f"Deadline de {self.deadline_s:g}s dépassée")
+
+
+class GenerationScheduler:
     """
-    Récupère des documents similaires depuis Chroma et génère un document avec Ollama
+    Limite le nombre de générations Ollama simultanées (asyncio, boucle de l'app).
+
+    - slot(priority, deadline_s): context manager async, attend un slot libre
+    - file à priorités: interactive passe avant batch, FIFO dans une même classe
+    - file pleine => SchedulerBusyError (pas d'attente inutile)
+    - deadline atteinte en file ou pendant la génération => DeadlineExceededError
     """
-    # Recherche des documents similaires
-    docs = search_similar(prompt, k=3)
+
+    def __init__(
+        self,
+        concurrency: int = GEN_CONCURRENCY,
+        queue_max: int = GEN_QUEUE_MAX,
+        deadlines_s: Optional[Dict[str, float]] = None,
+    ):
+        self.concurrency = max(1, concurrency)
+        self.queue_max = max(0, queue_max)
+        self.deadlines_s = dict(deadlines_s or GEN_DEADLINES_S)
+        self._running = 0
+        self._queued = {p: 0 for p in PRIORITIES}
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self.wait_ms = {p: Histogram(_WAIT_BUCKETS_MS) for p in PRIORITIES}
+        self.run_ms = {p: Histogram(_WAIT_BUCKETS_MS) for p in PRIORITIES}
+        self.queue_depth = Histogram(_DEPTH_BUCKETS)
+        self.counters = {"admitted": 0, "rejected": 0, "expired": 0, "cancelled": 0, "completed": 0, "failed": 0}
+
+    def queued(self) -> int:
+        return sum(self._queued.values())
+
+    def _release(self) -> None:
+        # Le slot est transmis directement au prochain en file (pas de resquille)
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self._running -= 1
+
+    async def _acquire(self, ticket: GenerationTicket) -> None:
+        self.queue_depth.observe(self.queued())
+        if self._running < self.concurrency and not self.queued():
+            self._running += 1
+            return
+        if self.queued() >= self.queue_max:
+            self.counters["rejected"] += 1
+            raise SchedulerBusyError(
+                f"File de génération pleine ({self.queued()} en attente, {self._running} en cours)"
+            )
+
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (PRIORITIES[ticket.priority], next(self._seq), fut))
+        self._queued[ticket.priority] += 1
+        try:
+            await asyncio.wait_for(fut, timeout=max(0.0, ticket.remaining()))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            # slot transmis pile au moment de l'expiration/annulation: on le rend
+            if fut.done() and not fut.cancelled():
+                self._release()
+            if isinstance(exc, asyncio.CancelledError):
+                self.counters["cancelled"] += 1
+                raise
+            self.counters["expired"] += 1
+            raise DeadlineExceededError(
+                f"Deadline de {ticket.deadline_s:g}s dépassée en file d'attente ({ticket.priority})"
+            ) from None
+        finally:
+            self._queued[ticket.priority] -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: str = "interactive", deadline_s: Optional[float] = None):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Priorité inconnue: {priority} (attendu: {', '.join(PRIORITIES)})")
+        ticket = GenerationTicket(priority, deadline_s or self.deadlines_s[priority])
+        await self._acquire(ticket)
+        ticket.wait_ms = round((time.monotonic() - ticket.enqueued_at) * 1000.0, 2)
+        self.wait_ms[priority].observe(ticket.wait_ms)
+        self.counters["admitted"] += 1
+        t0 = time.perf_counter()
+        try:
+            yield ticket
+            self.counters["completed"] += 1
+        except (DeadlineExceededError, asyncio.TimeoutError):
+            self.counters["expired"] += 1
+            raise
+        except (asyncio.CancelledError, GeneratorExit):
+            # client parti (tâche annulée / flux SSE fermé)
+            self.counters["cancelled"] += 1
+            raise
+        except BaseException:
+            self.counters["failed"] += 1
+            raise
+        finally:
+            self.run_ms[priority].observe((time.perf_counter() - t0) * 1000.0)
+            self._release()
+
+    def stats(self) -> Dict:
+        return {
+            "concurrency": self.concurrency,
+            "queue_max": self.queue_max,
+            "deadlines_s": self.deadlines_s,
+            "running": self._running,
+            "queued": dict(self._queued),
+            **self.counters,
+            "queue_depth": self.queue_depth.snapshot(),
+            "wait_ms": {p: h.snapshot() for p, h in self.wait_ms.items()},
+            "run_ms": {p: h.snapshot() for p, h in self.run_ms.items()},
+        }
+
+
+GENERATION_SCHEDULER = GenerationScheduler()
+
+
+@asynccontextmanager
+async def _deadline(ticket: GenerationTicket):
+    """Borne le bloc par la deadline du ticket (même tâche: pas de yield à l'intérieur)."""
+    timeout = asyncio.timeout(max(0.0, ticket.remaining()))
+    try:
+        async with timeout:
+            yield
+    except TimeoutError:
+        if timeout.expired():
+            raise DeadlineExceededError(
+                f"Deadline de {ticket.deadline_s:g}s dépassée pendant la génération"
+            ) from None
+        raise
+
+
+# ==============================================================================
+# 2. Génération
+# ==============================================================================
+
+def build_prompt(prompt: str, docs: list) -> str:
     context = "\n\n".join([d["text"] for d in docs])
+    return f"Contexte:\n{context}\n\nPrompt:\n{prompt}"
 
-    # Construire le prompt complet pour Ollama
-    full_prompt = f"Contexte:\n{context}\n\nPrompt:\n{prompt}"
 
-    # Nom du fichier de sortie
+def write_docx(generated_text: str, template: str) -> Path:
     timestamp = datetime.utcnow().strftime("%Y%m%d%H%M%S")
-    output_file = OUTPUT_DIR / f"Document_{template}_{timestamp}.docx"
-
-    # Appel de Ollama (exemple avec Mistral-7B)
-    result = subprocess.run(
-        ["ollama", "run", "mistral:7b", "--", full_prompt],
-        capture_output=True,
-        text=True,
-        timeout=120
-    )
-    if result.returncode != 0:
-        error_detail = result.stderr.strip() or "Erreur inconnue Ollama"
-        raise RuntimeError(f"Ollama a échoué: {error_detail}")
-    generated_text = result.stdout.strip()
+    output_file = OUTPUT_DIR / f"Document_{template}_{timestamp}_{uuid.uuid4().hex[:8]}.docx"
+    doc = Document()
+    doc.add_paragraph(generated_text)
+    # "x": jamais d'écrasement d'un DOCX déjà référencé par le cache
+    with open(output_file, "xb") as f:
+        doc.save(f)
+    return output_file
+
+
+def _retrieve_context(prompt: str, model: str, options: Optional[Dict]) -> Tuple[ContextPlan, Dict]:
+    """
+    Recherche (embeddings + Chroma) puis sélection sous budget (tokenisation): sync => thread.
+    Renvoie le plan et les options Ollama effectives (num_ctx fixé).
+    """
+    candidates = search_similar(prompt, CONTEXT_CANDIDATES)
+    plan = build_context(prompt, candidates, model, options)
+    return plan, {**(options or {}), "num_ctx": plan.window}
+
+
+def _cache_lookup(
+    prompt: str, template: str, docs: list, model: str, options: Optional[Dict]
+) -> Tuple[str, Optional[Dict]]:
+    """
+    Clé de cache (chunk ids + version du fichier source) et entrée éventuelle.
+    DOCX supprimé entre-temps => réécrit depuis le texte en cache (pas d'appel Ollama).
+    """
+    versions = METADATA_REPO.file_versions(d.get("file_id") for d in docs)
+    chunks = [(d.get("id"), versions.get(d.get("file_id"))) for d in docs]
+    key = generation_key(prompt, template, chunks, model, options)
+    hit = GENERATION_CACHE.get(key)
+    if hit is not None and not (hit["file_path"] and Path(hit["file_path"]).exists()):
+        hit["file_path"] = str(write_docx(hit["text"], template))
+        GENERATION_CACHE.update_file_path(key, hit["file_path"])
+    return key, hit
+
+
+async def generate_document(
+    prompt: str,
+    template: str = "default",
+    model: Optional[str] = None,
+    options: Optional[Dict] = None,
+    priority: str = "interactive",
+    deadline_s: Optional[float] = None,
+    use_cache: bool = True,
+) -> Dict:
+    """
+    Récupère des documents similaires depuis Chroma et génère un document avec Ollama.
+    L'appel Ollama passe par GENERATION_SCHEDULER (slot + deadline).
+    Résultat identique déjà en cache (use_cache=True) => renvoyé tout de suite.
+    """
+    model = model or OLLAMA.model
+
+    # Recherche des documents similaires + sélection sous budget de tokens
+    plan, options = await asyncio.to_thread(_retrieve_context, prompt, model, options)
+    docs = plan.docs
+
+    cache_key = None
+    if use_cache and GENERATION_CACHE.enabled:
+        cache_key, hit = await asyncio.to_thread(_cache_lookup, prompt, template, docs, model, options)
+        if hit is not None:
+            return {
+                "message": f"Document {Path(hit['file_path']).name} (cache) pour le prompt: {prompt}",
+                "file_path": hit["file_path"],
+                "model": model,
+                "stats": hit["stats"],
+                "first_token_ms": None,
+                "queue_wait_ms": None,
+                "cached": True,
+                "sources": [d.get("id") for d in docs],
+                "context": plan.to_dict(),
+            }
+
+    # Construire le prompt complet pour Ollama
+    full_prompt = build_prompt(prompt, docs)
+
+    # Appel Ollama (HTTP, streaming agrégé), borné par la deadline
+    async with GENERATION_SCHEDULER.slot(priority, deadline_s) as ticket:
+        async with _deadline(ticket):
+            result = await OLLAMA.generate(full_prompt, model=model, options=options)
+    generated_text = result["text"].strip()
     if not generated_text:
         raise RuntimeError("Ollama n'a renvoyé aucun contenu.")
 
     # Écriture dans un DOCX
-    doc = Document()
-    doc.add_paragraph(generated_text)
-    doc.save(output_file)
+    output_file = await asyncio.to_thread(write_docx, generated_text, template)
+    if cache_key is not None:
+        await asyncio.to_thread(
+            GENERATION_CACHE.put, cache_key, generated_text, str(output_file), model, template, result.get("stats")
+        )
+
+    return {
+        "message": f"Document {output_file.name} généré avec le prompt: {prompt}",
+        "file_path": str(output_file),
+        "model": model,
+        "stats": result.get("stats"),
+        "first_token_ms": result.get("first_token_ms"),
+        "queue_wait_ms": ticket.wait_ms,
+        "cached": False,
+        "sources": [d.get("id") for d in docs],
+        "context": plan.to_dict(),
+    }
+
+
+def _source_summary(doc: Dict) -> Dict:
+    return {k: doc.get(k) for k in ("id", "source", "file_id", "chunk_index", "page", "section", "distance")}
+
+
+async def stream_document(
+    prompt: str,
+    template: str = "default",
+    model: Optional[str] = None,
+    options: Optional[Dict] = None,
+    priority: str = "interactive",
+    deadline_s: Optional[float] = None,
+    use_cache: bool = True,
+) -> AsyncIterator[Dict]:
+    """
+    Variante streaming de generate_document(). Événements (dicts avec "event"):
+    - retrieval: chunks retenus (avant le premier token)
+    - scheduled: slot de génération obtenu (attente en file)
+    - token: fragment de texte dès qu'Ollama le produit
+    - done: chemin DOCX + stats Ollama
+    Cache hit: un seul événement token (texte complet) puis done (cached=true).
+    Annuler l'itération (client déconnecté) annule la requête Ollama.
+    """
+    t0 = time.perf_counter()
+    model = model or OLLAMA.model
+    plan, options = await asyncio.to_thread(_retrieve_context, prompt, model, options)
+    docs = plan.docs
+    yield {
+        "event": "retrieval",
+        "elapsed_ms": round((time.perf_counter() - t0) * 1000.0, 2),
+        "sources": [_source_summary(d) for d in docs],
+        "context": plan.to_dict(),
+    }
+
+    cache_key = None
+    if use_cache and GENERATION_CACHE.enabled:
+        cache_key, hit = await asyncio.to_thread(_cache_lookup, prompt, template, docs, model, options)
+        if hit is not None:
+            yield {"event": "token", "text": hit["text"]}
+            yield {
+                "event": "done",
+                "file_path": hit["file_path"],
+                "message": f"Document {Path(hit['file_path']).name} (cache) pour le prompt: {prompt}",
+                "model": model,
+                "stats": hit["stats"],
+                "first_token_ms": None,
+                "queue_wait_ms": None,
+                "cached": True,
+                "elapsed_ms": round((time.perf_counter() - t0) * 1000.0, 2),
+            }
+            return
+
+    parts = []
+    stats = None
+    first_token_ms = None
+    async with GENERATION_SCHEDULER.slot(priority, deadline_s) as ticket:
+        yield {"event": "scheduled", "priority": priority, "queue_wait_ms": ticket.wait_ms}
+        tokens = OLLAMA.stream_generate(build_prompt(prompt, docs), model=model, options=options)
+        try:
+            while True:
+                try:
+                    async with _deadline(ticket):
+                        data = await tokens.__anext__()
+                except StopAsyncIteration:
+                    break
+                token = data.get("response") or ""
+                if token:
+                    if first_token_ms is None:
+                        first_token_ms = round((time.perf_counter() - t0) * 1000.0, 2)
+                    parts.append(token)
+                    yield {"event": "token", "text": token}
+                if data.get("done"):
+                    stats = data.get("stats")
+        finally:
+            # fermeture explicite: ferme la connexion HTTP tout de suite (pas au GC)
+            await tokens.aclose()
+
+    generated_text = "".join(parts).strip()
+    if not generated_text:
+        raise RuntimeError("Ollama n'a renvoyé aucun contenu.")
+    output_file = await asyncio.to_thread(write_docx, generated_text, template)
+    if cache_key is not None:
+        await asyncio.to_thread(
+            GENERATION_CACHE.put, cache_key, generated_text, str(output_file), model, template, stats
+        )
 
-    return f"Document {output_file.name} généré avec le prompt: {prompt}"
+    yield {
+        "event": "done",
+        "file_path": str(output_file),
+        "message": f"Document {output_file.name} généré avec le prompt: {prompt}",
+        "model": model,
+        "stats": stats,
+        "first_token_ms": first_token_ms,
+        "queue_wait_ms": ticket.wait_ms,
+        "cached": False,
+        "elapsed_ms": round((time.perf_counter() - t0) * 1000.0, 2),
+    }
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# PATH: services/generation_cache.py
+# Auteur: Bruno DELNOZ
+# Version: v1.0.0 – Date: 2026-02-09
+# Target usage: Cache disque des générations (exact match prompt + contexte + modèle)
+#
+# v1.0.0:
+# - Clé = sha256(prompt normalisé, template, chunk ids + versions fichiers, modèle, options)
+# - Stockage SQLite dédié (texte généré + chemin DOCX + stats Ollama)
+# - Éviction par âge (TTL) puis LRU bornée (entrées + Mo), opt-out NOXOZ_GEN_CACHE=0
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from services.embedding_cache import CACHE_DIR, normalize_text
+
+GEN_CACHE_ENABLED = os.getenv("NOXOZ_GEN_CACHE", "1") == "1"
+GEN_CACHE_DB = Path(os.getenv("NOXOZ_GEN_CACHE_DB", str(CACHE_DIR / "generations.db")))
+GEN_CACHE_MAX_ENTRIES = int(os.getenv("NOXOZ_GEN_CACHE_MAX_ENTRIES", "2000"))
+GEN_CACHE_MAX_MB = float(os.getenv("NOXOZ_GEN_CACHE_MAX_MB", "64"))
+GEN_CACHE_TTL_S = float(os.getenv("NOXOZ_GEN_CACHE_TTL_S", str(7 * 24 * 3600)))
+
+
+def generation_key(
+    prompt: str,
+    template: str,
+    chunks: Iterable[tuple],
+    model: str,
+    options: Optional[Dict] = None,
+) -> str:
+    """
+    chunks: (chunk_id, version du fichier) dans l'ordre du contexte.
+    Une re-ingestion (version++) ou un autre top-k => autre clé.
+    """
+    payload = {
+        "prompt": normalize_text(prompt),
+        "template": template,
+        "chunks": [list(c) for c in chunks],
+        "model": model,
+        "options": options or {},
+    }
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    """
+    Cache persistant des résultats de génération.
+    - get(): hit => met à jour last_used_at; entrée expirée => supprimée, miss
+    - put(): insert/replace puis éviction (âge, puis LRU si au-delà des bornes)
+    """
+
+    def __init__(
+        self,
+        db_path: Path = GEN_CACHE_DB,
+        max_entries: int = GEN_CACHE_MAX_ENTRIES,
+        max_bytes: int = int(GEN_CACHE_MAX_MB * 1024 * 1024),
+        ttl_s: float = GEN_CACHE_TTL_S,
+        enabled: bool = GEN_CACHE_ENABLED,
+    ):
+        self.db_path = Path(db_path)
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max(1, max_bytes)
+        self.ttl_s = ttl_s
+        self.enabled = enabled
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._entries = 0
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # --------------------------------------------------------------------------
+    # Connexion (lazy) + schéma
+    # --------------------------------------------------------------------------
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS generation_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    model TEXT,
+                    template TEXT,
+                    text TEXT NOT NULL,
+                    file_path TEXT,
+                    stats TEXT,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL
+                ) WITHOUT ROWID
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_generation_cache_lru ON generation_cache(last_used_at)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_generation_cache_age ON generation_cache(created_at)"
+            )
+            conn.commit()
+            self._conn = conn
+            self._refresh_totals_locked(conn)
+        return self._conn
+
+    def _refresh_totals_locked(self, conn: sqlite3.Connection) -> None:
+        row = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(text) + LENGTH(COALESCE(stats, ''))), 0) FROM generation_cache"
+        ).fetchone()
+        self._entries, self._bytes = int(row[0]), int(row[1])
+
+    # --------------------------------------------------------------------------
+    # API
+    # --------------------------------------------------------------------------
+    def get(self, key: str) -> Optional[Dict]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT text, file_path, model, stats, created_at FROM generation_cache WHERE cache_key = ?",
+                (key,),
+            ).fetchone()
+            now = time.time()
+            if row is not None and self.ttl_s > 0 and now - row[4] > self.ttl_s:
+                conn.execute("DELETE FROM generation_cache WHERE cache_key = ?", (key,))
+                conn.commit()
+                self.evictions += 1
+                self._refresh_totals_locked(conn)
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE generation_cache SET last_used_at = ? WHERE cache_key = ?", (now, key))
+            conn.commit()
+            self.hits += 1
+        return {
+            "text": row[0],
+            "file_path": row[1],
+            "model": row[2],
+            "stats": json.loads(row[3]) if row[3] else None,
+            "created_at": row[4],
+        }
+
+    def put(
+        self,
+        key: str,
+        text: str,
+        file_path: Optional[str],
+        model: Optional[str] = None,
+        template: Optional[str] = None,
+        stats: Optional[Dict] = None,
+    ) -> None:
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO generation_cache "
+                "(cache_key, model, template, text, file_path, stats, created_at, last_used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, model, template, text, file_path, json.dumps(stats) if stats else None, now, now),
+            )
+            conn.commit()
+            self._refresh_totals_locked(conn)
+            self._evict_locked(conn)
+
+    def update_file_path(self, key: str, file_path: str) -> None:
+        with self._lock:
+            conn = self._connect()
+            conn.execute("UPDATE generation_cache SET file_path = ? WHERE cache_key = ?", (file_path, key))
+            conn.commit()
+
+    def _evict_locked(self, conn: sqlite3.Connection) -> None:
+        """
+        1) entrées plus vieilles que le TTL
+        2) LRU jusqu'à 90% des bornes (évite d'évincer à chaque insert)
+        """
+        before = self._entries
+        if self.ttl_s > 0:
+            conn.execute("DELETE FROM generation_cache WHERE created_at < ?", (time.time() - self.ttl_s,))
+            self._refresh_totals_locked(conn)
+        if self._entries > self.max_entries or self._bytes > self.max_bytes:
+            avg = (self._bytes / self._entries) if self._entries else 1
+            target = min(int(self.max_entries * 0.9), int(self.max_bytes * 0.9 / max(avg, 1)))
+            conn.execute("""
+                DELETE FROM generation_cache WHERE cache_key IN (
+                    SELECT cache_key FROM generation_cache ORDER BY last_used_at ASC LIMIT ?
+                )
+            """, (max(0, self._entries - target),))
+        conn.commit()
+        self._refresh_totals_locked(conn)
+        self.evictions += max(0, before - self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM generation_cache")
+            conn.commit()
+            self._refresh_totals_locked(conn)
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "db_path": str(self.db_path),
+            "entries": self._entries,
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_s": self.ttl_s,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else None,
+            "evictions": self.evictions,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+GENERATION_CACHE = GenerationCache()
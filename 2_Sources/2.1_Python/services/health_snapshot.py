@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# PATH: services/health_snapshot.py
+# Auteur: Bruno DELNOZ
+# Version: v1.0.0 – Date: 2026-02-09
+# Target usage: Agrégation concurrente + cache des checks de santé (/api/monitor/full)
+#
+# v1.0.0:
+# - Chaque check tourne hors event loop (asyncio.to_thread, ou coroutine), tous en parallèle,
+#   chacun borné par son timeout (NOXOZ_MONITOR_CHECK_TIMEOUT_S) => status "timeout" sans bloquer les autres
+# - Check encore en cours (thread bloqué) => réutilisé au tour suivant, jamais empilé
+# - Snapshot servi depuis le cache pendant NOXOZ_MONITOR_TTL_S (marqueur cached / age_ms),
+#   un seul rafraîchissement à la fois (les appels concurrents attendent le même)
+# - Rafraîchisseur de fond (NOXOZ_MONITOR_REFRESH_S) tant que quelqu'un lit le snapshot
+#   (en veille après NOXOZ_MONITOR_IDLE_S sans lecture)
+
+from __future__ import annotations
+
+import asyncio
+import inspect
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from services.metrics import Histogram
+
+MONITOR_TTL_S = float(os.getenv("NOXOZ_MONITOR_TTL_S", "5"))
+MONITOR_CHECK_TIMEOUT_S = float(os.getenv("NOXOZ_MONITOR_CHECK_TIMEOUT_S", "2"))
+# < TTL: un dashboard qui interroge chaque seconde ne paie jamais un rafraîchissement (0 => désactivé)
+MONITOR_REFRESH_S = float(os.getenv("NOXOZ_MONITOR_REFRESH_S", "2"))
+MONITOR_IDLE_S = float(os.getenv("NOXOZ_MONITOR_IDLE_S", "120"))
+
+_REFRESH_MS_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# check: fonction bloquante (exécutée dans un thread) ou fonction async, retourne un dict {"status": ...}
+Check = Callable[[], Any]
+
+
+class HealthSnapshot:
+    """
+    checks: {nom: check}. get() renvoie {nom: résultat, ..., "snapshot": métadonnées du cache}.
+    """
+
+    def __init__(
+        self,
+        checks: Dict[str, Check],
+        ttl_s: float = MONITOR_TTL_S,
+        timeout_s: float = MONITOR_CHECK_TIMEOUT_S,
+        refresh_s: float = MONITOR_REFRESH_S,
+        idle_s: float = MONITOR_IDLE_S,
+    ):
+        self.checks = dict(checks)
+        self.ttl_s = ttl_s
+        self.timeout_s = timeout_s
+        self.refresh_s = refresh_s
+        self.idle_s = idle_s
+
+        self._results: Optional[Dict[str, Any]] = None
+        self._checks_ms: Dict[str, float] = {}
+        self._taken_at = 0.0
+        self._generated_at: Optional[str] = None
+        self._last_read = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._task: Optional[asyncio.Task] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.timeouts = 0
+        self.last_error: Optional[str] = None
+        self._refresh_ms = Histogram(_REFRESH_MS_BUCKETS)
+
+    # --------------------------------------------------------------------------
+    # Checks
+    # --------------------------------------------------------------------------
+    def _start_check(self, fn: Check) -> asyncio.Future:
+        if inspect.iscoroutinefunction(fn):
+            fut = asyncio.ensure_future(fn())
+        else:
+            fut = asyncio.ensure_future(asyncio.to_thread(fn))
+        # résultat d'un check abandonné (timeout) consommé => pas de warning "never retrieved"
+        fut.add_done_callback(lambda f: f.cancelled() or f.exception())
+        return fut
+
+    async def _run_check(self, name: str, fn: Check) -> Tuple[Any, float]:
+        fut = self._inflight.get(name)
+        if fut is None or fut.done():
+            fut = self._inflight[name] = self._start_check(fn)
+        t0 = time.perf_counter()
+        try:
+            # shield: un thread ne s'annule pas; le check continue et sera repris au tour suivant
+            result = await asyncio.wait_for(asyncio.shield(fut), self.timeout_s)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            result = {"status": "timeout", "error": f"check {name} > {self.timeout_s}s"}
+        except Exception as e:
+            result = {"status": "error", "error": str(e)}
+        return result, round((time.perf_counter() - t0) * 1000.0, 3)
+
+    # --------------------------------------------------------------------------
+    # Snapshot
+    # --------------------------------------------------------------------------
+    def _get_lock(self) -> asyncio.Lock:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def _fresh(self) -> bool:
+        return self._results is not None and time.monotonic() - self._taken_at < self.ttl_s
+
+    async def _refresh_locked(self) -> None:
+        t0 = time.perf_counter()
+        names = list(self.checks)
+        outcomes = await asyncio.gather(*(self._run_check(n, self.checks[n]) for n in names))
+        self._results = {n: result for n, (result, _) in zip(names, outcomes)}
+        self._checks_ms = {n: ms for n, (_, ms) in zip(names, outcomes)}
+        self._taken_at = time.monotonic()
+        self._generated_at = datetime.now(timezone.utc).isoformat()
+        self.refreshes += 1
+        self._refresh_ms.observe((time.perf_counter() - t0) * 1000.0)
+
+    async def refresh(self) -> None:
+        async with self._get_lock():
+            await self._refresh_locked()
+
+    def _payload(self, cached: bool) -> Dict:
+        return {
+            **(self._results or {}),
+            "snapshot": {
+                "cached": cached,
+                "age_ms": round((time.monotonic() - self._taken_at) * 1000.0, 3),
+                "generated_at": self._generated_at,
+                "ttl_s": self.ttl_s,
+                "checks_ms": dict(self._checks_ms),
+            },
+        }
+
+    async def get(self, force: bool = False) -> Dict:
+        self._last_read = time.monotonic()
+        if not force and self._fresh():
+            self.hits += 1
+            return self._payload(cached=True)
+        async with self._get_lock():
+            # un appel concurrent vient peut-être de rafraîchir pendant qu'on attendait
+            if not force and self._fresh():
+                self.hits += 1
+                return self._payload(cached=True)
+            self.misses += 1
+            await self._refresh_locked()
+            return self._payload(cached=False)
+
+    # --------------------------------------------------------------------------
+    # Rafraîchisseur de fond
+    # --------------------------------------------------------------------------
+    async def _refresher(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_s)
+            if self.idle_s and time.monotonic() - self._last_read > self.idle_s:
+                continue  # personne ne lit: pas de checks pour rien
+            try:
+                await self.refresh()
+            except Exception as e:
+                self.last_error = str(e)
+
+    def start(self) -> None:
+        """À appeler depuis l'event loop (lifespan)."""
+        if self.refresh_s <= 0 or (self._task is not None and not self._task.done()):
+            return
+        # premier snapshot au démarrage: la première lecture est déjà servie depuis le cache
+        self._last_read = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._run_initial_then_refresh())
+
+    async def _run_initial_then_refresh(self) -> None:
+        try:
+            await self.refresh()
+        except Exception as e:
+            self.last_error = str(e)
+        await self._refresher()
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._inflight.clear()
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "checks": list(self.checks),
+            "ttl_s": self.ttl_s,
+            "timeout_s": self.timeout_s,
+            "refresh_s": self.refresh_s,
+            "refresher": self._task is not None and not self._task.done(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else None,
+            "refreshes": self.refreshes,
+            "timeouts": self.timeouts,
+            "refresh_ms": self._refresh_ms.snapshot(),
+            "last_error": self.last_error,
+        }
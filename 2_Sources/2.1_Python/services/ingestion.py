@@ -1,9 +1,30 @@
 #!/usr/bin/env python3
 # PATH: services/ingestion.py
 # Auteur: Bruno DELNOZ
-# Version: v2.0.1 – Date: 2026-02-08
+# Version: v2.3.2 – Date: 2026-02-09
 # Target usage: Ingestion fichiers uploadés et fichiers serveur (path relatif)
 #
+# Fix v2.3.2:
+# - recover_pending_uploads(): uploads stockés (by_sha256) jamais ingérés (job annulé à l'arrêt,
+#   crash pendant "ingesting") remis en file au démarrage
+#
+# Fix v2.3.1:
+# - ingest_stored_file(): original_name transmis à ingest_file() (au lieu du nom <sha256>.ext)
+#
+# v2.3.0:
+# - INBOX_WATCHER: dossier de dépôt surveillé (services/watcher.py), fichiers modifiés => job "watch"
+# - ingest_server_file(): file_id optionnel (déjà hashé par le watcher)
+#
+# v2.2.0:
+# - store_upload(): écriture streamée par blocs + sha256/taille calculés au vol
+#   (mémoire constante, plus de relecture du tmp pour hasher)
+# - file_id transmis à ingest_file() => plus de re-hash côté vector_store
+#
+# v2.1.0:
+# - Découpage store_upload() (requête HTTP) / ingest_stored_file() (worker de job)
+#   => l'upload rend la main dès que les octets sont persistés (voir services/jobs.py)
+# - resolve_server_file(): validation du chemin serveur séparée de l'ingestion
+#
 # Fix v2.0.1:
 # - Compatible avec vector_store.ingest_file(file_path, reingest=False, bump_version=False)
 # - Ajout ensure_sqlite_schema() avant ingestion (évite schéma legacy)
@@ -13,11 +34,22 @@ from __future__ import annotations
 
 from datetime import datetime, timezone
 from pathlib import Path
+import hashlib
+import os
 import shutil
 
 from fastapi import UploadFile
 
-from services.vector_store import ingest_file, sha256_file, ensure_sqlite_schema
+from services.jobs import INGEST_JOBS, QueueFullError
+from services.vector_store import (
+    METADATA_REPO,
+    SUPPORTED_EXTENSIONS,
+    ensure_sqlite_schema,
+    ingest_file,
+    sha256_file,
+    upload_original_names,
+)
+from services.watcher import WATCH_DIR, DirectoryWatcher
 
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
 UPLOAD_ROOT = PROJECT_ROOT / "3_Data" / "uploads"
@@ -25,6 +57,8 @@ TMP_DIR = UPLOAD_ROOT / "tmp"
 BY_SHA = UPLOAD_ROOT / "by_sha256"
 BY_NAME = UPLOAD_ROOT / "by_name"
 
+UPLOAD_CHUNK_SIZE = int(os.getenv("NOXOZ_UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
 
 def _ensure_dirs():
     TMP_DIR.mkdir(parents=True, exist_ok=True)
@@ -32,41 +66,51 @@ def _ensure_dirs():
     BY_NAME.mkdir(parents=True, exist_ok=True)
 
 
-async def parse_and_store_file(file: UploadFile) -> dict:
+def _step(message: str, status: str = "ok") -> dict:
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "message": message,
+        "status": status,
+    }
+
+
+async def store_upload(file: UploadFile) -> dict:
     """
+    Partie synchrone de l'upload (dans la requête HTTP):
     - écrit en tmp
     - calcule sha256 (file_id)
     - move vers by_sha256/<2chars>/<sha256>.<ext>
     - copie vers by_name/<stem>/<timestamp>__<sha12>.<ext>
-    - lance ingest_file() (idempotent via file_id côté vector_store)
+    Pas d'extraction / embeddings ici: voir ingest_stored_file().
     """
     _ensure_dirs()
-    ensure_sqlite_schema()
 
     steps = []
     ts = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
     original_name = file.filename or "uploaded_file"
     ext = Path(original_name).suffix.lower()
 
-    steps.append({
-        "timestamp": datetime.now(timezone.utc).isoformat(),
-        "message": "Upload reçu, préparation du répertoire",
-        "status": "ok",
-    })
+    steps.append(_step("Upload reçu, préparation du répertoire"))
 
-    # 1) tmp write (ok pour fichiers raisonnables; si énorme -> streaming)
+    # 1) tmp write streamé + 2) hash / taille dans la même passe
     tmp_path = TMP_DIR / f"{ts}__{original_name}"
-    content = await file.read()
-    tmp_path.write_bytes(content)
-
-    steps.append({
-        "timestamp": datetime.now(timezone.utc).isoformat(),
-        "message": f"Écriture du fichier sur disque: {tmp_path}",
-        "status": "ok",
-    })
+    h = hashlib.sha256()
+    size_bytes = 0
+    try:
+        with open(tmp_path, "wb") as out:
+            while True:
+                block = await file.read(UPLOAD_CHUNK_SIZE)
+                if not block:
+                    break
+                h.update(block)
+                out.write(block)
+                size_bytes += len(block)
+    except Exception:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    file_id = h.hexdigest()
 
-    # 2) hash
-    file_id = sha256_file(str(tmp_path))
+    steps.append(_step(f"Écriture du fichier sur disque: {tmp_path} ({size_bytes} octets)"))
 
     # 3) target paths
     sha_sub = file_id[:2]
@@ -83,19 +127,11 @@ async def parse_and_store_file(file: UploadFile) -> dict:
     if target_sha_path.exists():
         tmp_path.unlink(missing_ok=True)
         stored_path = target_sha_path
-        steps.append({
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "message": f"Dédup disque: contenu déjà présent => {stored_path}",
-            "status": "ok",
-        })
+        steps.append(_step(f"Dédup disque: contenu déjà présent => {stored_path}"))
     else:
         shutil.move(str(tmp_path), str(target_sha_path))
         stored_path = target_sha_path
-        steps.append({
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "message": f"Move vers stockage content-addressed: {stored_path}",
-            "status": "ok",
-        })
+        steps.append(_step(f"Move vers stockage content-addressed: {stored_path}"))
 
     # copie lisible (historique)
     if not target_name_path.exists():
@@ -104,21 +140,36 @@ async def parse_and_store_file(file: UploadFile) -> dict:
         except Exception:
             pass  # pas bloquant
 
-    # 5) ingestion
-    steps.append({
-        "timestamp": datetime.now(timezone.utc).isoformat(),
-        "message": "Début ingestion Chroma + SQLite",
-        "status": "ok",
-    })
+    return {
+        "file_id": file_id,
+        "file_path": str(stored_path),
+        "original_name": original_name,
+        "size_bytes": size_bytes,
+        "steps": steps,
+    }
 
-    # IMPORTANT: compatible avec TON vector_store.py (pas de original_name=)
-    res = ingest_file(str(stored_path), reingest=False, bump_version=False)
 
-    steps.append({
-        "timestamp": datetime.now(timezone.utc).isoformat(),
-        "message": "Ingestion terminée",
-        "status": "ok",
-    })
+def ingest_stored_file(stored: dict, job=None) -> dict:
+    """
+    Partie lourde (extraction, embeddings, Chroma, SQLite) — exécutée dans un
+    worker de services/jobs.py. job (optionnel) reçoit les timings par étape.
+    """
+    ensure_sqlite_schema()
+    original_name = stored["original_name"]
+    steps = list(stored.get("steps") or [])
+    steps.append(_step("Début ingestion Chroma + SQLite"))
+
+    # original_name: le fichier stocké s'appelle by_sha256/<sha>.ext (filtres / latest_only sur le vrai nom)
+    res = ingest_file(
+        stored["file_path"], reingest=False, bump_version=False,
+        file_id=stored["file_id"], original_name=original_name,
+    )
+
+    if job is not None:
+        for name, ms in (res.get("timings_ms") or {}).items():
+            job.add_stage(name, ms)
+
+    steps.append(_step("Ingestion terminée"))
 
     return {
         "status": "success" if res.get("status") == "ok" else res.get("status", "unknown"),
@@ -127,20 +178,60 @@ async def parse_and_store_file(file: UploadFile) -> dict:
             if res.get("status") != "already_ingested"
             else f"Fichier {original_name} déjà ingéré (skip)"
         ),
-        "file_path": str(stored_path),
-        "file_id": res.get("file_id", file_id),
+        "file_path": stored["file_path"],
+        "file_id": res.get("file_id", stored["file_id"]),
         "ingestion": res,
         "steps": steps,
     }
 
 
-async def parse_and_store_local_file(relative_path: str) -> dict:
+async def parse_and_store_file(file: UploadFile) -> dict:
     """
-    Ingestion d'un fichier déjà présent sur le serveur.
-    Sécurisé: interdit absolu + '..'
+    Upload + ingestion dans le même appel (usage hors API / scripts).
+    L'endpoint /api/upload passe par store_upload() + un job d'ingestion.
     """
-    ensure_sqlite_schema()
+    return ingest_stored_file(await store_upload(file))
+
+
+def recover_pending_uploads() -> dict:
+    """
+    Uploads acceptés (202) mais jamais ingérés: jobs annulés par INGEST_JOBS.shutdown(),
+    crash pendant l'ingestion ("ingesting"). Remis en file au démarrage.
+    'failed' exclu (erreur d'extraction: un réupload relance l'ingestion).
+    """
+    if not BY_SHA.is_dir():
+        return {"status": "ok", "stored": 0, "requeued": 0, "deferred": 0}
+    stored = {
+        p.stem: p for p in BY_SHA.glob("*/*")
+        if p.is_file() and p.suffix.lower() in SUPPORTED_EXTENSIONS
+    }
+    statuses = METADATA_REPO.file_statuses(stored)
+    todo = sorted(file_id for file_id in stored if statuses.get(file_id) in (None, "ingesting"))
+    names = upload_original_names(UPLOAD_ROOT) if todo else {}
+
+    requeued = 0
+    for file_id in todo:
+        path = stored[file_id]
+        payload = {
+            "file_id": file_id,
+            "file_path": str(path),
+            "original_name": names.get(file_id[:12]) or path.name,
+            "steps": [_step("Upload repris au démarrage (jamais ingéré)")],
+        }
+        try:
+            INGEST_JOBS.submit("upload", payload["original_name"],
+                               lambda job, payload=payload: ingest_stored_file(payload, job=job))
+        except QueueFullError:
+            break  # le reste au prochain démarrage
+        requeued += 1
+    return {"status": "ok", "stored": len(stored), "requeued": requeued, "deferred": len(todo) - requeued}
+
 
+def resolve_server_file(relative_path: str) -> Path:
+    """
+    Chemin relatif au projet -> chemin absolu d'un fichier existant.
+    Sécurisé: interdit absolu + '..'
+    """
     rel = Path(relative_path)
     if rel.is_absolute() or ".." in rel.parts:
         raise ValueError("Chemin relatif invalide (interdit: absolu ou '..').")
@@ -149,8 +240,20 @@ async def parse_and_store_local_file(relative_path: str) -> dict:
 
     if not abs_path.exists() or not abs_path.is_file():
         raise FileNotFoundError(f"Fichier introuvable: {abs_path}")
+    return abs_path
+
+
+def ingest_server_file(abs_path: Path, job=None, file_id: str | None = None) -> dict:
+    """
+    Ingestion d'un fichier déjà présent sur le serveur (voir resolve_server_file).
+    """
+    ensure_sqlite_schema()
 
-    res = ingest_file(str(abs_path), reingest=False, bump_version=False)
+    res = ingest_file(str(abs_path), reingest=False, bump_version=False, file_id=file_id)
+
+    if job is not None:
+        for name, ms in (res.get("timings_ms") or {}).items():
+            job.add_stage(name, ms)
 
     return {
         "status": "success" if res.get("status") == "ok" else res.get("status", "unknown"),
@@ -158,9 +261,24 @@ async def parse_and_store_local_file(relative_path: str) -> dict:
         "file_path": str(abs_path),
         "file_id": res.get("file_id"),
         "ingestion": res,
-        "steps": [{
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "message": "Ingestion server-file terminée",
-            "status": "ok",
-        }],
+        "steps": [_step("Ingestion server-file terminée")],
     }
+
+
+async def parse_and_store_local_file(relative_path: str) -> dict:
+    """
+    Ingestion d'un fichier déjà présent sur le serveur.
+    Sécurisé: interdit absolu + '..'
+    """
+    return ingest_server_file(resolve_server_file(relative_path))
+
+
+def enqueue_watched_file(path: str, file_id: str) -> None:
+    """
+    Fichier nouveau / modifié du dossier surveillé => job d'ingestion (QueueFullError si file pleine).
+    """
+    abs_path = Path(path)
+    INGEST_JOBS.submit("watch", abs_path.name, lambda job: ingest_server_file(abs_path, job=job, file_id=file_id))
+
+
+INBOX_WATCHER = DirectoryWatcher(WATCH_DIR, METADATA_REPO, enqueue_watched_file, sha256_file, SUPPORTED_EXTENSIONS)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# PATH: services/jobs.py
+# Auteur: Bruno DELNOZ
+# Version: v1.0.1 – Date: 2026-02-09
+# Target usage: File de jobs d'ingestion en arrière-plan (pool borné + statut consultable)
+#
+# Fix v1.0.1:
+# - shutdown(): jobs encore en file marqués "cancelled" (compteur pending rendu, on_done appelé)
+#   au lieu de rester "queued" pour toujours; uploads repris au démarrage (recover_pending_uploads)
+#
+# v1.0.0:
+# - JobManager: pool de threads borné + file d'attente bornée (refus si pleine)
+# - Job: statut, timings par étape, résultat / erreur, historique en mémoire (borné)
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+INGEST_WORKERS = int(os.getenv("NOXOZ_INGEST_WORKERS", "2"))
+INGEST_QUEUE_MAX = int(os.getenv("NOXOZ_INGEST_QUEUE_MAX", "100"))
+JOBS_HISTORY_MAX = int(os.getenv("NOXOZ_JOBS_HISTORY_MAX", "500"))
+
+
+class QueueFullError(RuntimeError):
+    """File d'attente pleine: l'appelant doit réessayer plus tard (HTTP 503)."""
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class Job:
+    """
+    Un job d'arrière-plan. Les étapes sont chronométrées via stage():
+
+        with job.stage("ingest"):
+            ...
+    """
+
+    def __init__(self, kind: str, label: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.label = label
+        self.status = "queued"
+        self.created_at = _now_iso()
+        self.started_at: Optional[str] = None
+        self.finished_at: Optional[str] = None
+        self.stages: List[Dict] = []
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self._created = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add_stage(self, name: str, duration_ms: float, status: str = "ok", **extra: Any) -> None:
+        with self._lock:
+            self.stages.append({
+                "name": name,
+                "status": status,
+                "duration_ms": round(duration_ms, 2),
+                "finished_at": _now_iso(),
+                **extra,
+            })
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        except Exception as exc:
+            self.add_stage(name, (time.perf_counter() - t0) * 1000.0, status="error", error=str(exc))
+            raise
+        self.add_stage(name, (time.perf_counter() - t0) * 1000.0)
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "kind": self.kind,
+                "label": self.label,
+                "status": self.status,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "stages": [dict(s) for s in self.stages],
+                "result": self.result,
+                "error": self.error,
+            }
+
+
+class JobManager:
+    """
+    Pool de workers borné. submit() refuse (QueueFullError) au-delà de max_pending
+    jobs non terminés => la latence d'upload reste plate, la charge reste bornée.
+    """
+
+    def __init__(self, workers: int = INGEST_WORKERS, max_pending: int = INGEST_QUEUE_MAX,
+                 history_max: int = JOBS_HISTORY_MAX):
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.history_max = max(10, history_max)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._pending = 0
+        # jobs soumis pas encore terminés: annulables au shutdown
+        self._queued: Dict[str, Tuple[Future, Job, Optional[Callable[[Job], None]]]] = {}
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ingest-job")
+        return self._executor
+
+    def submit(
+        self,
+        kind: str,
+        label: str,
+        fn: Callable[[Job], Dict],
+        on_done: Optional[Callable[[Job], None]] = None,
+        job: Optional[Job] = None,
+    ) -> Job:
+        """
+        fn(job) s'exécute dans un worker; son retour devient job.result.
+        on_done(job) est appelé après succès, erreur ou annulation (mise à jour de logs, etc.).
+        """
+        job = job or Job(kind, label)
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFullError(f"File d'ingestion pleine ({self._pending} jobs en attente)")
+            self._pending += 1
+            self._jobs[job.id] = job
+            self._trim_locked()
+            executor = self._get_executor()
+
+        def _run():
+            job.started_at = _now_iso()
+            job.add_stage("queue_wait", (time.perf_counter() - job._created) * 1000.0)
+            job.status = "running"
+            try:
+                job.result = fn(job)
+                job.status = "success"
+            except Exception as exc:
+                job.error = str(exc)
+                job.status = "error"
+            finally:
+                job.finished_at = _now_iso()
+                with self._lock:
+                    self._pending -= 1
+                    self._queued.pop(job.id, None)
+                self._notify(job, on_done)
+
+        future = executor.submit(_run)
+        with self._lock:
+            if job.finished_at is None:  # sinon déjà terminé (et retiré) par _run
+                self._queued[job.id] = (future, job, on_done)
+        return job
+
+    @staticmethod
+    def _notify(job: Job, on_done: Optional[Callable[[Job], None]]) -> None:
+        if on_done is not None:
+            try:
+                on_done(job)
+            except Exception:
+                pass
+
+    def _trim_locked(self) -> None:
+        # on ne jette que des jobs terminés (les plus anciens d'abord)
+        if len(self._jobs) <= self.history_max:
+            return
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self.history_max:
+                break
+            if self._jobs[job_id].status in ("success", "error", "cancelled"):
+                del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self, limit: int = 50) -> List[Dict]:
+        with self._lock:
+            jobs = list(self._jobs.values())[-limit:]
+        return [j.to_dict() for j in reversed(jobs)]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            statuses: Dict[str, int] = {}
+            for job in self._jobs.values():
+                statuses[job.status] = statuses.get(job.status, 0) + 1
+            return {
+                "workers": self.workers,
+                "pending": self._pending,
+                "max_pending": self.max_pending,
+                "jobs": statuses,
+            }
+
+    def shutdown(self, wait: bool = False) -> None:
+        """
+        wait=False: les jobs en cours vont au bout, ceux encore en file sont annulés ("cancelled").
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        executor.shutdown(wait=wait, cancel_futures=not wait)
+        cancelled: List[Tuple[Job, Optional[Callable[[Job], None]]]] = []
+        with self._lock:
+            for job_id, (future, job, on_done) in list(self._queued.items()):
+                if future.cancelled():
+                    del self._queued[job_id]
+                    self._pending -= 1
+                    cancelled.append((job, on_done))
+        for job, on_done in cancelled:
+            job.status = "cancelled"
+            job.error = "Arrêt du service avant exécution"
+            job.finished_at = _now_iso()
+            self._notify(job, on_done)
+
+
+INGEST_JOBS = JobManager()
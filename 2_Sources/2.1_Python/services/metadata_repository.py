@@ -0,0 +1,931 @@
+#!/usr/bin/env python3
+# PATH: services/metadata_repository.py
+# Auteur: Bruno DELNOZ
+# Version: v1.7.1 – Date: 2026-02-09
+# Target usage: Accès SQLite des métadonnées (files / documents): connexions longues + migrations versionnées
+#
+# v1.7.1:
+# - file_statuses(): statut de plusieurs file_id en une requête (reprise des uploads au démarrage)
+#
+# v1.7.0:
+# - Migration 6: files.ingested_at (epoch, comme la métadonnée Chroma), posé seulement quand le
+#   contenu est (ré)ingéré; set_status() / touch_last_seen() ne le déplacent pas (filtres de dates)
+#
+# v1.6.0:
+# - Migration 5: table watched_files (index stat mtime/taille/inode du dossier surveillé => pas de re-hash)
+# - watched_files() / upsert_watched_files() / delete_watched_files()
+#
+# v1.5.0:
+# - Migration 4: table vector_rows (ligne de la matrice NumPy <-> chunk_id)
+# - vector_row_map() / vector_rows_matching() / vector_rows_sync_counts() / chunk_rows()
+#
+# v1.4.0:
+# - Migration 3: files.language + index sur original_name (filtres de recherche, "dernière version")
+# - file_attributes() / superseded_file_ids(); search_chunks() accepte un fragment SQL (d. / f.)
+#
+# v1.3.0:
+# - Migration 2: table FTS5 documents_fts (texte des chunks, rowid = documents.rowid)
+# - index_chunk_texts() / delete_chunks() / delete_file() maintiennent l'index plein texte
+# - search_chunks(): recherche BM25 (MATCH) jointe aux métadonnées des chunks
+#
+# v1.2.0:
+# - file_versions(): versions de plusieurs file_id en une requête (clé du cache de génération)
+#
+# v1.1.0:
+# - SQLiteWriter: un seul thread possède la connexion d'écriture, lots group-commit,
+#   Future par écriture (write() sync / write_async() pour asyncio)
+# - Remplace le verrou global thread + fcntl de vector_store (lectures WAL sans verrou)
+#
+# v1.0.0:
+# - Connexions SQLite longues (une par thread), PRAGMAs posés une seule fois
+# - Schéma versionné via PRAGMA user_version: migrations jouées une fois (démarrage)
+# - Colonnes des tables en cache (plus de PRAGMA table_info par écriture)
+# - Upserts réels (INSERT ... ON CONFLICT DO UPDATE)
+
+from __future__ import annotations
+
+import asyncio
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from services.metrics import Histogram
+
+SQLITE_WRITE_BATCH = int(os.getenv("NOXOZ_SQLITE_WRITE_BATCH", "64"))
+SQLITE_WRITE_WAIT_MS = float(os.getenv("NOXOZ_SQLITE_WRITE_WAIT_MS", "2"))
+
+
+# ==============================================================================
+# 1) HELPERS SCHÉMA
+# ==============================================================================
+
+def table_exists(cursor: sqlite3.Cursor, table: str) -> bool:
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?;", (table,))
+    return cursor.fetchone() is not None
+
+
+def table_columns(cursor: sqlite3.Cursor, table: str) -> set[str]:
+    """
+    Retourne l'ensemble des colonnes existantes pour une table donnée.
+    """
+    cursor.execute(f"PRAGMA table_info({table});")
+    return {row[1] for row in cursor.fetchall()}  # row[1] = column name
+
+
+def add_column(cursor: sqlite3.Cursor, table: str, col: str, ddl_fragment: str) -> bool:
+    """
+    Ajoute une colonne si absente.
+    - ddl_fragment est la définition SQL complète SANS le nom de table
+      ex: "file_id TEXT" ou "updated_at TEXT NOT NULL DEFAULT '...'"
+    Retourne True si ajouté, False sinon.
+    """
+    cols = table_columns(cursor, table)
+    if col not in cols:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {ddl_fragment};")
+        return True
+    return False
+
+
+# ==============================================================================
+# 2) MIGRATIONS (PRAGMA user_version)
+# ==============================================================================
+
+def _migration_1_baseline(cursor: sqlite3.Cursor) -> None:
+    """
+    Schéma de base + convergence des bases legacy (ex-init_sqlite()):
+    tables files/documents, colonnes manquantes, backfill, index.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS files (
+            file_id TEXT PRIMARY KEY,
+            original_name TEXT NOT NULL,
+            stored_path TEXT NOT NULL,
+            ext TEXT,
+            size_bytes INTEGER,
+            sha256 TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            last_seen_at TEXT,
+            version INTEGER NOT NULL DEFAULT 1,
+            status TEXT NOT NULL DEFAULT 'ingested'
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS documents (
+            chunk_id TEXT PRIMARY KEY,
+            file_id TEXT,
+            chunk_index INTEGER,
+            source_path TEXT,
+            ingestion_date TEXT,
+            char_start INTEGER,
+            char_end INTEGER,
+            token_count INTEGER,
+            page INTEGER,
+            section TEXT
+        )
+    """)
+
+    # Colonnes manquantes (bases créées par d'anciennes versions)
+    for col, ddl in (
+        ("original_name", "original_name TEXT"),
+        ("original_filename", "original_filename TEXT"),
+        ("stored_path", "stored_path TEXT"),
+        ("ext", "ext TEXT"),
+        ("size_bytes", "size_bytes INTEGER"),
+        ("sha256", "sha256 TEXT"),
+        ("created_at", "created_at TEXT"),
+        ("updated_at", "updated_at TEXT"),
+        ("last_seen_at", "last_seen_at TEXT"),
+        ("version", "version INTEGER NOT NULL DEFAULT 1"),
+        ("status", "status TEXT NOT NULL DEFAULT 'ingested'"),
+    ):
+        add_column(cursor, "files", col, ddl)
+
+    for col, ddl in (
+        ("file_id", "file_id TEXT"),
+        ("chunk_id", "chunk_id TEXT"),
+        ("chunk_index", "chunk_index INTEGER"),
+        ("source_path", "source_path TEXT"),
+        ("ingestion_date", "ingestion_date TEXT"),
+        ("char_start", "char_start INTEGER"),
+        ("char_end", "char_end INTEGER"),
+        ("token_count", "token_count INTEGER"),
+        ("page", "page INTEGER"),
+        ("section", "section TEXT"),
+    ):
+        add_column(cursor, "documents", col, ddl)
+
+    # Backfill des colonnes fraîchement ajoutées (sinon NULL partout)
+    now = datetime.now(timezone.utc).isoformat()
+    cursor.execute("UPDATE files SET created_at = ? WHERE created_at IS NULL OR created_at = '';", (now,))
+    cursor.execute("UPDATE files SET updated_at = ? WHERE updated_at IS NULL OR updated_at = '';", (now,))
+    cursor.execute("UPDATE files SET last_seen_at = ? WHERE last_seen_at IS NULL OR last_seen_at = '';", (now,))
+    cursor.execute(
+        "UPDATE files SET original_filename = original_name "
+        "WHERE original_filename IS NULL OR original_filename = '';"
+    )
+
+    # ON CONFLICT exige une contrainte d'unicité: les tables legacy n'en ont pas forcément
+    cursor.execute("DELETE FROM files WHERE rowid NOT IN (SELECT MAX(rowid) FROM files GROUP BY file_id);")
+    cursor.execute(
+        "DELETE FROM documents WHERE chunk_id IS NOT NULL "
+        "AND rowid NOT IN (SELECT MAX(rowid) FROM documents GROUP BY chunk_id);"
+    )
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_files_file_id ON files(file_id)")
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_documents_chunk_id ON documents(chunk_id)")
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_documents_file_id ON documents(file_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_documents_chunk_id ON documents(chunk_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_files_updated_at ON files(updated_at)")
+
+
+FTS_TABLE = "documents_fts"
+
+
+def _migration_2_fts(cursor: sqlite3.Cursor) -> None:
+    """
+    Index plein texte des chunks (BM25). rowid = rowid de documents (jointure / suppression indexées).
+    SQLite compilé sans FTS5 => pas de table, la recherche lexicale est indisponible.
+    Le texte des chunks existants (dans Chroma) est rechargé par backfill_fts_from_chroma().
+    """
+    try:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            "text, chunk_id UNINDEXED, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+    except sqlite3.OperationalError:
+        pass
+
+
+def _migration_3_search_filters(cursor: sqlite3.Cursor) -> None:
+    """
+    Langue détectée à l'ingestion + index pour retrouver la dernière version d'un même nom.
+    """
+    add_column(cursor, "files", "language", "language TEXT")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_files_original_name ON files(original_name, updated_at)")
+
+
+VECTOR_ROWS_TABLE = "vector_rows"
+
+
+def _migration_4_vector_rows(cursor: sqlite3.Cursor) -> None:
+    """
+    Correspondance ligne de la matrice d'embeddings (backend NumPy) <-> chunk_id.
+    Ligne absente = ligne libre (réutilisée au prochain ajout).
+    """
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {VECTOR_ROWS_TABLE} (
+            row INTEGER PRIMARY KEY,
+            chunk_id TEXT NOT NULL UNIQUE,
+            file_id TEXT
+        )
+    """)
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_vector_rows_file_id ON {VECTOR_ROWS_TABLE}(file_id)")
+
+
+WATCHED_FILES_TABLE = "watched_files"
+
+
+def _migration_5_watched_files(cursor: sqlite3.Cursor) -> None:
+    """
+    Dernier état connu des fichiers du dossier surveillé (services/watcher.py):
+    stat inchangé au redémarrage => fichier ni re-hashé ni réingéré.
+    """
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {WATCHED_FILES_TABLE} (
+            path TEXT PRIMARY KEY,
+            mtime_ns INTEGER NOT NULL,
+            size_bytes INTEGER NOT NULL,
+            inode INTEGER NOT NULL,
+            file_id TEXT,
+            seen_at TEXT
+        )
+    """)
+
+
+def _iso_to_epoch(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def _migration_6_ingested_at(cursor: sqlite3.Cursor) -> None:
+    """
+    Date de dernière ingestion du contenu (epoch), distincte de updated_at (bougé par chaque
+    changement de statut). Backfill: updated_at des fichiers déjà ingérés.
+    """
+    add_column(cursor, "files", "ingested_at", "ingested_at REAL")
+    rows = cursor.execute("SELECT file_id, updated_at FROM files WHERE status = 'ingested';").fetchall()
+    cursor.executemany(
+        "UPDATE files SET ingested_at = ? WHERE file_id = ?;",
+        [(_iso_to_epoch(updated_at), file_id) for file_id, updated_at in rows],
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_files_ingested_at ON files(ingested_at)")
+
+
+# Ordre = numéro de version. Ajouter une migration = ajouter une fonction en fin de liste.
+MIGRATIONS: List[Callable[[sqlite3.Cursor], None]] = [
+    _migration_1_baseline,
+    _migration_2_fts,
+    _migration_3_search_filters,
+    _migration_4_vector_rows,
+    _migration_5_watched_files,
+    _migration_6_ingested_at,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+# ==============================================================================
+# 3) WRITER (single-writer actor + group commit)
+# ==============================================================================
+
+WriteFn = Callable[[sqlite3.Cursor], Any]
+
+
+class SQLiteWriter:
+    """
+    Acteur d'écriture SQLite:
+    - un thread daemon possède l'unique connexion d'écriture
+    - submit(fn) met fn(cursor) en file et renvoie un Future
+    - le thread prend un lot (max_batch écritures ou max_wait ms), l'exécute dans
+      UNE transaction (SAVEPOINT par écriture: un échec n'annule que la sienne),
+      puis commit une fois => débit qui monte avec la taille des lots
+    """
+
+    def __init__(self, open_conn: Callable[[], sqlite3.Connection],
+                 max_batch: int = SQLITE_WRITE_BATCH, max_wait_ms: float = SQLITE_WRITE_WAIT_MS):
+        self._open_conn = open_conn
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: "queue.Queue[Optional[Tuple[WriteFn, Future]]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.batch_size = Histogram((1, 2, 4, 8, 16, 32, 64, 128))
+        self.commit_ms = Histogram((1, 2, 5, 10, 25, 50, 100, 250, 1000))
+        self.writes = 0
+        self.failures = 0
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, fn: WriteFn) -> Future:
+        future: Future = Future()
+        self._ensure_started()
+        self._queue.put((fn, future))
+        return future
+
+    def write(self, fn: WriteFn) -> Any:
+        """
+        Écriture synchrone (attend le commit du lot qui la contient).
+        """
+        return self.submit(fn).result()
+
+    async def write_async(self, fn: WriteFn) -> Any:
+        return await asyncio.wrap_future(self.submit(fn))
+
+    def _collect(self, first: Tuple[WriteFn, Future]) -> Tuple[List[Tuple[WriteFn, Future]], bool]:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self) -> None:
+        try:
+            conn = self._open_conn()
+        except BaseException as exc:
+            # migration / ouverture en échec: les écritures en file échouent au lieu d'attendre
+            # indéfiniment (le prochain submit() relance un thread et retente l'ouverture)
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    return
+                if item is not None and item[1].set_running_or_notify_cancel():
+                    self.failures += 1
+                    item[1].set_exception(exc)
+        conn.isolation_level = None  # transactions gérées explicitement
+        stop = False
+        while not stop:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch, stop = self._collect(first)
+            self._execute(conn, batch)
+        conn.close()
+
+    def _execute(self, conn: sqlite3.Connection, batch: List[Tuple[WriteFn, Future]]) -> None:
+        t0 = time.perf_counter()
+        results: List[Tuple[Future, Any, Optional[BaseException]]] = []
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE;")
+            for fn, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                cursor.execute("SAVEPOINT write_item;")
+                try:
+                    value = fn(cursor)
+                    cursor.execute("RELEASE write_item;")
+                    results.append((future, value, None))
+                except BaseException as exc:
+                    cursor.execute("ROLLBACK TO write_item;")
+                    cursor.execute("RELEASE write_item;")
+                    results.append((future, None, exc))
+            cursor.execute("COMMIT;")
+        except BaseException as exc:
+            # échec du lot entier (BEGIN/COMMIT): toutes les écritures échouent
+            try:
+                cursor.execute("ROLLBACK;")
+            except sqlite3.Error:
+                pass
+            results = [(future, None, exc) for _, future in batch if future.running()]
+        finally:
+            cursor.close()
+
+        self.batch_size.observe(len(batch))
+        self.commit_ms.observe((time.perf_counter() - t0) * 1000.0)
+        for future, value, exc in results:
+            self.writes += 1
+            if exc is None:
+                future.set_result(value)
+            else:
+                self.failures += 1
+                future.set_exception(exc)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def stats(self) -> Dict:
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "queue_depth": self._queue.qsize(),
+            "writes": self.writes,
+            "failures": self.failures,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batch_size": self.batch_size.snapshot(),
+            "commit_ms": self.commit_ms.snapshot(),
+        }
+
+
+# ==============================================================================
+# 4) REPOSITORY
+# ==============================================================================
+
+class MetadataRepository:
+    """
+    Point d'accès unique à la base de métadonnées.
+    - migrate(): joue les migrations manquantes (une fois par process, no-op ensuite)
+    - connection(): connexion longue du thread courant (LECTURES, sans verrou sous WAL)
+    - write(fn) / submit_write(fn) / write_async(fn): écritures via le writer unique
+    - méthodes métier: file_state, upsert_file, replace_chunks, set_status, delete_file...
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self._local = threading.local()
+        self._all_conns: List[sqlite3.Connection] = []
+        self._conns_lock = threading.Lock()
+        self._migrate_lock = threading.Lock()
+        self._migrated = False
+        self._columns: Dict[str, set] = {}
+        self._has_fts: Optional[bool] = None
+        self.writer = SQLiteWriter(self._open_migrated)
+
+    # --------------------------------------------------------------------------
+    # Connexions
+    # --------------------------------------------------------------------------
+    def _open(self) -> sqlite3.Connection:
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL;")
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        conn.execute("PRAGMA busy_timeout = 30000;")
+        conn.execute("PRAGMA foreign_keys = ON;")
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        self.migrate()
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+            with self._conns_lock:
+                self._all_conns.append(conn)
+        return conn
+
+    def _open_migrated(self) -> sqlite3.Connection:
+        self.migrate()
+        return self._open()
+
+    # --------------------------------------------------------------------------
+    # Écritures: toujours via le writer (fn(cursor) exécutée dans son thread)
+    # --------------------------------------------------------------------------
+    def submit_write(self, fn: WriteFn) -> Future:
+        return self.writer.submit(fn)
+
+    def write(self, fn: WriteFn) -> Any:
+        return self.writer.write(fn)
+
+    async def write_async(self, fn: WriteFn) -> Any:
+        return await self.writer.write_async(fn)
+
+    def close_all(self) -> None:
+        self.writer.stop()
+        with self._conns_lock:
+            conns, self._all_conns = self._all_conns, []
+        for conn in conns:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+    # --------------------------------------------------------------------------
+    # Migrations
+    # --------------------------------------------------------------------------
+    def schema_version(self) -> int:
+        conn = self._open()
+        try:
+            return int(conn.execute("PRAGMA user_version;").fetchone()[0])
+        finally:
+            conn.close()
+
+    def migrate(self) -> int:
+        """
+        Joue les migrations > user_version, chacune dans sa transaction.
+        Retourne la version finale du schéma.
+        """
+        if self._migrated:
+            return SCHEMA_VERSION
+        with self._migrate_lock:
+            if self._migrated:
+                return SCHEMA_VERSION
+            conn = self._open()
+            try:
+                current = int(conn.execute("PRAGMA user_version;").fetchone()[0])
+                for version, migration in enumerate(MIGRATIONS, start=1):
+                    if version <= current:
+                        continue
+                    cursor = conn.cursor()
+                    cursor.execute("BEGIN IMMEDIATE;")
+                    try:
+                        migration(cursor)
+                        # PRAGMA ne prend pas de paramètre lié
+                        cursor.execute(f"PRAGMA user_version = {int(version)};")
+                        conn.commit()
+                    except BaseException:
+                        conn.rollback()
+                        raise
+                cursor = conn.cursor()
+                self._columns = {t: table_columns(cursor, t) for t in ("files", "documents")}
+            finally:
+                conn.close()
+            self._migrated = True
+        return SCHEMA_VERSION
+
+    def columns(self, table: str) -> set[str]:
+        self.migrate()
+        return self._columns.get(table, set())
+
+    # --------------------------------------------------------------------------
+    # Lectures
+    # --------------------------------------------------------------------------
+    def file_state(self, file_id: str) -> Optional[Dict]:
+        """
+        État d'un file_id dans files (+ nb de chunks), None si inconnu.
+        """
+        row = self.connection().execute(
+            "SELECT status, stored_path, version, "
+            "(SELECT COUNT(*) FROM documents WHERE documents.file_id = files.file_id) "
+            "FROM files WHERE file_id = ?;",
+            (file_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        return {"status": row[0], "stored_path": row[1], "version": row[2], "chunks": int(row[3])}
+
+    def chunk_ids(self, file_id: str) -> List[str]:
+        rows = self.connection().execute(
+            "SELECT chunk_id FROM documents WHERE file_id = ? AND chunk_id IS NOT NULL;", (file_id,)
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def file_versions(self, file_ids) -> Dict[str, int]:
+        ids = list(dict.fromkeys(f for f in file_ids if f))
+        out: Dict[str, int] = {}
+        for i in range(0, len(ids), 500):
+            part = ids[i:i + 500]
+            rows = self.connection().execute(
+                f"SELECT file_id, version FROM files WHERE file_id IN ({','.join('?' * len(part))});", part
+            ).fetchall()
+            out.update({r[0]: r[1] for r in rows})
+        return out
+
+    def file_statuses(self, file_ids) -> Dict[str, str]:
+        """{file_id: status} des file_id connus de files (absents = jamais ingérés)."""
+        ids = list(dict.fromkeys(f for f in file_ids if f))
+        out: Dict[str, str] = {}
+        for i in range(0, len(ids), 500):
+            part = ids[i:i + 500]
+            rows = self.connection().execute(
+                f"SELECT file_id, status FROM files WHERE file_id IN ({','.join('?' * len(part))});", part
+            ).fetchall()
+            out.update({r[0]: r[1] for r in rows})
+        return out
+
+    def has_fts(self) -> bool:
+        if self._has_fts is None:
+            self.migrate()
+            self._has_fts = table_exists(self.connection().cursor(), FTS_TABLE)
+        return self._has_fts
+
+    def fts_counts(self) -> Tuple[int, int]:
+        """(chunks indexés plein texte, chunks dans documents)"""
+        conn = self.connection()
+        indexed = conn.execute(f"SELECT COUNT(*) FROM {FTS_TABLE};").fetchone()[0] if self.has_fts() else 0
+        total = conn.execute("SELECT COUNT(*) FROM documents;").fetchone()[0]
+        return int(indexed), int(total)
+
+    def search_chunks(
+        self,
+        match: str,
+        limit: int,
+        filters: Optional[Dict[str, Any]] = None,
+        clause: str = "",
+        clause_params: Sequence[Any] = (),
+    ) -> List[Dict]:
+        """
+        Recherche BM25 (expression MATCH FTS5). bm25() renvoie un score négatif: plus petit = plus pertinent.
+        - filters: égalités sur des colonnes de documents
+        - clause / clause_params: condition SQL supplémentaire sur d (documents) / f (files)
+        """
+        where = ""
+        params: List[Any] = [match]
+        for column, value in (filters or {}).items():
+            if column not in self.columns("documents"):
+                raise ValueError(f"Filtre lexical non supporté: {column}")
+            where += f" AND d.{column} = ?"
+            params.append(value)
+        if clause:
+            where += f" AND ({clause})"
+            params.extend(clause_params)
+        params.append(int(limit))
+        rows = self.connection().execute(
+            f"SELECT d.chunk_id, d.file_id, d.chunk_index, d.source_path, d.char_start, d.char_end, "
+            f"d.page, d.section, {FTS_TABLE}.text, bm25({FTS_TABLE}) AS score, "
+            f"f.original_name, f.ext, f.version, f.language "
+            f"FROM {FTS_TABLE} JOIN documents d ON d.rowid = {FTS_TABLE}.rowid "
+            f"LEFT JOIN files f ON f.file_id = d.file_id "
+            f"WHERE {FTS_TABLE} MATCH ?{where} ORDER BY score LIMIT ?;",
+            params,
+        ).fetchall()
+        keys = ("chunk_id", "file_id", "chunk_index", "source_path", "char_start", "char_end",
+                "page", "section", "text", "bm25", "original_name", "ext", "version", "language")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def file_attributes(self, file_ids) -> Dict[str, Dict]:
+        """
+        {file_id: {version, ext, language, updated_at, ingested_at}} (métadonnées de chunks au rebuild / bulk).
+        """
+        ids = list(dict.fromkeys(f for f in file_ids if f))
+        out: Dict[str, Dict] = {}
+        for i in range(0, len(ids), 500):
+            part = ids[i:i + 500]
+            rows = self.connection().execute(
+                "SELECT file_id, version, ext, language, updated_at, ingested_at FROM files "
+                f"WHERE file_id IN ({','.join('?' * len(part))});",
+                part,
+            ).fetchall()
+            for file_id, version, ext, language, updated_at, ingested_at in rows:
+                out[file_id] = {"version": version, "ext": ext, "language": language,
+                                "updated_at": updated_at, "ingested_at": ingested_at}
+        return out
+
+    def superseded_file_ids(self) -> List[str]:
+        """
+        Fichiers ingérés dont une version plus récente (même original_name) existe.
+        """
+        rows = self.connection().execute("""
+            SELECT f.file_id FROM files f
+            WHERE f.status = 'ingested' AND EXISTS (
+                SELECT 1 FROM files g
+                WHERE g.original_name = f.original_name AND g.status = 'ingested'
+                  AND (g.updated_at > f.updated_at OR (g.updated_at = f.updated_at AND g.file_id > f.file_id))
+            );
+        """).fetchall()
+        return [r[0] for r in rows]
+
+    def vector_row_map(self) -> List[Tuple[int, str, Optional[str]]]:
+        """[(ligne, chunk_id, file_id)] de la matrice NumPy"""
+        self.migrate()
+        return [(int(r[0]), r[1], r[2]) for r in self.connection().execute(
+            f"SELECT row, chunk_id, file_id FROM {VECTOR_ROWS_TABLE} ORDER BY row;"
+        )]
+
+    def vector_rows_matching(
+        self,
+        filters: Optional[Dict[str, Any]] = None,
+        clause: str = "",
+        clause_params: Sequence[Any] = (),
+    ) -> List[int]:
+        """
+        Lignes de la matrice NumPy dont le chunk passe les filtres (mêmes conventions que search_chunks).
+        """
+        where = ""
+        params: List[Any] = []
+        for column, value in (filters or {}).items():
+            if column not in self.columns("documents"):
+                raise ValueError(f"Filtre non supporté: {column}")
+            where += f" AND d.{column} = ?"
+            params.append(value)
+        if clause:
+            where += f" AND ({clause})"
+            params.extend(clause_params)
+        return [int(r[0]) for r in self.connection().execute(
+            f"SELECT v.row FROM {VECTOR_ROWS_TABLE} v JOIN documents d ON d.chunk_id = v.chunk_id "
+            f"LEFT JOIN files f ON f.file_id = d.file_id WHERE 1 = 1{where} ORDER BY v.row;",
+            params,
+        )]
+
+    def vector_rows_sync_counts(self) -> Tuple[int, int]:
+        """(chunks de documents sans ligne NumPy, lignes NumPy sans chunk dans documents)"""
+        self.migrate()
+        conn = self.connection()
+        missing = conn.execute(
+            f"SELECT COUNT(*) FROM documents d LEFT JOIN {VECTOR_ROWS_TABLE} v ON v.chunk_id = d.chunk_id "
+            "WHERE d.chunk_id IS NOT NULL AND v.row IS NULL;"
+        ).fetchone()[0]
+        orphans = conn.execute(
+            f"SELECT COUNT(*) FROM {VECTOR_ROWS_TABLE} v LEFT JOIN documents d ON d.chunk_id = v.chunk_id "
+            "WHERE d.chunk_id IS NULL;"
+        ).fetchone()[0]
+        return int(missing), int(orphans)
+
+    def chunk_rows(self, chunk_ids: Sequence[str]) -> Dict[str, Dict]:
+        """
+        {chunk_id: métadonnées du chunk (+ texte si FTS5)} — résultats du backend NumPy.
+        """
+        ids = list(dict.fromkeys(c for c in chunk_ids if c))
+        text_sql = f"(SELECT text FROM {FTS_TABLE} WHERE {FTS_TABLE}.rowid = d.rowid)" if self.has_fts() else "NULL"
+        keys = ("chunk_id", "file_id", "chunk_index", "source_path", "char_start", "char_end",
+                "page", "section", "text", "original_name", "ext", "version", "language")
+        out: Dict[str, Dict] = {}
+        for i in range(0, len(ids), 500):
+            part = ids[i:i + 500]
+            rows = self.connection().execute(
+                f"SELECT d.chunk_id, d.file_id, d.chunk_index, d.source_path, d.char_start, d.char_end, "
+                f"d.page, d.section, {text_sql}, f.original_name, f.ext, f.version, f.language "
+                f"FROM documents d LEFT JOIN files f ON f.file_id = d.file_id "
+                f"WHERE d.chunk_id IN ({','.join('?' * len(part))});",
+                part,
+            ).fetchall()
+            out.update({row[0]: dict(zip(keys, row)) for row in rows})
+        return out
+
+    def watched_files(self, root: str) -> Dict[str, Tuple[Tuple[int, int, int], Optional[str]]]:
+        """{chemin: ((mtime_ns, taille, inode), file_id)} des fichiers suivis sous root"""
+        self.migrate()
+        prefix = root.rstrip(os.sep) + os.sep
+        return {
+            r[0]: ((int(r[1]), int(r[2]), int(r[3])), r[4])
+            for r in self.connection().execute(
+                f"SELECT path, mtime_ns, size_bytes, inode, file_id FROM {WATCHED_FILES_TABLE};"
+            )
+            if r[0].startswith(prefix)
+        }
+
+    def ingested_file_ids(self) -> set:
+        return {r[0] for r in self.connection().execute("SELECT file_id FROM files WHERE status = 'ingested';")}
+
+    # --------------------------------------------------------------------------
+    # Briques d'écriture (à appeler dans une fonction passée à write())
+    # --------------------------------------------------------------------------
+    @staticmethod
+    def upsert_file(
+        cursor: sqlite3.Cursor,
+        file_id: str,
+        original_name: str,
+        stored_path: str,
+        ext: str,
+        size_bytes: int,
+        sha256: str,
+        status: str = "ingested",
+        bump_version: bool = False,
+        now: Optional[str] = None,
+        language: Optional[str] = None,
+        ingested_at: Optional[float] = None,
+    ) -> None:
+        """
+        Upsert d'une ligne dans files (1 statement).
+        - bump_version=True => version = version+1 si déjà présent
+        - language=None conserve la langue déjà connue
+        - status="ingested" => ingested_at (défaut: now), sinon la date d'ingestion connue est conservée
+        """
+        now = now or datetime.now(timezone.utc).isoformat()
+        if status == "ingested" and ingested_at is None:
+            ingested_at = _iso_to_epoch(now)
+        elif status != "ingested":
+            ingested_at = None
+        cursor.execute("""
+            INSERT INTO files (file_id, original_name, original_filename, stored_path, ext, size_bytes,
+                               sha256, created_at, updated_at, last_seen_at, version, status, language,
+                               ingested_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, ?, ?, ?)
+            ON CONFLICT(file_id) DO UPDATE SET
+                original_name = excluded.original_name,
+                original_filename = excluded.original_filename,
+                stored_path = excluded.stored_path,
+                ext = excluded.ext,
+                size_bytes = excluded.size_bytes,
+                sha256 = excluded.sha256,
+                updated_at = excluded.updated_at,
+                last_seen_at = excluded.last_seen_at,
+                version = COALESCE(files.version, 1) + ?,
+                status = excluded.status,
+                language = COALESCE(excluded.language, files.language),
+                ingested_at = COALESCE(excluded.ingested_at, files.ingested_at)
+        """, (file_id, original_name, original_name, stored_path, ext, size_bytes,
+              sha256, now, now, now, status, language, ingested_at, 1 if bump_version else 0))
+
+    @staticmethod
+    def replace_chunks(cursor: sqlite3.Cursor, columns: str, rows: Sequence[Tuple]) -> None:
+        """
+        Upsert des chunks (documents). columns = liste SQL des colonnes de rows,
+        la première étant chunk_id.
+        """
+        if not rows:
+            return
+        names = [c.strip() for c in columns.split(",")]
+        updates = ", ".join(f"{c} = excluded.{c}" for c in names[1:])
+        cursor.executemany(
+            f"INSERT INTO documents ({columns}) VALUES ({', '.join('?' * len(names))}) "
+            f"ON CONFLICT(chunk_id) DO UPDATE SET {updates}",
+            rows,
+        )
+
+    @staticmethod
+    def index_chunk_texts(cursor: sqlite3.Cursor, rows: Sequence[Tuple[str, str]]) -> None:
+        """
+        Texte des chunks dans l'index plein texte. rows = (chunk_id, text);
+        les lignes documents correspondantes doivent déjà exister (replace_chunks avant).
+        """
+        if not rows or not table_exists(cursor, FTS_TABLE):
+            return
+        cursor.executemany(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid = (SELECT rowid FROM documents WHERE chunk_id = ?);",
+            [(chunk_id,) for chunk_id, _ in rows],
+        )
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, text, chunk_id) "
+            "SELECT rowid, ?, chunk_id FROM documents WHERE chunk_id = ?;",
+            [(text, chunk_id) for chunk_id, text in rows],
+        )
+
+    @staticmethod
+    def _delete_chunk_texts(cursor: sqlite3.Cursor, file_id: str) -> None:
+        if table_exists(cursor, FTS_TABLE):
+            cursor.execute(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid IN (SELECT rowid FROM documents WHERE file_id = ?);",
+                (file_id,),
+            )
+
+    @staticmethod
+    def delete_chunks(cursor: sqlite3.Cursor, file_id: str) -> None:
+        MetadataRepository._delete_chunk_texts(cursor, file_id)
+        cursor.execute("DELETE FROM documents WHERE file_id = ?;", (file_id,))
+
+    @staticmethod
+    def set_status(
+        cursor: sqlite3.Cursor,
+        file_id: str,
+        status: str,
+        now: Optional[str] = None,
+        ingested_at: Optional[float] = None,
+    ) -> None:
+        """
+        status="ingested" => ingested_at posé (défaut: now); autre statut => ingested_at inchangé.
+        """
+        now = now or datetime.now(timezone.utc).isoformat()
+        if status == "ingested":
+            cursor.execute(
+                "UPDATE files SET status = ?, updated_at = ?, ingested_at = ? WHERE file_id = ?;",
+                (status, now, ingested_at if ingested_at is not None else _iso_to_epoch(now), file_id),
+            )
+            return
+        cursor.execute("UPDATE files SET status = ?, updated_at = ? WHERE file_id = ?;", (status, now, file_id))
+
+    @staticmethod
+    def touch_last_seen(cursor: sqlite3.Cursor, file_id: str, now: Optional[str] = None) -> None:
+        cursor.execute(
+            "UPDATE files SET last_seen_at = ? WHERE file_id = ?;",
+            (now or datetime.now(timezone.utc).isoformat(), file_id),
+        )
+
+    @staticmethod
+    def upsert_vector_rows(cursor: sqlite3.Cursor, rows: Sequence[Tuple[int, str, Optional[str]]]) -> None:
+        """
+        rows: (ligne, chunk_id, file_id). Un chunk_id déjà placé ailleurs libère son ancienne ligne.
+        """
+        cursor.executemany(
+            f"DELETE FROM {VECTOR_ROWS_TABLE} WHERE chunk_id = ? AND row != ?;", [(r[1], r[0]) for r in rows]
+        )
+        cursor.executemany(f"INSERT OR REPLACE INTO {VECTOR_ROWS_TABLE} (row, chunk_id, file_id) VALUES (?, ?, ?);", rows)
+
+    @staticmethod
+    def delete_vector_rows(cursor: sqlite3.Cursor, rows: Sequence[int]) -> None:
+        cursor.executemany(f"DELETE FROM {VECTOR_ROWS_TABLE} WHERE row = ?;", [(int(r),) for r in rows])
+
+    @staticmethod
+    def upsert_watched_files(cursor: sqlite3.Cursor, rows: Sequence[Tuple[str, int, int, int, Optional[str]]],
+                             now: Optional[str] = None) -> None:
+        """rows: (chemin, mtime_ns, taille, inode, file_id)"""
+        now = now or datetime.now(timezone.utc).isoformat()
+        cursor.executemany(
+            f"INSERT OR REPLACE INTO {WATCHED_FILES_TABLE} (path, mtime_ns, size_bytes, inode, file_id, seen_at) "
+            "VALUES (?, ?, ?, ?, ?, ?);",
+            [(*row, now) for row in rows],
+        )
+
+    @staticmethod
+    def delete_watched_files(cursor: sqlite3.Cursor, paths: Sequence[str]) -> None:
+        cursor.executemany(f"DELETE FROM {WATCHED_FILES_TABLE} WHERE path = ?;", [(p,) for p in paths])
+
+    @staticmethod
+    def delete_file(cursor: sqlite3.Cursor, file_id: str) -> None:
+        """
+        Supprime les métadonnées SQLite liées à un file_id.
+        (La purge Chroma doit être faite séparément.)
+        """
+        MetadataRepository._delete_chunk_texts(cursor, file_id)
+        cursor.execute("DELETE FROM documents WHERE file_id = ?;", (file_id,))
+        cursor.execute("DELETE FROM files WHERE file_id = ?;", (file_id,))
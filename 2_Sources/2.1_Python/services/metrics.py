@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# PATH: services/metrics.py
+# Auteur: Bruno DELNOZ
+# Version: v1.0.0 – Date: 2026-02-09
+# Target usage: Petits compteurs/histogrammes en mémoire (thread-safe) pour /monitor
+#
+# v1.0.0:
+# - Histogram: buckets cumulables + count/sum/max, exporté en dict JSON
+
+from __future__ import annotations
+
+import threading
+from typing import Dict, Iterable, List
+
+
+class Histogram:
+    """
+    Histogramme à buckets fixes (bornes supérieures incluses), style Prometheus simplifié.
+    Les valeurs au-delà de la dernière borne tombent dans "+Inf".
+    """
+
+    def __init__(self, buckets: Iterable[float]):
+        self.buckets: List[float] = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            idx = len(self.buckets)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    idx = i
+                    break
+            self._counts[idx] += 1
+            self._count += 1
+            self._sum += value
+            if value > self._max:
+                self._max = value
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            labels = [str(b) for b in self.buckets] + ["+Inf"]
+            return {
+                "count": self._count,
+                "sum": round(self._sum, 6),
+                "avg": round(self._sum / self._count, 6) if self._count else None,
+                "max": round(self._max, 6),
+                "buckets": dict(zip(labels, self._counts)),
+            }
@@ -0,0 +1,483 @@
+#!/usr/bin/env python3
+# PATH: services/numpy_index.py
+# Auteur: Bruno DELNOZ
+# Version: v1.2.1 – Date: 2026-02-09
+# Target usage: Recherche vectorielle exacte en process (matrice NumPy memory-mappée)
+#
+# v1.2.1:
+# - Fix multi-process (API + bulk_ingest.py / rebuild_index.py sur le même dossier): écritures
+#   sérialisées par flock exclusif (index.lock), compteur de génération (fichier "generation")
+#   incrémenté à chaque écriture; état (lignes, libres, memmaps) relu dès qu'il a bougé
+#   => plus de lignes réutilisées par deux process ni d'écriture dans un fichier remplacé
+# - Coût: lecture du compteur (quelques µs) par recherche
+#
+# v1.2.0:
+# - Re-score float16 / int8 depuis un sidecar float32 memory-mappé (full.npy), lu seulement pour les
+#   k * NOXOZ_NUMPY_RESCORE_FACTOR lignes candidates: plus de collection.get(include=["embeddings"])
+#   Chroma par requête
+# - Coût réel par requête (20k x 384, k=10, facteur 4, int8): scan ~3.4 ms; re-score v1.1.0 via
+#   Chroma get() de 40 ids ~2.2 ms en plus (+65%), re-score sidecar ~0.4 ms (40 lignes x 1.5 Ko)
+# - Le scan ne touche que la matrice compacte (RAM / cache); le sidecar (4 o/dim, "rescore_bytes")
+#   reste sur disque, seules les lignes candidates sont lues
+# - Index compact sans sidecar (version antérieure) => vidé puis rechargé (sync_numpy_index)
+# - search(rescore=False): premier passage seul (benchmark)
+#
+# v1.1.0:
+# - Stockage compact NOXOZ_NUMPY_INDEX_DTYPE: float32 (défaut), float16, int8 (échelle par vecteur)
+# - Premier passage sur la représentation compacte (par blocs), re-score pleine précision des
+#   k * NOXOZ_NUMPY_RESCORE_FACTOR meilleurs candidats (vecteurs float32 fournis par l'appelant)
+#   [remplacé en v1.2.0 par le sidecar float32]
+# - Matrice d'un autre dtype au chargement => index vidé puis rechargé (sync_numpy_index)
+#
+# v1.0.0:
+# - Embeddings normalisés float32 dans un .npy memory-mappé (3_Data/3.1_Vectors/numpy_index)
+# - Correspondance ligne <-> chunk_id dans SQLite (table vector_rows)
+# - top-k = un produit matrice-vecteur + argpartition (pas de HNSW, pas de client Chroma)
+# - Lignes supprimées marquées libres puis réutilisées; capacité doublée à la demande
+
+from __future__ import annotations
+
+import fcntl
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from services.metadata_repository import MetadataRepository
+from services.metrics import Histogram
+
+NUMPY_INDEX_INITIAL_ROWS = int(os.getenv("NOXOZ_NUMPY_INDEX_INITIAL_ROWS", "1024"))
+# Représentation stockée: float32 (4 o/dim), float16 (2 o/dim), int8 (1 o/dim + 4 o d'échelle par vecteur)
+NUMPY_INDEX_DTYPES = ("float32", "float16", "int8")
+NUMPY_INDEX_DTYPE = os.getenv("NOXOZ_NUMPY_INDEX_DTYPE", "float32")
+# Candidats re-scorés en pleine précision = k * facteur (0 => pas de re-score); ignoré en float32
+NUMPY_RESCORE_FACTOR = int(os.getenv("NOXOZ_NUMPY_RESCORE_FACTOR", "4"))
+
+_SEARCH_MS_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100)
+# Lignes converties en float32 à la fois pendant le scan d'une matrice compacte: bloc tenant en cache
+# (int8 -> float32 par blocs de 512 lignes: plus rapide que le scan float32 complet, moins de bande passante).
+# float16: conversion logicielle NumPy => scan plus lent que float32, seul le gain mémoire/disque compte
+_SCAN_BLOCK_ROWS = 512
+
+
+def normalize_rows(vectors) -> np.ndarray:
+    """
+    float32 + norme L2 = 1 par ligne (produit scalaire = cosinus). Vecteur nul laissé tel quel.
+    """
+    arr = np.asarray(vectors, dtype=np.float32)
+    if arr.ndim == 1:
+        arr = arr.reshape(1, -1)
+    norms = np.linalg.norm(arr, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return arr / norms
+
+
+def quantize(vectors: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Vecteurs normalisés => (représentation stockée, échelles int8 ou None).
+    int8: quantification scalaire symétrique par vecteur, x ~= q * scale avec scale = max|x| / 127.
+    """
+    if dtype == "float32":
+        return vectors.astype(np.float32, copy=False), None
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+def _scan(matrix: np.ndarray, scales: Optional[np.ndarray], q: np.ndarray,
+          count: int, rows: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Scores approchés (produit scalaire) des lignes [0, count) ou des lignes rows.
+    float32: un seul produit matrice-vecteur; compact: conversion float32 par blocs (BLAS, mémoire bornée).
+    """
+    n = count if rows is None else len(rows)
+    if matrix.dtype == np.float32:
+        return matrix[:count] @ q if rows is None else matrix[rows] @ q
+    out = np.empty(n, dtype=np.float32)
+    for a in range(0, n, _SCAN_BLOCK_ROWS):
+        b = min(n, a + _SCAN_BLOCK_ROWS)
+        block = matrix[a:b] if rows is None else matrix[rows[a:b]]
+        out[a:b] = block.astype(np.float32) @ q
+    if scales is not None:
+        out *= scales[:count] if rows is None else scales[rows]
+    return out
+
+
+class NumpyIndex:
+    """
+    Index exact (brute force) pour quelques milliers / dizaines de milliers de chunks.
+    - add(): écrit les vecteurs dans la matrice (flush) PUIS la correspondance SQLite
+      => une ligne écrite mais non référencée (crash) est simplement une ligne libre
+    - search(): scores = M[:n] @ q (ou M[lignes filtrées] @ q), top-k par argpartition
+    - dtype float16 / int8: premier passage approché, re-score pleine précision des meilleurs candidats
+      depuis le sidecar float32 (full.npy, mêmes lignes, jamais scanné en entier)
+    - lectures sans verrou sur un instantané (matrice, masque, ids); écritures sérialisées
+      entre threads (RLock) et entre process (flock sur index.lock), état relu si la génération
+      a été incrémentée par un autre process
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        repo: MetadataRepository,
+        initial_rows: int = NUMPY_INDEX_INITIAL_ROWS,
+        dtype: str = NUMPY_INDEX_DTYPE,
+        rescore_factor: int = NUMPY_RESCORE_FACTOR,
+    ):
+        if dtype not in NUMPY_INDEX_DTYPES:
+            raise ValueError(f"dtype d'index inconnu: {dtype} (attendu: {', '.join(NUMPY_INDEX_DTYPES)})")
+        self.directory = Path(directory)
+        self.path = self.directory / "embeddings.npy"
+        self.scales_path = self.directory / "scales.npy"
+        self.full_path = self.directory / "full.npy"
+        self.lock_path = self.directory / "index.lock"
+        self.generation_path = self.directory / "generation"
+        self.repo = repo
+        self.initial_rows = max(16, initial_rows)
+        self.dtype = dtype
+        self.rescore_factor = max(0, rescore_factor)
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._generation = 0
+        self._matrix: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._full: Optional[np.ndarray] = None
+        self._live = np.zeros(0, dtype=bool)
+        self._ids: List[Optional[str]] = []
+        self._rows: Dict[str, int] = {}
+        self._file_rows: Dict[str, Set[int]] = {}
+        self._free: List[int] = []
+        self._count = 0  # lignes utilisées ou libres (haut de la matrice)
+        self.searches = 0
+        self.rescored = 0
+        self.search_ms = Histogram(_SEARCH_MS_BUCKETS)
+
+    # --------------------------------------------------------------------------
+    # Chargement
+    # --------------------------------------------------------------------------
+    def _read_generation(self) -> int:
+        try:
+            return int(self.generation_path.read_text(encoding="utf-8") or 0)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError):
+            return -1  # illisible => relecture de l'état
+
+    def _fresh(self) -> bool:
+        return self._loaded and self._read_generation() == self._generation
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_path, "a+") as fh:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+    @contextmanager
+    def _writing(self):
+        """
+        Écriture: RLock + flock exclusif, état relu s'il a changé ailleurs, génération incrémentée.
+        """
+        with self._lock, self._file_lock(exclusive=True):
+            if not self._fresh():
+                self._load_locked()
+            try:
+                yield
+            finally:
+                generation = max(self._generation, 0) + 1
+                tmp = self.generation_path.with_name(self.generation_path.name + ".tmp")
+                tmp.write_text(str(generation), encoding="utf-8")
+                os.replace(tmp, self.generation_path)
+                self._generation = generation
+
+    def load(self) -> None:
+        if self._fresh():
+            return
+        with self._lock:
+            if self._fresh():
+                return
+            with self._file_lock(exclusive=False):
+                self._load_locked()
+
+    def _load_locked(self) -> None:
+        """(Re)lecture complète: correspondance SQLite + memmaps (sous flock)."""
+        self._generation = self._read_generation()
+        mapping = self.repo.vector_row_map()
+        matrix = np.load(self.path, mmap_mode="r+") if self.path.exists() else None
+        scales = np.load(self.scales_path, mmap_mode="r+") if self.scales_path.exists() else None
+        full = np.load(self.full_path, mmap_mode="r+") if self.full_path.exists() else None
+        compact = self.dtype != "float32"
+        if matrix is not None and (matrix.dtype != np.dtype(self.dtype) or (
+                self.dtype == "int8" and (scales is None or scales.shape[0] < matrix.shape[0])) or (
+                compact and (full is None or full.shape != matrix.shape))):
+            # autre représentation (NOXOZ_NUMPY_INDEX_DTYPE changé, sidecar absent): repartir de zéro
+            matrix = scales = full = None
+            self._unlink_files()
+        capacity = matrix.shape[0] if matrix is not None else 0
+        stale = [row for row, _, _ in mapping if row >= capacity]
+        if stale:
+            # matrice perdue / tronquée / convertie: ces lignes seront rechargées par sync_numpy_index()
+            self.repo.write(lambda cursor: self.repo.delete_vector_rows(cursor, stale))
+            mapping = [m for m in mapping if m[0] < capacity]
+
+        # état reconstruit à part puis publié (search() lit un instantané sans verrou)
+        count = max((row for row, _, _ in mapping), default=-1) + 1
+        ids: List[Optional[str]] = [None] * count
+        rows: Dict[str, int] = {}
+        file_rows: Dict[str, Set[int]] = {}
+        live = np.zeros(capacity, dtype=bool)
+        for row, chunk_id, file_id in mapping:
+            ids[row] = chunk_id
+            rows[chunk_id] = row
+            file_rows.setdefault(file_id, set()).add(row)
+            live[row] = True
+        self._matrix = matrix
+        self._scales = scales
+        self._full = full if compact else None
+        self._count, self._ids, self._rows, self._file_rows, self._live = count, ids, rows, file_rows, live
+        self._free = [row for row in range(count - 1, -1, -1) if not live[row]]
+        self._loaded = True
+
+    @property
+    def dim(self) -> Optional[int]:
+        self.load()
+        return int(self._matrix.shape[1]) if self._matrix is not None else None
+
+    def __len__(self) -> int:
+        self.load()
+        return len(self._rows)
+
+    def chunk_ids(self) -> Set[str]:
+        self.load()
+        with self._lock:
+            return set(self._rows)
+
+    # --------------------------------------------------------------------------
+    # Écritures
+    # --------------------------------------------------------------------------
+    def _unlink_files(self) -> None:
+        for path in (self.path, self.scales_path, self.full_path):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _grow_file(self, path: Path, current: Optional[np.ndarray], shape: Tuple[int, ...], dtype: str) -> np.ndarray:
+        tmp = path.with_name(path.name + ".tmp")
+        grown = np.lib.format.open_memmap(tmp, mode="w+", dtype=dtype, shape=shape)
+        if current is not None and self._count:
+            grown[:self._count] = current[:self._count]
+        grown.flush()
+        del grown
+        os.replace(tmp, path)
+        # l'ancien mapping reste valide pour les recherches en cours (fichier remplacé, pas tronqué)
+        return np.load(path, mmap_mode="r+")
+
+    def _ensure_capacity(self, rows_needed: int, dim: int) -> None:
+        capacity = self._matrix.shape[0] if self._matrix is not None else 0
+        if rows_needed <= capacity:
+            return
+        new_capacity = max(self.initial_rows, capacity * 2, rows_needed)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if self.dtype == "int8":
+            self._scales = self._grow_file(self.scales_path, self._scales, (new_capacity,), "float32")
+        if self.dtype != "float32":
+            self._full = self._grow_file(self.full_path, self._full, (new_capacity, dim), "float32")
+        self._matrix = self._grow_file(self.path, self._matrix, (new_capacity, dim), self.dtype)
+        live = np.zeros(new_capacity, dtype=bool)
+        live[:len(self._live)] = self._live
+        self._live = live
+
+    def add(self, chunk_ids: Sequence[str], embeddings, file_ids: Sequence[Optional[str]]) -> None:
+        """
+        Ajoute / remplace des vecteurs. Un chunk_id déjà indexé garde sa ligne.
+        """
+        if not chunk_ids:
+            return
+        vectors = normalize_rows(embeddings)
+        if vectors.shape[0] != len(chunk_ids):
+            raise ValueError("NumpyIndex.add: autant d'embeddings que de chunk_ids attendu")
+        with self._writing():
+            if self._matrix is not None and vectors.shape[1] != self._matrix.shape[1]:
+                raise ValueError(
+                    f"Dimension d'embedding {vectors.shape[1]} != index {self._matrix.shape[1]} "
+                    "(modèle changé: rebuild nécessaire)"
+                )
+            free = list(self._free)
+            assigned: Dict[str, int] = {}
+            rows: List[int] = []
+            next_row = self._count
+            for chunk_id in chunk_ids:
+                row = assigned.get(chunk_id, self._rows.get(chunk_id))
+                if row is None:
+                    if free:
+                        row = free.pop()
+                    else:
+                        row = next_row
+                        next_row += 1
+                assigned[chunk_id] = row
+                rows.append(row)
+            self._ensure_capacity(next_row, vectors.shape[1])
+            stored, scales = quantize(vectors, self.dtype)
+            self._matrix[np.asarray(rows)] = stored
+            self._matrix.flush()
+            if scales is not None:
+                self._scales[np.asarray(rows)] = scales
+                self._scales.flush()
+            if self._full is not None:
+                self._full[np.asarray(rows)] = vectors
+                self._full.flush()
+
+            entries = list(dict(zip(chunk_ids, zip(rows, chunk_ids, file_ids))).values())
+            self.repo.write(lambda cursor: self.repo.upsert_vector_rows(cursor, entries))
+            self._free = free
+
+            if next_row > self._count:
+                self._ids.extend([None] * (next_row - self._count))
+                self._count = next_row
+            live = self._live.copy()
+            for row, chunk_id, file_id in entries:
+                previous = self._ids[row]
+                if previous is not None and previous != chunk_id:
+                    self._rows.pop(previous, None)
+                self._ids[row] = chunk_id
+                self._rows[chunk_id] = row
+                self._file_rows.setdefault(file_id, set()).add(row)
+                live[row] = True
+            self._live = live
+
+    def _drop_rows_locked(self, rows: Iterable[int]) -> int:
+        rows = sorted({r for r in rows if r < self._count and self._live[r]})
+        if not rows:
+            return 0
+        self.repo.write(lambda cursor: self.repo.delete_vector_rows(cursor, rows))
+        live = self._live.copy()
+        for row in rows:
+            chunk_id = self._ids[row]
+            if chunk_id is not None:
+                self._rows.pop(chunk_id, None)
+            self._ids[row] = None
+            live[row] = False
+        self._live = live
+        for file_rows in self._file_rows.values():
+            file_rows.difference_update(rows)
+        # pop() depuis la fin => les plus petites lignes sont réutilisées d'abord
+        self._free = sorted(set(self._free).union(rows), reverse=True)
+        return len(rows)
+
+    def delete(self, chunk_ids: Iterable[str]) -> int:
+        with self._writing():
+            return self._drop_rows_locked(self._rows[c] for c in chunk_ids if c in self._rows)
+
+    def delete_file(self, file_id: str) -> int:
+        with self._writing():
+            return self._drop_rows_locked(self._file_rows.pop(file_id, set()))
+
+    def reset(self) -> None:
+        """
+        Vide l'index (rebuild complet ensuite via sync_numpy_index()).
+        """
+        with self._writing():
+            self._drop_rows_locked(range(self._count))
+            self._matrix = self._scales = self._full = None
+            self._live = np.zeros(0, dtype=bool)
+            self._ids, self._rows, self._file_rows, self._free, self._count = [], {}, {}, [], 0
+            self._unlink_files()
+
+    # --------------------------------------------------------------------------
+    # Recherche
+    # --------------------------------------------------------------------------
+    def search(
+        self,
+        query_embedding,
+        k: int,
+        rows: Optional[Sequence[int]] = None,
+        rescore: bool = True,
+    ) -> List[Tuple[str, float]]:
+        """
+        Top-k par similarité cosinus: [(chunk_id, score)], score décroissant.
+        rows: lignes candidates (filtres résolus en SQL) => seules ces lignes sont scannées.
+        rescore: en float16 / int8, les k * rescore_factor meilleurs candidats du premier passage
+        sont re-scorés avec leurs lignes du sidecar float32 (ordre final exact sur ces candidats).
+        """
+        self.load()
+        start = time.perf_counter()
+        with self._lock:
+            matrix, scales, full = self._matrix, self._scales, self._full
+            live, ids, count = self._live, self._ids, self._count
+        if matrix is None or count == 0 or k <= 0:
+            return []
+        q = normalize_rows(query_embedding)[0]
+        if q.shape[0] != matrix.shape[1]:
+            raise ValueError(f"Dimension de requête {q.shape[0]} != index {matrix.shape[1]}")
+
+        if rows is None:
+            candidates = np.arange(count)
+            scores = _scan(matrix, scales, q, count)
+            scores[~live[:count]] = -np.inf
+        else:
+            candidates = np.asarray(rows, dtype=np.int64)
+            candidates = candidates[candidates < count]
+            candidates = candidates[live[candidates]]
+            scores = _scan(matrix, scales, q, count, candidates) if len(candidates) else np.zeros(0, dtype=np.float32)
+
+        rescore = rescore and full is not None and self.rescore_factor > 0
+        n = min(k * self.rescore_factor if rescore else k, len(scores))
+        if n == 0:
+            return []
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top], kind="stable")]
+
+        hits: List[Tuple[str, float]] = []
+        hit_rows: List[int] = []
+        for i in top:
+            row = int(candidates[i])
+            chunk_id = ids[row] if row < len(ids) else None
+            if chunk_id is not None and np.isfinite(scores[i]):
+                hits.append((chunk_id, float(scores[i])))
+                hit_rows.append(row)
+
+        if rescore and hits:
+            # lecture des seules lignes candidates (fancy indexing sur le memmap, vecteurs déjà normalisés)
+            exact_scores = full[np.asarray(hit_rows)] @ q
+            hits = sorted(zip((c for c, _ in hits), exact_scores.tolist()), key=lambda h: h[1], reverse=True)
+            self.rescored += len(hit_rows)
+        hits = hits[:k]
+
+        self.searches += 1
+        self.search_ms.observe((time.perf_counter() - start) * 1000)
+        return hits
+
+    def stats(self) -> Dict:
+        self.load()
+        with self._lock:
+            matrix = self._matrix
+            capacity = int(matrix.shape[0]) if matrix is not None else 0
+            size = sum(p.stat().st_size for p in (self.path, self.scales_path) if p.exists())
+            full_size = self.full_path.stat().st_size if self._full is not None and self.full_path.exists() else 0
+            return {
+                "path": str(self.path),
+                "rows": len(self._rows),
+                "free_rows": len(self._free),
+                "capacity": capacity,
+                "dim": int(matrix.shape[1]) if matrix is not None else None,
+                "dtype": self.dtype,
+                "bytes": size,
+                "bytes_per_vector": round(size / capacity, 1) if capacity else None,
+                # sidecar float32 du re-score (disque, lu par lignes candidates)
+                "rescore_bytes": full_size,
+                "rescore_factor": self.rescore_factor if self.dtype != "float32" else 0,
+                "rescored": self.rescored,
+                "searches": self.searches,
+                "search_ms": self.search_ms.snapshot(),
+            }
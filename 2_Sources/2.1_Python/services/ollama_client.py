@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# PATH: services/ollama_client.py
+# Auteur: Bruno DELNOZ
+# Version: v1.1.0 – Date: 2026-02-09
+# Target usage: Client HTTP async partagé vers Ollama (/api/generate, /api/chat) avec streaming
+#
+# v1.1.0:
+# - probe(): sonde de santé sur le pool keep-alive (GET /api/tags + /api/ps en parallèle),
+#   modèles installés / chargés + latence aller-retour, timeout court (NOXOZ_OLLAMA_PROBE_TIMEOUT)
+#
+# v1.0.0:
+# - httpx.AsyncClient poolé (keep-alive HTTP) au lieu d'un subprocess "ollama run" par requête
+# - Streaming NDJSON token par token, modèle / options / keep_alive configurables
+# - Annulation: annuler la tâche ferme la connexion => Ollama arrête la génération
+# - Stats Ollama (prompt_eval_count, eval_count, durées) par requête + cumul
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from services.metrics import Histogram
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - dépendance de requirements.txt
+    httpx = None
+
+OLLAMA_URL = os.getenv("NOXOZ_OLLAMA_URL", "http://localhost:11434").rstrip("/")
+OLLAMA_MODEL = os.getenv("NOXOZ_OLLAMA_MODEL", "mistral:7b")
+OLLAMA_TIMEOUT = float(os.getenv("NOXOZ_OLLAMA_TIMEOUT", "120"))
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("NOXOZ_OLLAMA_CONNECT_TIMEOUT", "5"))
+# Durée de rétention du modèle en RAM/VRAM côté Ollama après une requête
+OLLAMA_KEEP_ALIVE = os.getenv("NOXOZ_OLLAMA_KEEP_ALIVE", "10m")
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("NOXOZ_OLLAMA_MAX_CONNECTIONS", "8"))
+# Sonde /monitor: doit rester bien sous NOXOZ_MONITOR_CHECK_TIMEOUT_S
+OLLAMA_PROBE_TIMEOUT = float(os.getenv("NOXOZ_OLLAMA_PROBE_TIMEOUT", "1.5"))
+
+_PROBE_MS_BUCKETS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+class OllamaError(RuntimeError):
+    """Erreur renvoyée par Ollama (HTTP != 200 ou champ "error" dans le flux)."""
+
+
+@dataclass
+class GenerationStats:
+    """
+    Statistiques renvoyées par Ollama dans le dernier message (done=true).
+    Les durées Ollama sont en nanosecondes: converties en ms.
+    """
+    model: str = ""
+    prompt_eval_count: int = 0
+    eval_count: int = 0
+    total_duration_ms: float = 0.0
+    load_duration_ms: float = 0.0
+    prompt_eval_duration_ms: float = 0.0
+    eval_duration_ms: float = 0.0
+    tokens_per_second: Optional[float] = None
+    done_reason: Optional[str] = None
+
+    @classmethod
+    def from_response(cls, data: Dict) -> "GenerationStats":
+        def ms(key: str) -> float:
+            return round((data.get(key) or 0) / 1e6, 2)
+
+        eval_ns = data.get("eval_duration") or 0
+        eval_count = int(data.get("eval_count") or 0)
+        return cls(
+            model=data.get("model", ""),
+            prompt_eval_count=int(data.get("prompt_eval_count") or 0),
+            eval_count=eval_count,
+            total_duration_ms=ms("total_duration"),
+            load_duration_ms=ms("load_duration"),
+            prompt_eval_duration_ms=ms("prompt_eval_duration"),
+            eval_duration_ms=ms("eval_duration"),
+            tokens_per_second=round(eval_count / (eval_ns / 1e9), 2) if eval_ns else None,
+            done_reason=data.get("done_reason"),
+        )
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+class OllamaClient:
+    """
+    Client async partagé. Un seul httpx.AsyncClient (pool de connexions keep-alive),
+    créé au premier appel dans la boucle asyncio de l'app, fermé par aclose().
+
+    - stream_generate() / stream_chat(): itérateurs async sur les messages NDJSON
+    - generate() / chat(): agrègent le flux (on_token optionnel) et renvoient texte + stats
+    """
+
+    def __init__(
+        self,
+        base_url: str = OLLAMA_URL,
+        model: str = OLLAMA_MODEL,
+        timeout: float = OLLAMA_TIMEOUT,
+        keep_alive: Optional[str] = OLLAMA_KEEP_ALIVE,
+        max_connections: int = OLLAMA_MAX_CONNECTIONS,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self.max_connections = max(1, max_connections)
+        self._client = None
+        self.requests = 0
+        self.errors = 0
+        self.cancelled = 0
+        self.prompt_tokens = 0
+        self.eval_tokens = 0
+        self.last_stats: Optional[Dict] = None
+        self.probes = 0
+        self.probe_errors = 0
+        self._probe_ms = Histogram(_PROBE_MS_BUCKETS)
+
+    # --------------------------------------------------------------------------
+    # Client HTTP
+    # --------------------------------------------------------------------------
+    def _http(self):
+        if httpx is None:
+            raise OllamaError("httpx n'est pas installé (pip install httpx)")
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                # read = silence max entre deux lignes du flux (chargement du modèle inclus),
+                # pas une borne sur la génération complète
+                timeout=httpx.Timeout(self.timeout, connect=OLLAMA_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        client, self._client = self._client, None
+        if client is not None:
+            await client.aclose()
+
+    def _payload(self, model: Optional[str], options: Optional[Dict], stream: bool, **fields: Any) -> Dict:
+        payload: Dict[str, Any] = {"model": model or self.model, "stream": stream}
+        payload.update({k: v for k, v in fields.items() if v is not None})
+        if options:
+            payload["options"] = options
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        return payload
+
+    async def _stream(self, path: str, payload: Dict) -> AsyncIterator[Dict]:
+        """
+        POST + lecture NDJSON ligne à ligne. Le dernier message (done=true)
+        alimente les stats. Annulation => la connexion est fermée (Ollama stoppe).
+        """
+        self.requests += 1
+        try:
+            async with self._http().stream("POST", path, json=payload) as response:
+                if response.status_code != 200:
+                    body = (await response.aread()).decode("utf-8", "replace")
+                    raise OllamaError(f"Ollama HTTP {response.status_code} sur {path}: {body.strip()[:500]}")
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    data = json.loads(line)
+                    if data.get("error"):
+                        raise OllamaError(f"Ollama: {data['error']}")
+                    if data.get("done"):
+                        stats = GenerationStats.from_response(data)
+                        self.prompt_tokens += stats.prompt_eval_count
+                        self.eval_tokens += stats.eval_count
+                        self.last_stats = stats.to_dict()
+                        data["stats"] = self.last_stats
+                    yield data
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        except OllamaError:
+            self.errors += 1
+            raise
+        except Exception as exc:
+            self.errors += 1
+            raise OllamaError(f"Ollama injoignable ({self.base_url}{path}): {exc}") from exc
+
+    # --------------------------------------------------------------------------
+    # /api/generate
+    # --------------------------------------------------------------------------
+    def stream_generate(
+        self,
+        prompt: str,
+        model: Optional[str] = None,
+        options: Optional[Dict] = None,
+        system: Optional[str] = None,
+    ) -> AsyncIterator[Dict]:
+        return self._stream("/api/generate", self._payload(model, options, True, prompt=prompt, system=system))
+
+    async def generate(
+        self,
+        prompt: str,
+        model: Optional[str] = None,
+        options: Optional[Dict] = None,
+        system: Optional[str] = None,
+        on_token: Optional[Callable[[str], Any]] = None,
+    ) -> Dict:
+        parts: List[str] = []
+        stats: Optional[Dict] = None
+        t0 = time.perf_counter()
+        first_token_ms = None
+        async for data in self.stream_generate(prompt, model=model, options=options, system=system):
+            token = data.get("response") or ""
+            if token:
+                if first_token_ms is None:
+                    first_token_ms = round((time.perf_counter() - t0) * 1000.0, 2)
+                parts.append(token)
+                if on_token is not None:
+                    on_token(token)
+            if data.get("done"):
+                stats = data.get("stats")
+        return {"text": "".join(parts), "stats": stats, "first_token_ms": first_token_ms}
+
+    # --------------------------------------------------------------------------
+    # /api/chat
+    # --------------------------------------------------------------------------
+    def stream_chat(
+        self,
+        messages: List[Dict],
+        model: Optional[str] = None,
+        options: Optional[Dict] = None,
+    ) -> AsyncIterator[Dict]:
+        return self._stream("/api/chat", self._payload(model, options, True, messages=messages))
+
+    async def chat(
+        self,
+        messages: List[Dict],
+        model: Optional[str] = None,
+        options: Optional[Dict] = None,
+        on_token: Optional[Callable[[str], Any]] = None,
+    ) -> Dict:
+        parts: List[str] = []
+        stats: Optional[Dict] = None
+        async for data in self.stream_chat(messages, model=model, options=options):
+            token = (data.get("message") or {}).get("content") or ""
+            if token:
+                parts.append(token)
+                if on_token is not None:
+                    on_token(token)
+            if data.get("done"):
+                stats = data.get("stats")
+        return {"message": {"role": "assistant", "content": "".join(parts)}, "stats": stats}
+
+    # --------------------------------------------------------------------------
+    # Sonde de santé (/api/tags, /api/ps)
+    # --------------------------------------------------------------------------
+    async def _get_json(self, path: str, timeout: float) -> Tuple[Optional[Dict], float]:
+        t0 = time.perf_counter()
+        response = await self._http().get(path, timeout=timeout)
+        elapsed = round((time.perf_counter() - t0) * 1000.0, 3)
+        if response.status_code == 404:
+            return None, elapsed  # Ollama ancien sans /api/ps
+        if response.status_code != 200:
+            raise OllamaError(f"Ollama HTTP {response.status_code} sur {path}")
+        return response.json(), elapsed
+
+    async def probe(self, timeout: float = OLLAMA_PROBE_TIMEOUT) -> Dict:
+        """
+        Modèles installés (/api/tags), modèles chargés en mémoire (/api/ps) et latence,
+        sur les connexions keep-alive du client partagé (pas de process, pas de nouveau TCP).
+        """
+        self.probes += 1
+        t0 = time.perf_counter()
+        try:
+            (tags, tags_ms), (ps, ps_ms) = await asyncio.gather(
+                self._get_json("/api/tags", timeout),
+                self._get_json("/api/ps", timeout),
+            )
+        except Exception as exc:
+            self.probe_errors += 1
+            error = "timeout" if httpx is not None and isinstance(exc, httpx.TimeoutException) else str(exc)
+            return {"status": "error", "endpoint": self.base_url, "error": f"Ollama injoignable: {error}"}
+        latency_ms = round((time.perf_counter() - t0) * 1000.0, 3)
+        self._probe_ms.observe(latency_ms)
+
+        models = [m.get("name", "unknown") for m in (tags or {}).get("models", [])]
+        loaded = None
+        if ps is not None:
+            loaded = [
+                {
+                    "name": m.get("name", "unknown"),
+                    "size_vram": m.get("size_vram"),
+                    "expires_at": m.get("expires_at"),
+                }
+                for m in ps.get("models", [])
+            ]
+        return {
+            "status": "ok",
+            "endpoint": self.base_url,
+            "models": models,
+            "models_count": len(models),
+            "loaded": loaded,
+            "loaded_count": len(loaded) if loaded is not None else None,
+            "latency_ms": {"total": latency_ms, "tags": tags_ms, "ps": ps_ms},
+        }
+
+    def stats(self) -> Dict:
+        return {
+            "base_url": self.base_url,
+            "model": self.model,
+            "keep_alive": self.keep_alive,
+            "max_connections": self.max_connections,
+            "requests": self.requests,
+            "errors": self.errors,
+            "cancelled": self.cancelled,
+            "prompt_tokens": self.prompt_tokens,
+            "eval_tokens": self.eval_tokens,
+            "last": self.last_stats,
+            "probes": self.probes,
+            "probe_errors": self.probe_errors,
+            "probe_ms": self._probe_ms.snapshot(),
+        }
+
+
+OLLAMA = OllamaClient()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# PATH: services/search_cache.py
+# Auteur: Bruno DELNOZ
+# Version: v1.0.0 – Date: 2026-02-09
+# Target usage: Caches en mémoire pour search_similar (embedding de query + résultats)
+#
+# v1.0.0:
+# - LRU embeddings de query, clé = (model id, query normalisée)
+# - LRU résultats, clé = (génération index, query, k, filtres)
+# - Compteur de génération bumpé par ingest_file()/purge_file() (+ stamp fichier multi-process)
+
+from __future__ import annotations
+
+import copy
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from services.embedding_cache import CACHE_DIR, normalize_text
+
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("NOXOZ_QUERY_EMBED_CACHE_SIZE", "2048"))
+SEARCH_RESULT_CACHE_SIZE = int(os.getenv("NOXOZ_SEARCH_RESULT_CACHE_SIZE", "1024"))
+
+# Stamp partagé entre process (CLI bulk ingest, workers uvicorn...): son mtime_ns
+# fait partie de la génération => une écriture ailleurs invalide aussi nos caches.
+GENERATION_STAMP = CACHE_DIR / "index.generation"
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    LRU thread-safe minimaliste (OrderedDict) avec compteurs.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = max(1, maxsize)
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else None,
+        }
+
+
+def _stamp_mtime_ns() -> int:
+    try:
+        return GENERATION_STAMP.stat().st_mtime_ns
+    except OSError:
+        return 0
+
+
+class SearchCache:
+    """
+    Regroupe les deux caches de recherche + la génération de l'index.
+    - les embeddings de query ne dépendent que du modèle => pas invalidés par l'index
+    - les résultats dépendent du contenu de l'index => clé incluant la génération
+    """
+
+    def __init__(self, embed_size: int = QUERY_EMBED_CACHE_SIZE, result_size: int = SEARCH_RESULT_CACHE_SIZE):
+        self.query_embeddings = LRUCache(embed_size)
+        self.results = LRUCache(result_size)
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    # --------------------------------------------------------------------------
+    # Génération
+    # --------------------------------------------------------------------------
+    def generation(self) -> Tuple[int, int]:
+        return self._generation, _stamp_mtime_ns()
+
+    def bump_generation(self) -> Tuple[int, int]:
+        """
+        Appelé après toute écriture dans l'index (ingest, purge, rebuild).
+        """
+        with self._lock:
+            self._generation += 1
+            try:
+                GENERATION_STAMP.parent.mkdir(parents=True, exist_ok=True)
+                GENERATION_STAMP.write_text(str(self._generation), encoding="utf-8")
+            except OSError:
+                pass
+        # les anciennes entrées ne seront plus jamais lues: on libère la mémoire
+        self.results.clear()
+        return self.generation()
+
+    # --------------------------------------------------------------------------
+    # Clés
+    # --------------------------------------------------------------------------
+    @staticmethod
+    def query_key(model_id: str, query: str) -> Tuple[str, str]:
+        return model_id, normalize_text(query)
+
+    def result_key(self, query: str, k: int, filters: Optional[Dict] = None, **extra: Any) -> Tuple:
+        filters_key = json.dumps(filters or {}, sort_keys=True, default=str)
+        extra_key = json.dumps(extra, sort_keys=True, default=str) if extra else ""
+        return self.generation(), normalize_text(query), int(k), filters_key, extra_key
+
+    # --------------------------------------------------------------------------
+    # Résultats (copies défensives: l'appelant peut muter sa liste)
+    # --------------------------------------------------------------------------
+    def get_results(self, key: Tuple) -> Optional[list]:
+        cached = self.results.get(key)
+        return copy.deepcopy(cached) if cached is not None else None
+
+    def put_results(self, key: Tuple, docs: list) -> None:
+        self.results.put(key, copy.deepcopy(docs))
+
+    def stats(self) -> Dict:
+        return {
+            "generation": list(self.generation()),
+            "query_embeddings": self.query_embeddings.stats(),
+            "results": self.results.stats(),
+        }
+
+
+SEARCH_CACHE = SearchCache()
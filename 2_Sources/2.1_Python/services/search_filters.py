@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# PATH: services/search_filters.py
+# Auteur: Bruno DELNOZ
+# Version: v1.0.1 – Date: 2026-02-09
+# Target usage: Filtres de recherche (fichier, extension, dates, langue, dernière version)
+#
+# v1.0.1:
+# - to_sql(): ingested_after / ingested_before sur f.ingested_at (epoch, comme Chroma) au lieu de
+#   f.updated_at (bougé par chaque changement de statut) => lexical / hybride = vectoriel
+#
+# v1.0.0:
+# - SearchFilters.from_dict(): validation des filtres venant de l'API
+# - to_where(): compilation en clause where Chroma (filtrage pendant le scan, pas après)
+# - to_sql(): même sémantique en SQL pour le mode lexical (documents d / files f)
+
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+FILTER_KEYS = (
+    "file_id", "ext", "original_name", "language",
+    "ingested_after", "ingested_before", "latest_only",
+)
+
+
+def _as_list(value: Any, key: str) -> List[str]:
+    if value is None or value == "" or value == []:
+        return []
+    values = value if isinstance(value, (list, tuple)) else str(value).split(",")
+    out = [str(v).strip() for v in values if str(v).strip()]
+    if not out:
+        raise ValueError(f"Filtre {key}: valeur vide")
+    return out
+
+
+def _normalize_ext(ext: str) -> str:
+    ext = ext.lower()
+    return ext if ext.startswith(".") else f".{ext}"
+
+
+def to_timestamp(value: Any) -> Optional[float]:
+    """
+    Epoch (int/float/str numérique) ou date ISO ("2026-02-01", "2026-02-01T10:00:00+00:00").
+    Date sans fuseau => UTC.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    try:
+        dt = datetime.fromisoformat(text.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"Date invalide: {value} (ISO 8601 ou epoch attendu)") from None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+@dataclass
+class SearchFilters:
+    file_ids: List[str] = field(default_factory=list)
+    exts: List[str] = field(default_factory=list)
+    original_names: List[str] = field(default_factory=list)
+    languages: List[str] = field(default_factory=list)
+    ingested_after: Optional[float] = None
+    ingested_before: Optional[float] = None
+    latest_only: bool = False
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> "SearchFilters":
+        data = dict(data or {})
+        unknown = set(data) - set(FILTER_KEYS)
+        if unknown:
+            raise ValueError(f"Filtre(s) inconnu(s): {', '.join(sorted(unknown))} (attendu: {', '.join(FILTER_KEYS)})")
+        latest = data.get("latest_only")
+        if isinstance(latest, str):
+            latest = latest.strip().lower() in ("1", "true", "yes", "on")
+        filters = cls(
+            file_ids=_as_list(data.get("file_id"), "file_id"),
+            exts=[_normalize_ext(e) for e in _as_list(data.get("ext"), "ext")],
+            original_names=_as_list(data.get("original_name"), "original_name"),
+            languages=[lang.lower() for lang in _as_list(data.get("language"), "language")],
+            ingested_after=to_timestamp(data.get("ingested_after")),
+            ingested_before=to_timestamp(data.get("ingested_before")),
+            latest_only=bool(latest),
+        )
+        if (filters.ingested_after is not None and filters.ingested_before is not None
+                and filters.ingested_after > filters.ingested_before):
+            raise ValueError("ingested_after doit précéder ingested_before")
+        return filters
+
+    def is_empty(self) -> bool:
+        return self == SearchFilters()
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+    # --------------------------------------------------------------------------
+    # Chroma
+    # --------------------------------------------------------------------------
+    def to_where(self, exclude_file_ids: Sequence[str] = ()) -> Optional[Dict]:
+        """
+        Clause where Chroma (métadonnées écrites à l'ingestion: file_id, ext, original_name,
+        language, ingested_at numérique). exclude_file_ids: versions remplacées (latest_only).
+        """
+        clauses: List[Dict] = []
+
+        def _in(key: str, values: List[str]) -> None:
+            if len(values) == 1:
+                clauses.append({key: {"$eq": values[0]}})
+            elif values:
+                clauses.append({key: {"$in": values}})
+
+        _in("file_id", self.file_ids)
+        _in("ext", self.exts)
+        _in("original_name", self.original_names)
+        _in("language", self.languages)
+        if self.ingested_after is not None:
+            clauses.append({"ingested_at": {"$gte": self.ingested_after}})
+        if self.ingested_before is not None:
+            clauses.append({"ingested_at": {"$lte": self.ingested_before}})
+        if exclude_file_ids:
+            clauses.append({"file_id": {"$nin": list(exclude_file_ids)}})
+
+        if not clauses:
+            return None
+        if len(clauses) == 1:
+            return clauses[0]
+        return {"$and": clauses}
+
+    # --------------------------------------------------------------------------
+    # SQL (mode lexical)
+    # --------------------------------------------------------------------------
+    def to_sql(self, exclude_file_ids: Sequence[str] = ()) -> Tuple[str, List[Any]]:
+        """
+        Condition SQL équivalente sur documents d / files f (f.ingested_at epoch, comme Chroma).
+        """
+        parts: List[str] = []
+        params: List[Any] = []
+
+        def _in(column: str, values: Sequence[Any], negate: bool = False) -> None:
+            if values:
+                parts.append(f"{column} {'NOT IN' if negate else 'IN'} ({', '.join('?' * len(values))})")
+                params.extend(values)
+
+        _in("d.file_id", self.file_ids)
+        _in("f.ext", self.exts)
+        _in("f.original_name", self.original_names)
+        _in("f.language", self.languages)
+        if self.ingested_after is not None:
+            parts.append("f.ingested_at >= ?")
+            params.append(self.ingested_after)
+        if self.ingested_before is not None:
+            parts.append("f.ingested_at <= ?")
+            params.append(self.ingested_before)
+        _in("d.file_id", list(exclude_file_ids), negate=True)
+        return " AND ".join(parts), params
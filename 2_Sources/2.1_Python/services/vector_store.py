@@ -4,9 +4,94 @@
 # Auteur: Bruno DELNOZ
 # Email: bruno.delnoz@protonmail.com
 # Target usage: Gestion du stockage vectoriel (Chroma) + métadonnées (SQLite) + ingestion/search pour NoXoZ_job
-# Version: v1.2.1 – Date: 2026-02-08
+# Version: v1.19.7 – Date: 2026-02-09
 #
 # CHANGELOG:
+# v1.19.7 - 2026-02-09:
+#   - Fix rebuild: fichiers dont l'extraction échoue marqués 'failed' à la bascule (ils n'ont plus
+#     ni chunks ni vecteurs; restaient 'ingested' => réupload court-circuité en already_ingested)
+# v1.19.6 - 2026-02-09:
+#   - ingest_file en erreur => files.status = 'failed' (exclu de la reprise des uploads au démarrage)
+# v1.19.5 - 2026-02-09:
+#   - ingest_file / bulk_ingest: files.ingested_at = ingested_at des métadonnées Chroma; le rebuild
+#     le reprend (plus updated_at, bougé par set_status)
+# v1.19.4 - 2026-02-09:
+#   - Fix re-score numpy float16 / int8: lu dans le sidecar float32 de NumpyIndex (lignes candidates
+#     seulement) au lieu d'un collection.get(include=["embeddings"]) Chroma par requête
+#     (~2.2 ms de plus par requête pour 40 candidats sur 20k chunks; sidecar ~0.4 ms)
+#   - Suppression de _chroma_embeddings
+# v1.19.3 - 2026-02-09:
+#   - Fix original_name: ingest_file(original_name=...) => files.original_name et métadonnée Chroma
+#     portent le nom d'upload (plus le nom by_sha256/<sha>.ext) => filtres original_name / latest_only
+#   - bulk_ingest: nom d'origine retrouvé via les copies uploads/by_name (<ts>__<sha12><ext>)
+# v1.19.2 - 2026-02-09:
+#   - Suppression de _sqlite_rebuild_documents_table_if_needed (code mort depuis les migrations
+#     versionnées de METADATA_REPO)
+# v1.19.1 - 2026-02-09:
+#   - Fix rebuild: verrou d'index (flock, index_write_lock) exclusif pendant tout le rebuild,
+#     partagé par ingest_file / purge_file / lots bulk_ingest => plus d'upload perdu au swap
+#     documents ni de fichier purgé ressuscité par la shadow
+#   - bulk_ingest: collection active relue à chaque lot (suit une bascule de rebuild)
+#   - Rebuild exposé: rebuild_index.py (CLI) + POST /api/upload/rebuild (job d'arrière-plan)
+# v1.19.0 - 2026-02-09:
+#   - Backend numpy: stockage float16 / int8 possible (NOXOZ_NUMPY_INDEX_DTYPE), meilleurs candidats
+#     re-scorés avec les embeddings pleine précision de Chroma
+# v1.18.0 - 2026-02-09:
+#   - Backend vectoriel NOXOZ_VECTOR_BACKEND: "chroma" (défaut) ou "numpy" (services/numpy_index.py:
+#     recherche exacte sur matrice memory-mappée, filtres résolus en SQL)
+#   - Backend numpy: index tenu à jour par ingest/purge/bulk/rebuild, sync_numpy_index() le
+#     (re)charge depuis Chroma (source de vérité des embeddings)
+# v1.17.0 - 2026-02-09:
+#   - Métadonnées Chroma par chunk: ext, version, ingested_at (epoch), language (si détectée)
+#   - search_similar(filters=...): SearchFilters compilés en where Chroma (ou SQL en lexical),
+#     latest_only = exclut les versions remplacées d'un même nom de fichier
+# v1.16.0 - 2026-02-09:
+#   - Index plein texte FTS5 (documents_fts) tenu à jour par ingest/purge/bulk/rebuild
+#   - search_similar(mode=...): "vector" (défaut NOXOZ_SEARCH_MODE), "lexical" (BM25 seul, sans
+#     embedding ni Chroma), "hybrid" (fusion BM25 + vecteurs par Reciprocal Rank Fusion)
+#   - backfill_fts_from_chroma(): recharge le texte des chunks déjà ingérés dans l'index
+# v1.15.0 - 2026-02-09:
+#   - ChromaManager (CHROMA): un seul PersistentClient par process + cache des collections,
+#     ouverture chronométrée au démarrage, close() au shutdown; init_chroma() s'appuie dessus
+# v1.14.0 - 2026-02-09:
+#   - Écritures SQLite via le writer unique (METADATA_REPO.write, group commit)
+#   - Suppression de _acquire_sqlite_lock (threading.Lock + fcntl) et _run_sqlite_with_retry
+# v1.13.0 - 2026-02-09:
+#   - SQLite via METADATA_REPO (services/metadata_repository.py): connexions longues par thread,
+#     migrations PRAGMA user_version jouées une fois, upserts ON CONFLICT
+#   - init_sqlite() ne rejoue plus les migrations (compat: connexion dédiée sur schéma migré)
+#   - ingest_file(): files marqué "ingesting" avant l'écriture Chroma, 1 transaction finale
+# v1.12.0 - 2026-02-09:
+#   - ingest_file(): lookup files par sha256 avant toute extraction => "already_ingested"
+#     (touch last_seen_at uniquement); reingest=True force le chemin complet
+#   - Fix reingest: purge Chroma AVANT l'ajout (supprimait les vecteurs fraîchement ajoutés)
+#   - Enregistrement resté en "ingesting" (crash) => purge + ré-ingestion complète
+# v1.11.0 - 2026-02-09:
+#   - ingest_file(file_id=...): sha256 fourni par l'appelant => pas de re-hash du fichier
+# v1.10.0 - 2026-02-09:
+#   - ingest_file(): timings par étape (hash, extract, embed, chroma_write, sqlite_write)
+#     renvoyés dans "timings_ms" (affichés dans le statut des jobs d'ingestion)
+# v1.9.0 - 2026-02-09:
+#   - bulk_ingest(): ingestion massive d'un dossier/glob (pool, gros lots, 1 transaction/lot,
+#     checkpoint de reprise) — utilisée par bulk_ingest.py
+# v1.8.0 - 2026-02-09:
+#   - rebuild_chroma_from_sqlite(): rebuild réel (pool d'extraction, embeddings par gros lots,
+#     collection shadow + bascule atomique, progression, checkpoint/reprise)
+#   - Collection active désignée par un pointeur (active_collection.json) => swap atomique
+# v1.7.0 - 2026-02-09:
+#   - search_similar: LRU embeddings de query + cache résultats (services/search_cache.py)
+#   - Génération d'index bumpée par ingest_file()/purge_file() => invalidation des résultats
+#   - search_similar: paramètre where (filtre Chroma), distance renvoyée
+#   - Fix: include=["ids"] refusé par Chroma (les ids sont toujours renvoyés)
+# v1.6.0 - 2026-02-09:
+#   - Cache disque des embeddings de chunks (services/embedding_cache.py) avant tout embed_documents
+# v1.5.0 - 2026-02-09:
+#   - Chunking réel (services/chunking.py): budget tokens + overlap, titres/paragraphes/pages
+#   - documents: colonnes char_start, char_end, token_count, page, section (migration auto)
+# v1.4.0 - 2026-02-09:
+#   - Ajout EmbeddingDispatcher: micro-batching des embed_query/embed_documents concurrents
+# v1.3.0 - 2026-02-09:
+#   - Embeddings: modèle partagé (services/embeddings.py) au lieu d'un chargement par appel
 # v1.2.1 - 2026-02-08:
 #   - Fix: export DEFAULT_COLLECTION (évite ImportError dans api/monitor.py)
 #   - Fix: migrations SQLite robustes (ALTER + fallback rebuild table si table legacy)
@@ -23,25 +108,47 @@
 ################################################################################
 
 import os
+import fcntl
 import json
 import hashlib
+import multiprocessing
 import sqlite3
+import re
 import time
+import queue
 import threading
+from concurrent.futures import Future, ProcessPoolExecutor
 from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional
+from typing import Callable, List, Dict, Tuple, Optional
 from datetime import datetime, timezone
 
 import chromadb
 
-try:
-    import fcntl
-except ImportError:  # pragma: no cover - non-POSIX platforms
-    fcntl = None
-
-# Embeddings (LangChain community)
-from langchain_community.embeddings import HuggingFaceEmbeddings
+# Embeddings: modèle partagé process-wide (voir services/embeddings.py)
+from services.embeddings import EMBEDDINGS, get_embeddings
+from services.embedding_cache import EMBED_CACHE_ENABLED, EmbeddingCache
+from services.search_cache import SEARCH_CACHE
+from services.metrics import Histogram
+from services.metadata_repository import (
+    FTS_TABLE,
+    MetadataRepository,
+    add_column as _sqlite_add_column,
+    table_columns as _sqlite_table_columns,
+    table_exists as _sqlite_table_exists,
+)
+from services.chunking import (
+    Block,
+    Chunk,
+    CHUNK_MAX_TOKENS,
+    CHUNK_OVERLAP_TOKENS,
+    chunk_blocks,
+    detect_language,
+    markdown_blocks,
+    split_paragraphs,
+)
+from services.search_filters import SearchFilters
+from services.numpy_index import NumpyIndex
 
 # Parsers basiques (déjà utilisés chez toi)
 from pypdf import PdfReader
@@ -93,6 +200,9 @@ if not _default_db.exists():
 
 METADATA_DB = _default_db
 
+# Accès SQLite long-lived + migrations versionnées (services/metadata_repository.py)
+METADATA_REPO = MetadataRepository(METADATA_DB)
+
 # Uploads (utilisé par ingestion.py pour stocker les fichiers reçus)
 UPLOADS_DIR = DATA_DIR / "uploads"
 UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
@@ -101,227 +211,317 @@ UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
 VECTORS_DIR.mkdir(parents=True, exist_ok=True)
 METADATA_DB.parent.mkdir(parents=True, exist_ok=True)
 
-SQLITE_LOCK_PATH = METADATA_DB.with_suffix(".lock")
-_SQLITE_THREAD_LOCK = threading.Lock()
+# Backend de recherche vectorielle: Chroma reste la source de vérité des embeddings;
+# "numpy" ajoute une copie memory-mappée interrogée par produit scalaire exact
+VECTOR_BACKENDS = ("chroma", "numpy")
+VECTOR_BACKEND = os.getenv("NOXOZ_VECTOR_BACKEND", "chroma")
+if VECTOR_BACKEND not in VECTOR_BACKENDS:
+    raise ValueError(f"NOXOZ_VECTOR_BACKEND inconnu: {VECTOR_BACKEND} (attendu: {', '.join(VECTOR_BACKENDS)})")
+
+NUMPY_INDEX_DIR = VECTORS_DIR.parent / "numpy_index"
+NUMPY_INDEX = NumpyIndex(NUMPY_INDEX_DIR, METADATA_REPO)
+
 
 
 # ==============================================================================
 # 2) CHROMA INIT
 # ==============================================================================
 
-def init_chroma() -> Tuple[chromadb.PersistentClient, any]:
+# Pointeur vers la collection physique active.
+# DEFAULT_COLLECTION reste le nom logique; après un rebuild, la collection active
+# est la shadow reconstruite (bascule = remplacement atomique de ce fichier).
+ACTIVE_COLLECTION_FILE = VECTORS_DIR / "active_collection.json"
+
+
+def active_collection_name() -> str:
+    try:
+        with open(ACTIVE_COLLECTION_FILE, "r", encoding="utf-8") as f:
+            name = (json.load(f) or {}).get("collection")
+        return name or DEFAULT_COLLECTION
+    except (OSError, ValueError):
+        return DEFAULT_COLLECTION
+
+
+def set_active_collection(name: str) -> None:
     """
-    Initialise Chroma en mode persistant.
-    On récupère (ou crée) la collection standard DEFAULT_COLLECTION.
+    Écrit le pointeur via fichier temporaire + os.replace (atomique sur POSIX).
     """
-    client = chromadb.PersistentClient(path=str(VECTORS_DIR))
-    collection = client.get_or_create_collection(DEFAULT_COLLECTION)
-    return client, collection
+    tmp = ACTIVE_COLLECTION_FILE.with_suffix(".json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"collection": name, "updated_at": datetime.now(timezone.utc).isoformat()}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, ACTIVE_COLLECTION_FILE)
 
 
-# ==============================================================================
-# 3) SQLITE HELPERS + MIGRATIONS
-# ==============================================================================
+class ChromaManager:
+    """
+    Client Chroma persistant partagé par tout le process (vector_store + monitor).
+    - start(): ouverture chronométrée (appelée au démarrage de l'app)
+    - collection(name): handles mis en cache par nom => suit le pointeur de
+      collection active sans rouvrir le store
+    - forget(name): à appeler après delete_collection()
+    - close(): libère le client au shutdown
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._client = None
+        self._collections: Dict[str, any] = {}
+        self._lock = threading.Lock()
+        self.startup_seconds: Optional[float] = None
+        self.opened_at: Optional[str] = None
+
+    def start(self):
+        if self._client is not None:
+            return self._client
+        with self._lock:
+            if self._client is None:
+                t0 = time.perf_counter()
+                self._client = chromadb.PersistentClient(path=str(self.path))
+                self.startup_seconds = round(time.perf_counter() - t0, 3)
+                self.opened_at = datetime.now(timezone.utc).isoformat()
+        return self._client
+
+    def client(self):
+        return self.start()
+
+    def collection(self, name: Optional[str] = None):
+        name = name or active_collection_name()
+        col = self._collections.get(name)
+        if col is None:
+            client = self.start()
+            with self._lock:
+                col = self._collections.get(name)
+                if col is None:
+                    col = client.get_or_create_collection(name)
+                    self._collections[name] = col
+        return col
+
+    def forget(self, name: str) -> None:
+        with self._lock:
+            self._collections.pop(name, None)
+
+    def close(self) -> None:
+        with self._lock:
+            client, self._client = self._client, None
+            self._collections.clear()
+        if client is None:
+            return
+        for closer in ("close", "clear_system_cache"):
+            fn = getattr(client, closer, None)
+            if callable(fn):
+                try:
+                    fn()
+                except Exception:
+                    pass
+                break
+
+    def stats(self) -> Dict:
+        return {
+            "open": self._client is not None,
+            "path": str(self.path),
+            "startup_seconds": self.startup_seconds,
+            "opened_at": self.opened_at,
+            "cached_collections": sorted(self._collections),
+        }
 
-def _sqlite_table_exists(cursor: sqlite3.Cursor, table: str) -> bool:
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?;", (table,))
-    return cursor.fetchone() is not None
 
+CHROMA = ChromaManager(VECTORS_DIR)
 
-def _sqlite_table_columns(cursor: sqlite3.Cursor, table: str) -> set[str]:
+
+def init_chroma() -> Tuple[chromadb.PersistentClient, any]:
     """
-    Retourne l'ensemble des colonnes existantes pour une table donnée.
+    Client Chroma partagé (CHROMA) + collection active (DEFAULT_COLLECTION par défaut).
+    Plus de PersistentClient par appel: le store n'est ouvert qu'une fois par process.
     """
-    cursor.execute(f"PRAGMA table_info({table});")
-    return {row[1] for row in cursor.fetchall()}  # row[1] = column name
+    return CHROMA.client(), CHROMA.collection()
 
 
-def _sqlite_add_column(cursor: sqlite3.Cursor, table: str, col: str, ddl_fragment: str) -> bool:
+def _chroma_max_batch(client) -> int:
     """
-    Ajoute une colonne si absente.
-    - ddl_fragment est la définition SQL complète SANS le nom de table
-      ex: "file_id TEXT" ou "updated_at TEXT NOT NULL DEFAULT '...'"
-    Retourne True si ajouté, False sinon.
+    Taille max d'un add() côté Chroma (dépend de la version / du backend SQLite).
     """
-    cols = _sqlite_table_columns(cursor, table)
-    if col not in cols:
-        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {ddl_fragment};")
-        return True
-    return False
+    for attr in ("get_max_batch_size", "max_batch_size"):
+        value = getattr(client, attr, None)
+        try:
+            value = value() if callable(value) else value
+            if value:
+                return int(value)
+        except Exception:
+            continue
+    return 5000
+
+
+# ==============================================================================
+# 2.1) EMBEDDINGS: micro-batching des appels concurrents
+# ==============================================================================
+
+EMBED_MAX_BATCH = int(os.getenv("NOXOZ_EMBED_MAX_BATCH", "32"))
+EMBED_MAX_WAIT_MS = float(os.getenv("NOXOZ_EMBED_MAX_WAIT_MS", "5"))
 
 
-def _sqlite_rebuild_documents_table_if_needed(conn: sqlite3.Connection, cursor: sqlite3.Cursor) -> None:
+class EmbeddingDispatcher:
     """
-    Rebuild ultra-robuste pour le cas où la table documents est legacy
-    et que les ALTER ne suffisent pas / schéma trop différent.
-    - On conserve ce qu'on peut (source_path, ingestion_date, etc.)
-    - On garantit un schéma final compatible avec le code actuel.
+    File d'attente unique devant le modèle d'embeddings.
+    - Chaque appel (query ou documents) est mis en file avec un Future
+    - Un thread dédié regroupe les demandes et fait UN forward pass par lot
+    - Flush dès que max_batch textes sont en attente OU après max_wait_ms
+    Une demande n'est jamais découpée (un gros embed_documents part seul).
     """
-    if not _sqlite_table_exists(cursor, "documents"):
-        return
 
-    cols = _sqlite_table_columns(cursor, "documents")
-    # Si on a déjà au moins chunk_id et file_id, on ne touche pas
-    if "file_id" in cols and "chunk_id" in cols and "chunk_index" in cols:
-        return
+    def __init__(self, max_batch: int = EMBED_MAX_BATCH, max_wait_ms: float = EMBED_MAX_WAIT_MS):
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: "queue.Queue[Tuple[List[str], float, Future]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.batch_size = Histogram([1, 2, 4, 8, 16, 32, 64, 128])
+        self.queue_wait_ms = Histogram([0.5, 1, 2, 5, 10, 25, 50, 100, 250])
+        self.batch_ms = Histogram([5, 10, 25, 50, 100, 250, 500, 1000, 5000])
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="embedding-dispatcher", daemon=True)
+                self._thread.start()
+
+    def _submit(self, texts: List[str]) -> Future:
+        self._ensure_started()
+        fut: Future = Future()
+        self._queue.put((texts, time.perf_counter(), fut))
+        return fut
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self._submit(list(texts)).result()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._submit([text]).result()[0]
+
+    def _collect_batch(self) -> List[Tuple[List[str], float, Future]]:
+        first = self._queue.get()
+        batch = [first]
+        pending = len(first[0])
+        deadline = time.perf_counter() + self.max_wait
+        while pending < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            pending += len(item[0])
+        return batch
 
-    # Crée une nouvelle table clean
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS documents_new (
-            chunk_id TEXT PRIMARY KEY,
-            file_id TEXT,
-            chunk_index INTEGER,
-            source_path TEXT,
-            ingestion_date TEXT
-        )
-    """)
+    def _run(self) -> None:
+        while True:
+            batch = self._collect_batch()
+            started = time.perf_counter()
+            for _, enqueued_at, _ in batch:
+                self.queue_wait_ms.observe((started - enqueued_at) * 1000.0)
 
-    # Heuristique: map anciennes colonnes possibles -> nouvelles
-    # cas vu dans tes anciens snippets: documents(id, filename, source, ingestion_date)
-    # On essaye de récupérer un "source_path"
-    source_col = None
-    for c in ("source_path", "source", "path", "filepath", "file_path"):
-        if c in cols:
-            source_col = c
-            break
-
-    ingestion_col = "ingestion_date" if "ingestion_date" in cols else None
-
-    # On copie ce qu'on peut (sans chunk_id/file_id, on crée des placeholder uniques)
-    # chunk_id doit être unique: on utilise rowid
-    if source_col or ingestion_col:
-        select_parts = []
-        if source_col:
-            select_parts.append(f"{source_col}")
-        else:
-            select_parts.append("NULL")
-        if ingestion_col:
-            select_parts.append(f"{ingestion_col}")
-        else:
-            select_parts.append("NULL")
-
-        cursor.execute(f"SELECT rowid, {', '.join(select_parts)} FROM documents;")
-        rows = cursor.fetchall()
-        now = datetime.now(timezone.utc).isoformat()
+            all_texts: List[str] = []
+            for texts, _, _ in batch:
+                all_texts.extend(texts)
+            self.batch_size.observe(len(all_texts))
 
-        for row in rows:
-            rowid = row[0]
-            src = row[1]
-            ing = row[2] if len(row) > 2 else None
-            # chunk_id placeholder: legacy_<rowid>
-            chunk_id = f"legacy_{rowid}"
-            cursor.execute("""
-                INSERT OR IGNORE INTO documents_new (chunk_id, file_id, chunk_index, source_path, ingestion_date)
-                VALUES (?, ?, ?, ?, ?)
-            """, (chunk_id, None, None, src, ing or now))
-
-    # Swap
-    cursor.execute("DROP TABLE documents;")
-    cursor.execute("ALTER TABLE documents_new RENAME TO documents;")
-    conn.commit()
-def init_sqlite() -> Tuple[sqlite3.Connection, sqlite3.Cursor]:
+            try:
+                vectors = get_embeddings().embed_documents(all_texts)
+            except Exception as exc:
+                self.batch_ms.observe((time.perf_counter() - started) * 1000.0)
+                for _, _, fut in batch:
+                    fut.set_exception(exc)
+                continue
+            self.batch_ms.observe((time.perf_counter() - started) * 1000.0)
+
+            offset = 0
+            for texts, _, fut in batch:
+                fut.set_result(vectors[offset:offset + len(texts)])
+                offset += len(texts)
+
+    def stats(self) -> Dict:
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "queue_depth": self._queue.qsize(),
+            "batch_size": self.batch_size.snapshot(),
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+            "batch_ms": self.batch_ms.snapshot(),
+        }
+
+
+EMBEDDING_DISPATCHER = EmbeddingDispatcher()
+
+# Cache disque (model id + sha256 du texte normalisé) devant le dispatcher
+EMBEDDING_CACHE: Optional[EmbeddingCache] = (
+    EmbeddingCache(EMBEDDINGS.model_name) if EMBED_CACHE_ENABLED else None
+)
+
+
+def embed_chunk_texts(texts: List[str]) -> List[List[float]]:
     """
-    Initialise SQLite et applique des migrations AUTOMATIQUES si l'ancienne base
-    existe avec un schéma incomplet (ex: pas de colonne updated_at).
+    Embeddings de chunks: cache disque d'abord, modèle seulement pour les misses.
     """
-    conn = sqlite3.connect(METADATA_DB, timeout=30)
-    conn.execute("PRAGMA journal_mode=WAL;")
-    conn.execute("PRAGMA busy_timeout = 30000;")
-    conn.execute("PRAGMA foreign_keys = ON;")
-    cursor = conn.cursor()
+    if EMBEDDING_CACHE is None:
+        return EMBEDDING_DISPATCHER.embed_documents(texts)
+    return EMBEDDING_CACHE.embed_documents(texts, EMBEDDING_DISPATCHER.embed_documents)
 
-    # --------------------------------------------------------------------------
-    # Table FILES (création si absente)
-    # --------------------------------------------------------------------------
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS files (
-            file_id TEXT PRIMARY KEY,
-            original_name TEXT NOT NULL,
-            stored_path TEXT NOT NULL,
-            ext TEXT,
-            size_bytes INTEGER,
-            sha256 TEXT,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            last_seen_at TEXT,
-            version INTEGER NOT NULL DEFAULT 1,
-            status TEXT NOT NULL DEFAULT 'ingested'
-        )
-    """)
 
-    # --------------------------------------------------------------------------
-    # Table DOCUMENTS (création si absente)
-    # --------------------------------------------------------------------------
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS documents (
-            chunk_id TEXT PRIMARY KEY,
-            file_id TEXT,
-            chunk_index INTEGER,
-            source_path TEXT,
-            ingestion_date TEXT
-        )
-    """)
+# ==============================================================================
+# 2.2) VERROU D'ÉCRITURE DE L'INDEX (ingest / purge / bulk vs rebuild)
+# ==============================================================================
 
-    # --------------------------------------------------------------------------
-    # MIGRATIONS: FILES (si table existante ancienne / incomplète)
-    # --------------------------------------------------------------------------
-    if _sqlite_table_exists(cursor, "files"):
-        # Ajoute les colonnes manquantes (sinon: "no such column: updated_at", etc.)
-        _sqlite_add_column(cursor, "files", "original_name", "original_name TEXT")
-        _sqlite_add_column(cursor, "files", "original_filename", "original_filename TEXT")
-        _sqlite_add_column(cursor, "files", "stored_path", "stored_path TEXT")
-        _sqlite_add_column(cursor, "files", "ext", "ext TEXT")
-        _sqlite_add_column(cursor, "files", "size_bytes", "size_bytes INTEGER")
-        _sqlite_add_column(cursor, "files", "sha256", "sha256 TEXT")
-
-        _sqlite_add_column(cursor, "files", "created_at", "created_at TEXT")
-        _sqlite_add_column(cursor, "files", "updated_at", "updated_at TEXT")
-        _sqlite_add_column(cursor, "files", "last_seen_at", "last_seen_at TEXT")
-
-        _sqlite_add_column(cursor, "files", "version", "version INTEGER NOT NULL DEFAULT 1")
-        _sqlite_add_column(cursor, "files", "status", "status TEXT NOT NULL DEFAULT 'ingested'")
-
-        # Si created_at/updated_at viennent d’être ajoutés, on les backfill (sinon NULL partout)
-        cols = _sqlite_table_columns(cursor, "files")
-        now = datetime.now(timezone.utc).isoformat()
+# flock => vaut aussi entre process (API + bulk_ingest.py + rebuild_index.py)
+INDEX_LOCK_FILE = DATA_DIR / "Cache" / "index_write.lock"
 
-        if "created_at" in cols:
-            cursor.execute("UPDATE files SET created_at = COALESCE(created_at, ?) WHERE created_at IS NULL OR created_at = '';", (now,))
-        if "updated_at" in cols:
-            cursor.execute("UPDATE files SET updated_at = COALESCE(updated_at, ?) WHERE updated_at IS NULL OR updated_at = '';", (now,))
-        if "last_seen_at" in cols:
-            cursor.execute("UPDATE files SET last_seen_at = COALESCE(last_seen_at, ?) WHERE last_seen_at IS NULL OR last_seen_at = '';", (now,))
-        if "original_filename" in cols:
-            cursor.execute(
-                "UPDATE files SET original_filename = COALESCE(original_filename, original_name) "
-                "WHERE original_filename IS NULL OR original_filename = '';"
-            )
 
-    # --------------------------------------------------------------------------
-    # MIGRATIONS: DOCUMENTS (si table existante ancienne / incomplète)
-    # --------------------------------------------------------------------------
-    if _sqlite_table_exists(cursor, "documents"):
-        _sqlite_add_column(cursor, "documents", "file_id", "file_id TEXT")
-        _sqlite_add_column(cursor, "documents", "chunk_id", "chunk_id TEXT")
-        _sqlite_add_column(cursor, "documents", "chunk_index", "chunk_index INTEGER")
-        _sqlite_add_column(cursor, "documents", "source_path", "source_path TEXT")
-        _sqlite_add_column(cursor, "documents", "ingestion_date", "ingestion_date TEXT")
+@contextmanager
+def index_write_lock(exclusive: bool = False):
+    """
+    Verrou lecteurs/écrivain sur les écritures de l'index (Chroma + documents + FTS):
+    - partagé: ingest_file, purge_file, lots de bulk_ingest (concurrents entre eux)
+    - exclusif: rebuild_chroma_from_sqlite, pendant tout le rebuild => aucune écriture
+      perdue (DELETE FROM documents au swap) ni ressuscitée (purge pendant le rebuild)
+    Un fd par acquisition: deux threads du même process ne partagent pas le verrou.
+    """
+    INDEX_LOCK_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with open(INDEX_LOCK_FILE, "a") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
 
-    # Index (safe)
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_documents_file_id ON documents(file_id)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_documents_chunk_id ON documents(chunk_id)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_files_updated_at ON files(updated_at)")
 
-    conn.commit()
-    return conn, cursor
+# ==============================================================================
+# 3) SQLITE HELPERS + MIGRATIONS
+# ==============================================================================
+
+def init_sqlite() -> Tuple[sqlite3.Connection, sqlite3.Cursor]:
+    """
+    Compat: connexion DÉDIÉE (à fermer par l'appelant) sur un schéma migré.
+    Les migrations ne sont plus rejouées ici (une fois par process via METADATA_REPO).
+    Préférer METADATA_REPO.connection() (lectures) / METADATA_REPO.write() (écritures).
+    """
+    METADATA_REPO.migrate()
+    conn = sqlite3.connect(METADATA_DB, timeout=30)
+    conn.execute("PRAGMA busy_timeout = 30000;")
+    conn.execute("PRAGMA foreign_keys = ON;")
+    return conn, conn.cursor()
+
 
 def ensure_sqlite_schema() -> None:
     """
     Helper safe: juste “assure que le schéma existe”.
-    Utile si un endpoint ouvre SQLite ailleurs : il doit appeler ça une fois.
+    Migrations jouées au premier appel du process, no-op ensuite.
     """
-    conn, _ = init_sqlite()
-    conn.close()
+    METADATA_REPO.migrate()
 
 
 # ==============================================================================
@@ -362,65 +562,13 @@ def upsert_file_record(
     bump_version: bool = False,
 ):
     """
-    Upsert d'une ligne dans files.
+    Upsert d'une ligne dans files (INSERT ... ON CONFLICT, voir metadata_repository).
     - bump_version=True => version = version+1 si déjà présent
     """
-    now = datetime.now(timezone.utc).isoformat()
-    cols = _sqlite_table_columns(cursor, "files")
-    has_original_filename = "original_filename" in cols
-    has_last_seen_at = "last_seen_at" in cols
-
-    cursor.execute("SELECT version FROM files WHERE file_id = ?;", (file_id,))
-    row = cursor.fetchone()
-
-    if row is None:
-        if has_original_filename and has_last_seen_at:
-            cursor.execute("""
-                INSERT INTO files (file_id, original_name, original_filename, stored_path, ext, size_bytes, sha256, created_at, updated_at, last_seen_at, version, status)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (file_id, original_name, original_name, stored_path, ext, size_bytes, sha256, now, now, now, 1, status))
-        elif has_original_filename:
-            cursor.execute("""
-                INSERT INTO files (file_id, original_name, original_filename, stored_path, ext, size_bytes, sha256, created_at, updated_at, version, status)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (file_id, original_name, original_name, stored_path, ext, size_bytes, sha256, now, now, 1, status))
-        elif has_last_seen_at:
-            cursor.execute("""
-                INSERT INTO files (file_id, original_name, stored_path, ext, size_bytes, sha256, created_at, updated_at, last_seen_at, version, status)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (file_id, original_name, stored_path, ext, size_bytes, sha256, now, now, now, 1, status))
-        else:
-            cursor.execute("""
-                INSERT INTO files (file_id, original_name, stored_path, ext, size_bytes, sha256, created_at, updated_at, version, status)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (file_id, original_name, stored_path, ext, size_bytes, sha256, now, now, 1, status))
-    else:
-        current_version = int(row[0]) if row[0] is not None else 1
-        new_version = (current_version + 1) if bump_version else current_version
-        if has_original_filename and has_last_seen_at:
-            cursor.execute("""
-                UPDATE files
-                SET original_name = ?, original_filename = ?, stored_path = ?, ext = ?, size_bytes = ?, sha256 = ?, updated_at = ?, last_seen_at = ?, version = ?, status = ?
-                WHERE file_id = ?
-            """, (original_name, original_name, stored_path, ext, size_bytes, sha256, now, now, new_version, status, file_id))
-        elif has_original_filename:
-            cursor.execute("""
-                UPDATE files
-                SET original_name = ?, original_filename = ?, stored_path = ?, ext = ?, size_bytes = ?, sha256 = ?, updated_at = ?, version = ?, status = ?
-                WHERE file_id = ?
-            """, (original_name, original_name, stored_path, ext, size_bytes, sha256, now, new_version, status, file_id))
-        elif has_last_seen_at:
-            cursor.execute("""
-                UPDATE files
-                SET original_name = ?, stored_path = ?, ext = ?, size_bytes = ?, sha256 = ?, updated_at = ?, last_seen_at = ?, version = ?, status = ?
-                WHERE file_id = ?
-            """, (original_name, stored_path, ext, size_bytes, sha256, now, now, new_version, status, file_id))
-        else:
-            cursor.execute("""
-                UPDATE files
-                SET original_name = ?, stored_path = ?, ext = ?, size_bytes = ?, sha256 = ?, updated_at = ?, version = ?, status = ?
-                WHERE file_id = ?
-            """, (original_name, stored_path, ext, size_bytes, sha256, now, new_version, status, file_id))
+    MetadataRepository.upsert_file(
+        cursor, file_id, original_name, stored_path, ext, size_bytes, sha256,
+        status=status, bump_version=bump_version,
+    )
 
 
 def delete_file_records(cursor: sqlite3.Cursor, file_id: str):
@@ -428,71 +576,116 @@ def delete_file_records(cursor: sqlite3.Cursor, file_id: str):
     Supprime les métadonnées SQLite liées à un file_id.
     (La purge Chroma doit être faite séparément.)
     """
-    cursor.execute("DELETE FROM documents WHERE file_id = ?;", (file_id,))
-    cursor.execute("DELETE FROM files WHERE file_id = ?;", (file_id,))
-
-
-def _run_sqlite_with_retry(operation, max_retries: int = 6, base_delay: float = 0.2):
-    """
-    Exécute une opération SQLite avec retry si "database is locked".
-    """
-    last_err = None
-    for attempt in range(max_retries):
-        try:
-            return operation()
-        except sqlite3.OperationalError as exc:
-            if "database is locked" not in str(exc).lower():
-                raise
-            last_err = exc
-            time.sleep(base_delay * (2 ** attempt))
-    if last_err is not None:
-        raise last_err
-
-
-@contextmanager
-def _acquire_sqlite_lock():
-    """
-    Verrouille l'accès aux écritures SQLite (thread + process).
-    """
-    _SQLITE_THREAD_LOCK.acquire()
-    lock_file = None
-    try:
-        if fcntl is not None:
-            SQLITE_LOCK_PATH.parent.mkdir(parents=True, exist_ok=True)
-            lock_file = open(SQLITE_LOCK_PATH, "a+")
-            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
-        yield
-    finally:
-        if fcntl is not None and lock_file is not None:
-            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
-            lock_file.close()
-        _SQLITE_THREAD_LOCK.release()
+    MetadataRepository.delete_file(cursor, file_id)
 
 
 # ==============================================================================
-# 5) LOADERS: extraction texte (simple, 1 chunk par fichier)
+# 5) LOADERS: extraction texte -> blocs -> chunks (budget tokens)
 # ==============================================================================
 
-def load_file_text(file_path: str) -> List[str]:
+_DOCX_HEADING_STYLES = ("heading", "titre", "title")
+
+
+def extract_blocks(file_path: str) -> List[Block]:
     """
-    Charge le contenu texte d'un fichier.
-    Retourne une liste de chunks (ici: 1 chunk = 1 doc complet).
-    Tu pourras améliorer plus tard (splitters).
+    Extrait le texte d'un fichier en blocs structurés:
+    - PDF: paragraphes, page par page (la page sert de frontière de chunk)
+    - DOCX: paragraphes, styles "Heading/Titre" => titres
+    - MD: titres (#) + paragraphes
+    - TXT/JSON/XML: paragraphes (ligne vide)
     """
     ext = Path(file_path).suffix.lower()
     if ext == ".pdf":
         reader = PdfReader(file_path)
-        return ["\n".join([page.extract_text() or "" for page in reader.pages])]
+        blocks: List[Block] = []
+        for page_no, page in enumerate(reader.pages, start=1):
+            blocks.extend(split_paragraphs(page.extract_text() or "", page=page_no))
+        return blocks
     elif ext == ".docx":
         doc = docx.Document(file_path)
-        return ["\n".join([p.text for p in doc.paragraphs])]
-    elif ext in [".md", ".txt", ".json", ".xml"]:
+        blocks = []
+        for p in doc.paragraphs:
+            if not p.text.strip():
+                continue
+            style = (p.style.name if p.style is not None else "") or ""
+            kind = "heading" if style.lower().startswith(_DOCX_HEADING_STYLES) else "paragraph"
+            blocks.append(Block(p.text, kind))
+        return blocks
+    elif ext == ".md":
         with open(file_path, "r", encoding="utf-8") as f:
-            return [f.read()]
+            return markdown_blocks(f.read())
+    elif ext in [".txt", ".json", ".xml"]:
+        with open(file_path, "r", encoding="utf-8") as f:
+            return split_paragraphs(f.read())
     else:
         raise ValueError(f"Format non supporté: {ext}")
 
 
+def load_file_chunks(
+    file_path: str,
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+) -> List[Chunk]:
+    """
+    Chunks (texte + offsets + page/section) prêts pour les embeddings.
+    """
+    _, chunks = chunk_blocks(extract_blocks(file_path), max_tokens, overlap_tokens)
+    return chunks
+
+
+def load_file_text(file_path: str) -> List[str]:
+    """
+    Charge le contenu texte d'un fichier.
+    Retourne la liste des textes de chunks (voir load_file_chunks pour les offsets).
+    """
+    return [c.text for c in load_file_chunks(file_path)]
+
+
+def _file_metadata(
+    ext: Optional[str], version: Optional[int], ingested_at: Optional[float], language: Optional[str]
+) -> Dict:
+    """
+    Métadonnées de niveau fichier recopiées sur chaque chunk (cibles des filtres de recherche).
+    """
+    meta = {"ext": ext, "version": version, "ingested_at": ingested_at, "language": language}
+    return {k: v for k, v in meta.items() if v is not None and v != ""}
+
+
+def _iso_to_epoch(value: Optional[str]) -> Optional[float]:
+    try:
+        return datetime.fromisoformat(value).timestamp() if value else None
+    except ValueError:
+        return None
+
+
+def _file_language(chunks: List[Chunk]) -> Optional[str]:
+    return detect_language(" ".join(c.text for c in chunks[:20]))
+
+
+def _chunk_metadata(
+    file_id: str, source: str, original_name: str, chunk: Chunk, file_meta: Optional[Dict] = None
+) -> Dict:
+    """
+    Métadonnées Chroma d'un chunk (Chroma refuse les valeurs None).
+    """
+    meta = {
+        "file_id": file_id,
+        "source": source,
+        "chunk_index": chunk.index,
+        "original_name": original_name,
+        "char_start": chunk.char_start,
+        "char_end": chunk.char_end,
+        "token_count": chunk.token_count,
+    }
+    if chunk.page is not None:
+        meta["page"] = chunk.page
+    if chunk.section:
+        meta["section"] = chunk.section
+    if file_meta:
+        meta.update(file_meta)
+    return meta
+
+
 # ==============================================================================
 # 6) INGESTION: Chroma + SQLite (avec file_id stable)
 # ==============================================================================
@@ -501,6 +694,8 @@ def ingest_file(
     file_path: str,
     reingest: bool = False,
     bump_version: bool = False,
+    file_id: Optional[str] = None,
+    original_name: Optional[str] = None,
 ) -> Dict:
     """
     Ingestion d'un fichier sur disque:
@@ -510,103 +705,160 @@ def ingest_file(
     - Ajout des chunks dans Chroma
     - Enregistre chunks dans SQLite (documents)
 
+    Contenu déjà ingéré (files.status = 'ingested') et reingest=False:
+      - retour immédiat {"status": "already_ingested"} sans extraction ni embeddings
+      - seul last_seen_at est mis à jour
+
     reingest=True:
       - supprime d'abord les vecteurs et rows SQLite pour ce file_id
       - puis re-crée proprement
 
     bump_version=True:
       - si même file_id reingesté / reuploadé => version++ dans files
+
+    file_id:
+      - sha256 déjà calculé par l'appelant (upload streamé) => pas de relecture pour hasher
+
+    original_name:
+      - nom d'upload (files.original_name + métadonnée Chroma, base de latest_only);
+        défaut: nom du fichier sur disque
+
+    Verrou d'index partagé pendant tout l'appel: attend la fin d'un rebuild en cours.
     """
+    with index_write_lock():
+        try:
+            return _ingest_file(file_path, reingest, bump_version, file_id, original_name)
+        except Exception:
+            _mark_ingest_failed(file_path, file_id, original_name)
+            raise
+
+
+def _mark_ingest_failed(file_path: str, file_id: Optional[str], original_name: Optional[str]) -> None:
+    """
+    Ingestion en erreur => files.status = 'failed': pas repris automatiquement au démarrage
+    (recover_pending_uploads), un réupload / reingest relance l'ingestion. Best-effort.
+    """
+    p = Path(file_path)
+    try:
+        fid = file_id or sha256_file(str(p))
+        size_bytes = p.stat().st_size
+        METADATA_REPO.write(lambda cursor: METADATA_REPO.upsert_file(
+            cursor, fid, original_name or p.name, str(p), p.suffix.lower(), size_bytes, fid, status="failed",
+        ))
+    except Exception:
+        pass
+
+
+def _ingest_file(
+    file_path: str,
+    reingest: bool,
+    bump_version: bool,
+    file_id: Optional[str],
+    original_name: Optional[str],
+) -> Dict:
+    timings: Dict[str, float] = {}
+    t0 = time.perf_counter()
+
+    def _lap(name: str) -> None:
+        nonlocal t0
+        now_t = time.perf_counter()
+        timings[name] = round((now_t - t0) * 1000.0, 2)
+        t0 = now_t
+
     client, collection = init_chroma()
 
     # --- identification fichier ---
     p = Path(file_path)
+    name = original_name or p.name
     ext = p.suffix.lower()
     size_bytes = p.stat().st_size if p.exists() else 0
-    file_sha = sha256_file(str(p))
+    file_sha = file_id or sha256_file(str(p))
     file_id = file_sha  # stable
+    _lap("hash")
+
+    # --- déjà ingéré ? (avant toute extraction / embedding) ---
+    known = METADATA_REPO.file_state(file_id)
+    if known is not None and known["status"] == "ingested" and not reingest:
+        # re-upload d'un contenu connu: seule trace = last_seen_at
+        METADATA_REPO.write(lambda cursor: METADATA_REPO.touch_last_seen(cursor, file_id))
+        _lap("lookup")
+        return {
+            "status": "already_ingested",
+            "file_id": file_id,
+            "file_path": str(p),
+            "stored_path": known["stored_path"],
+            "version": known["version"],
+            "chunks": known["chunks"],
+            "chunk_ids": [],
+            "timings_ms": timings,
+        }
+    # Enregistrement présent mais incomplet (crash pendant "ingesting") => on repart propre
+    purge_existing = reingest or known is not None
+    _lap("lookup")
 
     # --- extraction texte ---
-    texts = load_file_text(str(p))
-    chunk_ids = [f"{file_id}_{i}" for i in range(len(texts))]
-    metadatas = [{
-        "file_id": file_id,
-        "source": str(p),
-        "chunk_index": i,
-        "original_name": p.name,
-    } for i in range(len(texts))]
+    chunks = load_file_chunks(str(p))
+    texts = [c.text for c in chunks]
+    chunk_ids = [f"{file_id}_{c.index}" for c in chunks]
+    language = _file_language(chunks)
+    # même règle que upsert_file(): version existante (+1 si bump_version), sinon 1
+    version = (known["version"] or 1) + (1 if bump_version else 0) if known is not None else 1
+    ingested_at = time.time()
+    file_meta = _file_metadata(ext, version, ingested_at, language)
+    metadatas = [_chunk_metadata(file_id, str(p), name, c, file_meta) for c in chunks]
+    _lap("extract")
 
     # --- embeddings ---
-    embeddings_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    embeddings = embeddings_model.embed_documents(texts)
+    embeddings = embed_chunk_texts(texts)
+    _lap("embed")
+
+    # --- marque "ingesting" AVANT Chroma: un crash entre Chroma et SQLite est rattrapé
+    #     au prochain upload (purge + ré-ingestion, voir purge_existing) ---
+    def _mark_ingesting(cursor):
+        METADATA_REPO.upsert_file(
+            cursor, file_id, name, str(p), ext, size_bytes, file_sha,
+            status="ingesting", bump_version=bump_version, language=language,
+        )
+
+    METADATA_REPO.write(_mark_ingesting)
+
+    # --- purge des anciens vecteurs AVANT l'ajout (sinon on supprime ce qu'on vient d'ajouter) ---
+    if purge_existing:
+        collection.delete(where={"file_id": file_id})
+        if VECTOR_BACKEND == "numpy":
+            NUMPY_INDEX.delete_file(file_id)
 
     # --- add Chroma ---
-    collection.add(
-        documents=texts,
-        metadatas=metadatas,
-        ids=chunk_ids,
-        embeddings=embeddings,
-    )
+    if chunk_ids:
+        collection.add(
+            documents=texts,
+            metadatas=metadatas,
+            ids=chunk_ids,
+            embeddings=embeddings,
+        )
+        if VECTOR_BACKEND == "numpy":
+            NUMPY_INDEX.add(chunk_ids, embeddings, [file_id] * len(chunk_ids))
 
     # --- persist ---
     try:
         client.persist()
     except Exception:
         pass
+    _lap("chroma_write")
 
-    def _write_sqlite():
-        with _acquire_sqlite_lock():
-            conn, cursor = init_sqlite()
-            try:
-                # --- upsert metadata file ---
-                upsert_file_record(
-                    cursor=cursor,
-                    file_id=file_id,
-                    original_name=p.name,
-                    stored_path=str(p),
-                    ext=ext,
-                    size_bytes=size_bytes,
-                    sha256=file_sha,
-                    status="ingesting",
-                    bump_version=bump_version,
-                )
-                conn.commit()
-
-                # --- (optionnel) purge avant reingest ---
-                if reingest:
-                    try:
-                        cursor.execute(
-                            "SELECT chunk_id FROM documents WHERE file_id = ? AND chunk_id IS NOT NULL;",
-                            (file_id,),
-                        )
-                        existing = [r[0] for r in cursor.fetchall() if r and r[0]]
-                        if existing:
-                            collection.delete(ids=existing)
-                    except Exception:
-                        pass
-
-                    cursor.execute("DELETE FROM documents WHERE file_id = ?;", (file_id,))
-                    conn.commit()
-
-                # --- write SQLite documents ---
-                now = datetime.now(timezone.utc).isoformat()
-                for i, chunk_id in enumerate(chunk_ids):
-                    cursor.execute("""
-                        INSERT OR REPLACE INTO documents (chunk_id, file_id, chunk_index, source_path, ingestion_date)
-                        VALUES (?, ?, ?, ?, ?)
-                    """, (chunk_id, file_id, i, str(p), now))
-
-                # --- finalize status ---
-                cursor.execute(
-                    "UPDATE files SET status = ?, updated_at = ? WHERE file_id = ?;",
-                    ("ingested", now, file_id),
-                )
-
-                conn.commit()
-            finally:
-                conn.close()
-
-    _run_sqlite_with_retry(_write_sqlite)
+    def _write_sqlite(cursor):
+        now = datetime.now(timezone.utc).isoformat()
+        # --- (optionnel) purge avant reingest (vecteurs déjà purgés plus haut) ---
+        if purge_existing:
+            METADATA_REPO.delete_chunks(cursor, file_id)
+        METADATA_REPO.replace_chunks(cursor, _DOCUMENT_COLUMNS, _document_rows(file_id, str(p), chunks, now))
+        METADATA_REPO.index_chunk_texts(cursor, list(zip(chunk_ids, texts)))
+        # même ingested_at que la métadonnée Chroma: filtres de dates identiques en SQL
+        METADATA_REPO.set_status(cursor, file_id, "ingested", now, ingested_at=ingested_at)
+
+    METADATA_REPO.write(_write_sqlite)
+    SEARCH_CACHE.bump_generation()
+    _lap("sqlite_write")
 
     return {
         "status": "ok",
@@ -614,6 +866,7 @@ def ingest_file(
         "file_path": str(p),
         "chunks": len(texts),
         "chunk_ids": chunk_ids,
+        "timings_ms": timings,
     }
 
 
@@ -621,36 +874,364 @@ def ingest_file(
 # 7) SEARCH: similarité Chroma (embeddings calculés côté client)
 # ==============================================================================
 
-def search_similar(query: str, k: int = 5) -> List[Dict]:
+def embed_query_cached(query: str) -> List[float]:
+    """
+    Embedding de query via LRU (clé: model id + query normalisée).
+    """
+    key = SEARCH_CACHE.query_key(EMBEDDINGS.model_name, query)
+    q_emb = SEARCH_CACHE.query_embeddings.get(key)
+    if q_emb is None:
+        q_emb = EMBEDDING_DISPATCHER.embed_query(query)
+        SEARCH_CACHE.query_embeddings.put(key, q_emb)
+    return q_emb
+
+
+SEARCH_MODES = ("vector", "hybrid", "lexical")
+SEARCH_MODE = os.getenv("NOXOZ_SEARCH_MODE", "vector")
+# Reciprocal Rank Fusion: score = somme des 1 / (RRF_K + rang)
+HYBRID_RRF_K = int(os.getenv("NOXOZ_HYBRID_RRF_K", "60"))
+# Candidats demandés à chaque moteur avant fusion (k * facteur, min 20)
+HYBRID_CANDIDATES_FACTOR = int(os.getenv("NOXOZ_HYBRID_CANDIDATES_FACTOR", "4"))
+
+_FTS_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Clés de métadonnées Chroma => colonnes de documents (filtres du mode lexical)
+_LEXICAL_FILTER_COLUMNS = {
+    "file_id": "file_id",
+    "source": "source_path",
+    "chunk_index": "chunk_index",
+    "page": "page",
+    "section": "section",
+}
+
+
+def fts_query(query: str) -> Optional[str]:
+    """
+    Requête utilisateur => expression MATCH FTS5 sûre: termes entre guillemets, en OR
+    (BM25 classe d'abord les chunks qui contiennent le plus de termes).
+    """
+    terms = list(dict.fromkeys(t.lower() for t in _FTS_TOKEN_RE.findall(query)))
+    if not terms:
+        return None
+    return " OR ".join(f'"{t}"' for t in terms)
+
+
+def _lexical_filters(where: Optional[Dict]) -> Dict:
+    """
+    Sous-ensemble des filtres Chroma applicables en SQL: égalités ({"k": v}, {"k": {"$eq": v}})
+    éventuellement combinées par $and.
     """
-    Recherche sémantique:
-    - calcule embedding de query
-    - query Chroma via query_embeddings
+    out: Dict = {}
+    if not where:
+        return out
+    for key, value in where.items():
+        if key == "$and":
+            for sub in value:
+                out.update(_lexical_filters(sub))
+            continue
+        if isinstance(value, dict):
+            if set(value) != {"$eq"}:
+                raise ValueError(f"Filtre non supporté en SQL (lexical / backend numpy): {key}={value}")
+            value = value["$eq"]
+        if key not in _LEXICAL_FILTER_COLUMNS:
+            raise ValueError(f"Filtre non supporté en SQL (lexical / backend numpy): {key}")
+        out[_LEXICAL_FILTER_COLUMNS[key]] = value
+    return out
+
+
+def _vector_search(
+    query: str, k: int, where: Optional[Dict] = None, scope: Optional[Tuple[Optional[Dict], Tuple]] = None
+) -> List[Dict]:
     """
+    Recherche vectorielle sur le backend configuré.
+    scope: (where Chroma effectif, condition SQL) de _compile_scope(); None => where seul.
+    """
+    if VECTOR_BACKEND == "numpy":
+        return _numpy_search(query, k, where, scope[1] if scope else ("", []))
+    return _chroma_search(query, k, scope[0] if scope else where)
+
+
+def _chroma_search(query: str, k: int, where: Optional[Dict] = None) -> List[Dict]:
     _, collection = init_chroma()
 
-    embeddings_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    q_emb = embeddings_model.embed_query(query)
+    q_emb = embed_query_cached(query)
 
+    query_kwargs = {}
+    if where:
+        query_kwargs["where"] = where
     results = collection.query(
         query_embeddings=[q_emb],
         n_results=k,
-        include=["metadatas", "documents", "ids"],
+        include=["metadatas", "documents", "distances"],
+        **query_kwargs,
     )
 
     docs: List[Dict] = []
     if results and results.get("documents") and results["documents"]:
-        for doc_text, meta, _id in zip(results["documents"][0], results["metadatas"][0], results["ids"][0]):
+        distances = (results.get("distances") or [[]])[0] or [None] * len(results["ids"][0])
+        for doc_text, meta, _id, dist in zip(
+            results["documents"][0], results["metadatas"][0], results["ids"][0], distances
+        ):
             docs.append({
                 "id": _id,
                 "text": doc_text,
+                "distance": dist,
                 "source": (meta or {}).get("source"),
                 "file_id": (meta or {}).get("file_id"),
                 "chunk_index": (meta or {}).get("chunk_index"),
+                "char_start": (meta or {}).get("char_start"),
+                "char_end": (meta or {}).get("char_end"),
+                "page": (meta or {}).get("page"),
+                "section": (meta or {}).get("section"),
+                "original_name": (meta or {}).get("original_name"),
+                "ext": (meta or {}).get("ext"),
+                "version": (meta or {}).get("version"),
+                "language": (meta or {}).get("language"),
             })
     return docs
 
 
+def _numpy_search(query: str, k: int, where: Optional[Dict] = None, sql: Tuple[str, List] = ("", [])) -> List[Dict]:
+    """
+    Produit scalaire exact sur la matrice NumPy. Filtres => lignes candidates résolues en SQL
+    (seules ces lignes sont scannées). distance = 1 - cosinus.
+    """
+    q_emb = embed_query_cached(query)
+    equalities = _lexical_filters(where)
+    rows = METADATA_REPO.vector_rows_matching(equalities, sql[0], sql[1]) if equalities or sql[0] else None
+    hits = NUMPY_INDEX.search(q_emb, k, rows)
+
+    meta = METADATA_REPO.chunk_rows([chunk_id for chunk_id, _ in hits])
+    no_text = [chunk_id for chunk_id, _ in hits if chunk_id in meta and meta[chunk_id]["text"] is None]
+    if no_text:
+        # SQLite sans FTS5: texte des chunks lu dans Chroma
+        _, collection = init_chroma()
+        got = collection.get(ids=no_text, include=["documents"])
+        for chunk_id, text in zip(got.get("ids") or [], got.get("documents") or []):
+            meta[chunk_id]["text"] = text
+
+    docs: List[Dict] = []
+    for chunk_id, score in hits:
+        m = meta.get(chunk_id)
+        if m is None:
+            continue  # ligne orpheline (purge en cours): ignorée
+        docs.append({
+            "id": chunk_id,
+            "text": m["text"],
+            "distance": round(1.0 - score, 6),
+            "source": m["source_path"],
+            "file_id": m["file_id"],
+            "chunk_index": m["chunk_index"],
+            "char_start": m["char_start"],
+            "char_end": m["char_end"],
+            "page": m["page"],
+            "section": m["section"],
+            "original_name": m["original_name"],
+            "ext": m["ext"],
+            "version": m["version"],
+            "language": m["language"],
+        })
+    return docs
+
+
+def _lexical_search(
+    query: str, k: int, where: Optional[Dict] = None, sql: Tuple[str, List] = ("", [])
+) -> List[Dict]:
+    """
+    BM25 sur documents_fts: ni embedding ni Chroma.
+    sql: condition issue de SearchFilters.to_sql() (même portée que le where Chroma).
+    """
+    if not METADATA_REPO.has_fts():
+        raise RuntimeError("Recherche lexicale indisponible: SQLite compilé sans FTS5")
+    match = fts_query(query)
+    if match is None:
+        return []
+    rows = METADATA_REPO.search_chunks(match, k, _lexical_filters(where), clause=sql[0], clause_params=sql[1])
+    return [{
+        "id": r["chunk_id"],
+        "text": r["text"],
+        "distance": None,
+        "bm25": r["bm25"],
+        "source": r["source_path"],
+        "file_id": r["file_id"],
+        "chunk_index": r["chunk_index"],
+        "char_start": r["char_start"],
+        "char_end": r["char_end"],
+        "page": r["page"],
+        "section": r["section"],
+        "original_name": r["original_name"],
+        "ext": r["ext"],
+        "version": r["version"],
+        "language": r["language"],
+    } for r in rows]
+
+
+def _hybrid_search(
+    query: str, k: int, where: Optional[Dict] = None, scope: Optional[Tuple[Optional[Dict], Tuple]] = None
+) -> List[Dict]:
+    """
+    Reciprocal Rank Fusion des rangs vecteur et BM25 (scores non comparables => rangs).
+    Sans FTS5: recherche vectorielle seule.
+    """
+    n = max(k * HYBRID_CANDIDATES_FACTOR, 20)
+    sql = scope[1] if scope else ("", [])
+    vector_docs = _vector_search(query, n, where, scope)
+    lexical_docs = _lexical_search(query, n, where, sql) if METADATA_REPO.has_fts() else []
+
+    fused: Dict[str, Dict] = {}
+    for ranking in (vector_docs, lexical_docs):
+        for rank, doc in enumerate(ranking, start=1):
+            entry = fused.setdefault(doc["id"], {**doc, "rrf_score": 0.0})
+            entry["rrf_score"] += 1.0 / (HYBRID_RRF_K + rank)
+            if doc.get("distance") is not None:
+                entry["distance"] = doc["distance"]
+            if doc.get("bm25") is not None:
+                entry["bm25"] = doc["bm25"]
+    docs = sorted(fused.values(), key=lambda d: d["rrf_score"], reverse=True)[:k]
+    for doc in docs:
+        doc["rrf_score"] = round(doc["rrf_score"], 6)
+    return docs
+
+
+def _as_filters(filters) -> SearchFilters:
+    if filters is None:
+        return SearchFilters()
+    if isinstance(filters, SearchFilters):
+        return filters
+    return SearchFilters.from_dict(filters)
+
+
+def _compile_scope(filters: SearchFilters, where: Optional[Dict]) -> Tuple[Optional[Dict], Tuple[str, List]]:
+    """
+    Filtres => (where Chroma effectif, condition SQL du mode lexical).
+    latest_only: versions remplacées résolues une fois dans SQLite, exclues des deux côtés.
+    """
+    exclude = METADATA_REPO.superseded_file_ids() if filters.latest_only else []
+    compiled = filters.to_where(exclude)
+    if where and compiled:
+        vector_where = {"$and": [where, compiled]}
+    else:
+        vector_where = compiled or where
+    return vector_where, filters.to_sql(exclude)
+
+
+def scoped_where(filters=None, where: Optional[Dict] = None) -> Optional[Dict]:
+    """
+    Clause where Chroma effective (exposée par l'endpoint /search pour diagnostic).
+    """
+    return _compile_scope(_as_filters(filters), where)[0]
+
+
+def search_similar(
+    query: str,
+    k: int = 5,
+    where: Optional[Dict] = None,
+    mode: Optional[str] = None,
+    filters=None,
+) -> List[Dict]:
+    """
+    Recherche de chunks:
+    - cache résultats (query, k, where, mode, filtres) valable pour la génération d'index courante
+    - mode "vector": embedding de query (LRU) + backend NOXOZ_VECTOR_BACKEND (Chroma ou NumPy)
+    - mode "lexical": BM25 FTS5 seul (termes exacts: noms de clients, codes...)
+    - mode "hybrid": fusion RRF des deux classements
+    - filters: SearchFilters ou dict (file_id, ext, original_name, language, ingested_after,
+      ingested_before, latest_only) compilés en where Chroma => filtrage pendant le scan HNSW,
+      pas de top-k global filtré après coup
+    """
+    mode = mode or SEARCH_MODE
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Mode de recherche inconnu: {mode} (attendu: {', '.join(SEARCH_MODES)})")
+    filters = _as_filters(filters)
+
+    cache_key = SEARCH_CACHE.result_key(query, k, where, mode=mode, scope=filters.to_dict())
+    cached = SEARCH_CACHE.get_results(cache_key)
+    if cached is not None:
+        return cached
+
+    scope = _compile_scope(filters, where)
+
+    if mode == "lexical":
+        docs = _lexical_search(query, k, where, scope[1])
+    elif mode == "hybrid":
+        docs = _hybrid_search(query, k, where, scope)
+    else:
+        docs = _vector_search(query, k, where, scope)
+
+    SEARCH_CACHE.put_results(cache_key, docs)
+    return docs
+
+
+def backfill_fts_from_chroma(page_size: int = 500) -> Dict:
+    """
+    Remplit documents_fts pour les chunks ingérés avant l'index plein texte
+    (le texte n'existe que dans Chroma). Idempotent: ne traite que les chunks non indexés.
+    """
+    if not METADATA_REPO.has_fts():
+        return {"status": "skipped", "reason": "fts5_unavailable"}
+    indexed, total = METADATA_REPO.fts_counts()
+    if indexed >= total:
+        return {"status": "ok", "indexed": indexed, "added": 0}
+
+    _, collection = init_chroma()
+    conn = METADATA_REPO.connection()
+    missing = [r[0] for r in conn.execute(
+        f"SELECT chunk_id FROM documents WHERE chunk_id IS NOT NULL "
+        f"AND rowid NOT IN (SELECT rowid FROM {FTS_TABLE});"
+    )]
+    added = 0
+    for i in range(0, len(missing), page_size):
+        got = collection.get(ids=missing[i:i + page_size], include=["documents"])
+        rows = [(cid, text) for cid, text in zip(got.get("ids") or [], got.get("documents") or []) if text]
+        METADATA_REPO.write(lambda cursor, rows=rows: METADATA_REPO.index_chunk_texts(cursor, rows))
+        added += len(rows)
+    SEARCH_CACHE.bump_generation()
+    return {"status": "ok", "indexed": indexed + added, "added": added}
+
+
+def fts_needs_backfill() -> bool:
+    if not METADATA_REPO.has_fts():
+        return False
+    indexed, total = METADATA_REPO.fts_counts()
+    return indexed < total
+
+
+def sync_numpy_index(reset: bool = False, page_size: int = 500) -> Dict:
+    """
+    Aligne la matrice NumPy sur documents: vecteurs manquants lus dans la collection Chroma active,
+    lignes sans chunk supprimées. reset=True: rechargement complet (après rebuild / changement de modèle).
+    """
+    if reset:
+        NUMPY_INDEX.reset()
+    _, collection = init_chroma()
+    expected = {r[0] for r in METADATA_REPO.connection().execute(
+        "SELECT chunk_id FROM documents WHERE chunk_id IS NOT NULL;"
+    )}
+    indexed = NUMPY_INDEX.chunk_ids()
+    removed = NUMPY_INDEX.delete(indexed - expected)
+    missing = sorted(expected - indexed)
+    added = 0
+    for i in range(0, len(missing), page_size):
+        got = collection.get(ids=missing[i:i + page_size], include=["embeddings", "metadatas"])
+        ids = list(got.get("ids") or [])
+        embeddings = got.get("embeddings")
+        if not ids or embeddings is None or len(embeddings) == 0:
+            continue
+        metas = got.get("metadatas") or [{}] * len(ids)
+        NUMPY_INDEX.add(ids, embeddings, [(m or {}).get("file_id") for m in metas])
+        added += len(ids)
+    SEARCH_CACHE.bump_generation()
+    return {"status": "ok", "rows": len(NUMPY_INDEX), "added": added, "removed": removed,
+            "unresolved": len(missing) - added}
+
+
+def numpy_index_needs_sync() -> bool:
+    if VECTOR_BACKEND != "numpy":
+        return False
+    missing, orphans = METADATA_REPO.vector_rows_sync_counts()
+    return bool(missing or orphans)
+
+
 # ==============================================================================
 # 8) MAINTENANCE FUTURE (stubs utiles)
 # ==============================================================================
@@ -660,41 +1241,559 @@ def purge_file(file_id: str) -> Dict:
     Purge complète d'un fichier (Chroma + SQLite).
     - Retire les vecteurs via ids connus dans SQLite
     - Supprime les rows dans SQLite
+    - Verrou d'index partagé (attend la fin d'un rebuild en cours)
     """
-    client, collection = init_chroma()
-    conn, cursor = init_sqlite()
+    with index_write_lock():
+        client, collection = init_chroma()
+        chunk_ids = METADATA_REPO.chunk_ids(file_id)
 
-    cursor.execute("SELECT chunk_id FROM documents WHERE file_id = ? AND chunk_id IS NOT NULL;", (file_id,))
-    chunk_ids = [r[0] for r in cursor.fetchall() if r and r[0]]
+        if chunk_ids:
+            try:
+                collection.delete(ids=chunk_ids)
+            except Exception:
+                pass
+        if VECTOR_BACKEND == "numpy":
+            NUMPY_INDEX.delete_file(file_id)
+
+        METADATA_REPO.write(lambda cursor: METADATA_REPO.delete_file(cursor, file_id))
 
-    if chunk_ids:
         try:
-            collection.delete(ids=chunk_ids)
+            client.persist()
         except Exception:
             pass
 
-    delete_file_records(cursor, file_id)
-    conn.commit()
-    conn.close()
+        SEARCH_CACHE.bump_generation()
+
+    return {"status": "ok", "purged_file_id": file_id, "deleted_chunks": len(chunk_ids)}
+
+
+# ==============================================================================
+# 9) REBUILD: réindexation complète depuis SQLite (shadow collection + swap)
+# ==============================================================================
+
+REBUILD_WORKERS = int(os.getenv("NOXOZ_REBUILD_WORKERS", str(min(4, os.cpu_count() or 1))))
+REBUILD_EMBED_BATCH = int(os.getenv("NOXOZ_REBUILD_EMBED_BATCH", "512"))
+REBUILD_PAGE_SIZE = 200
+REBUILD_CHECKPOINT = DATA_DIR / "Cache" / "rebuild_checkpoint.json"
 
+# État courant (lu par /api/monitor/full)
+REBUILD_STATUS: Dict = {"state": "idle"}
+
+
+def _extract_chunks_worker(path: str) -> Tuple[str, Optional[List[Chunk]], Optional[str]]:
+    """
+    Worker du pool d'extraction (process séparé => parsing PDF/DOCX en parallèle).
+    Retourne (path, chunks, erreur).
+    """
     try:
-        client.persist()
-    except Exception:
+        if not Path(path).is_file():
+            return path, None, "fichier introuvable"
+        return path, load_file_chunks(path), None
+    except Exception as exc:
+        return path, None, str(exc)
+
+
+def _extraction_pool(workers: int) -> ProcessPoolExecutor:
+    # spawn: le process parent a des threads (uvicorn, dispatcher) => fork non sûr
+    return ProcessPoolExecutor(max_workers=max(1, workers), mp_context=multiprocessing.get_context("spawn"))
+
+
+def _add_in_batches(client, collection, ids, texts, metadatas, embeddings, upsert: bool = False) -> None:
+    step = _chroma_max_batch(client)
+    write = collection.upsert if upsert else collection.add
+    for i in range(0, len(ids), step):
+        write(
+            ids=ids[i:i + step],
+            documents=texts[i:i + step],
+            metadatas=metadatas[i:i + step],
+            embeddings=embeddings[i:i + step],
+        )
+
+
+_DOCUMENT_COLUMNS = (
+    "chunk_id, file_id, chunk_index, source_path, ingestion_date, "
+    "char_start, char_end, token_count, page, section"
+)
+
+
+def _create_staging_table(cursor: sqlite3.Cursor, drop: bool) -> None:
+    if drop:
+        cursor.execute("DROP TABLE IF EXISTS documents_rebuild;")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS documents_rebuild (
+            chunk_id TEXT PRIMARY KEY,
+            file_id TEXT,
+            chunk_index INTEGER,
+            source_path TEXT,
+            ingestion_date TEXT,
+            char_start INTEGER,
+            char_end INTEGER,
+            token_count INTEGER,
+            page INTEGER,
+            section TEXT,
+            text TEXT
+        )
+    """)
+    # staging créé par une version antérieure (reprise après mise à jour)
+    if "text" not in _sqlite_table_columns(cursor, "documents_rebuild"):
+        _sqlite_add_column(cursor, "documents_rebuild", "text", "text TEXT")
+
+
+def _document_rows(file_id: str, source: str, chunks: List[Chunk], now: str) -> List[Tuple]:
+    return [
+        (f"{file_id}_{c.index}", file_id, c.index, source, now,
+         c.char_start, c.char_end, c.token_count, c.page, c.section)
+        for c in chunks
+    ]
+
+
+def _read_checkpoint() -> Optional[Dict]:
+    try:
+        with open(REBUILD_CHECKPOINT, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_checkpoint(data: Dict) -> None:
+    REBUILD_CHECKPOINT.parent.mkdir(parents=True, exist_ok=True)
+    tmp = REBUILD_CHECKPOINT.with_suffix(".json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, REBUILD_CHECKPOINT)
+
+
+def _iter_file_pages(after_file_id: str, page_size: int = REBUILD_PAGE_SIZE):
+    """
+    Parcourt la table files par pages (keyset sur file_id) => pas de snapshot
+    de lecture tenu pendant tout le rebuild, et reprise naturelle via checkpoint.
+    """
+    last = after_file_id
+    while True:
+        rows = METADATA_REPO.connection().execute(
+            "SELECT file_id, stored_path, COALESCE(original_name, '') FROM files "
+            "WHERE file_id > ? ORDER BY file_id LIMIT ?;",
+            (last, page_size),
+        ).fetchall()
+        if not rows:
+            return
+        yield rows
+        last = rows[-1][0]
+
+
+def rebuild_chroma_from_sqlite(
+    resume: bool = True,
+    workers: int = REBUILD_WORKERS,
+    embed_batch: int = REBUILD_EMBED_BATCH,
+    progress: Optional[Callable[[Dict], None]] = None,
+) -> Dict:
+    """
+    Rebuild complet de l'index vectoriel depuis la table files:
+    - extraction + chunking en parallèle (pool de process)
+    - embeddings par gros lots (cache disque d'abord)
+    - écriture dans une collection shadow (la collection active continue de servir)
+    - documents réécrits dans une table de staging (documents_rebuild)
+    - fin: bascule atomique du pointeur de collection + swap documents en 1 transaction
+
+    resume=True: reprend après le dernier file_id checkpointé (même shadow).
+    progress: callback(dict état) appelé après chaque lot.
+
+    Verrou d'index exclusif pendant tout le rebuild: les ingestions / purges (API, watcher,
+    bulk_ingest.py) attendent la bascule au lieu d'écrire dans la collection remplacée.
+    """
+    if REBUILD_STATUS.get("state") != "running":
+        REBUILD_STATUS.clear()
+        REBUILD_STATUS.update({"state": "waiting_writers"})
+    with index_write_lock(exclusive=True):
+        return _rebuild_chroma_from_sqlite(resume, workers, embed_batch, progress)
+
+
+def _rebuild_chroma_from_sqlite(
+    resume: bool,
+    workers: int,
+    embed_batch: int,
+    progress: Optional[Callable[[Dict], None]],
+) -> Dict:
+    ensure_sqlite_schema()
+    client, _ = init_chroma()
+    previous = active_collection_name()
+
+    checkpoint = _read_checkpoint() if resume else None
+    if checkpoint and checkpoint.get("shadow"):
+        shadow_name = checkpoint["shadow"]
+        after = checkpoint.get("last_file_id", "")
+        stats = checkpoint.get("stats", {})
+        failed_ids = list(checkpoint.get("failed_file_ids", []))
+    else:
+        shadow_name = f"{DEFAULT_COLLECTION}__rebuild_{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')}"
+        after = ""
+        stats = {}
+        failed_ids = []
+        try:
+            client.delete_collection(shadow_name)
+            CHROMA.forget(shadow_name)
+        except Exception:
+            pass
+
+    METADATA_REPO.write(lambda cursor: _create_staging_table(cursor, drop=not after))
+
+    shadow = CHROMA.collection(shadow_name)
+
+    total = METADATA_REPO.connection().execute("SELECT COUNT(*) FROM files;").fetchone()[0]
+
+    stats = {
+        "files_done": int(stats.get("files_done", 0)),
+        "files_failed": int(stats.get("files_failed", 0)),
+        "chunks": int(stats.get("chunks", 0)),
+    }
+    started = time.perf_counter()
+    REBUILD_STATUS.clear()
+    REBUILD_STATUS.update({
+        "state": "running",
+        "shadow": shadow_name,
+        "files_total": total,
+        "resumed_from": after or None,
+        **stats,
+    })
+    errors: List[Dict] = []
+
+    # lot en cours: fichiers complets uniquement (checkpoint = dernier file_id du lot)
+    batch_files: List[Tuple[str, str, str, List[Chunk]]] = []
+    batch_chunks = 0
+
+    def flush():
+        nonlocal batch_files, batch_chunks
+        if not batch_files:
+            return
+        ids: List[str] = []
+        texts: List[str] = []
+        metas: List[Dict] = []
+        rows: List[Tuple] = []
+        now = datetime.now(timezone.utc).isoformat()
+        attrs = METADATA_REPO.file_attributes(f[0] for f in batch_files)
+        for file_id, source, name, chunks in batch_files:
+            attr = attrs.get(file_id, {})
+            # ingested_at = dernière ingestion connue (pas la date du rebuild)
+            file_meta = _file_metadata(
+                attr.get("ext") or Path(source).suffix.lower(), attr.get("version"),
+                attr.get("ingested_at") or _iso_to_epoch(attr.get("updated_at")),
+                attr.get("language") or _file_language(chunks),
+            )
+            for c in chunks:
+                ids.append(f"{file_id}_{c.index}")
+                texts.append(c.text)
+                metas.append(_chunk_metadata(file_id, source, name or Path(source).name, c, file_meta))
+            rows.extend(
+                row + (c.text,) for row, c in zip(_document_rows(file_id, source, chunks, now), chunks)
+            )
+
+        if ids:
+            vectors = embed_chunk_texts(texts)
+            # upsert: un lot rejoué après crash ne doit pas échouer sur des ids existants
+            _add_in_batches(client, shadow, ids, texts, metas, vectors, upsert=True)
+
+        def _write_staging(cursor):
+            cursor.executemany(
+                f"INSERT OR REPLACE INTO documents_rebuild ({_DOCUMENT_COLUMNS}, text) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+        METADATA_REPO.write(_write_staging)
+
+        stats["files_done"] += len(batch_files)
+        stats["chunks"] += len(ids)
+        _write_checkpoint({
+            "shadow": shadow_name,
+            "last_file_id": batch_files[-1][0],
+            "stats": stats,
+            # extraction en erreur: marqués 'failed' à la bascule (même après reprise)
+            "failed_file_ids": failed_ids,
+            "updated_at": now,
+        })
+        elapsed = time.perf_counter() - started
+        REBUILD_STATUS.update({
+            **stats,
+            "last_file_id": batch_files[-1][0],
+            "elapsed_seconds": round(elapsed, 1),
+        })
+        if progress is not None:
+            progress(dict(REBUILD_STATUS))
+        batch_files = []
+        batch_chunks = 0
+
+    try:
+        with _extraction_pool(workers) as pool:
+            for page in _iter_file_pages(after):
+                paths = [row[1] for row in page]
+                results = pool.map(_extract_chunks_worker, paths, chunksize=4)
+                for (file_id, stored_path, name), (_, chunks, error) in zip(page, results):
+                    if error is not None:
+                        stats["files_failed"] += 1
+                        errors.append({"file_id": file_id, "path": stored_path, "error": error})
+                        if file_id not in failed_ids:
+                            failed_ids.append(file_id)
+                        continue
+                    batch_files.append((file_id, stored_path, name, chunks or []))
+                    batch_chunks += len(chunks or [])
+                    if batch_chunks >= embed_batch:
+                        flush()
+            flush()
+    except Exception as exc:
+        REBUILD_STATUS.update({"state": "failed", "error": str(exc)})
+        raise
+
+    # --- bascule: documents (1 transaction) puis pointeur Chroma (rename atomique) ---
+    def _swap_documents(cursor):
+        has_fts = _sqlite_table_exists(cursor, FTS_TABLE)
+        if has_fts:
+            cursor.execute(f"DELETE FROM {FTS_TABLE};")
+        cursor.execute("DELETE FROM documents;")
+        cursor.execute(
+            f"INSERT INTO documents ({_DOCUMENT_COLUMNS}) "
+            f"SELECT {_DOCUMENT_COLUMNS} FROM documents_rebuild;"
+        )
+        if has_fts:
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, text, chunk_id) "
+                "SELECT d.rowid, r.text, d.chunk_id FROM documents d "
+                "JOIN documents_rebuild r ON r.chunk_id = d.chunk_id WHERE r.text IS NOT NULL;"
+            )
+        cursor.execute("DROP TABLE documents_rebuild;")
+        # plus aucun chunk / vecteur pour ces fichiers: 'failed' => un réupload relance l'ingestion
+        # (pas de copie des anciens vecteurs: modèle d'embeddings possiblement changé)
+        now = datetime.now(timezone.utc).isoformat()
+        for file_id in failed_ids:
+            METADATA_REPO.set_status(cursor, file_id, "failed", now)
+
+    METADATA_REPO.write(_swap_documents)
+    set_active_collection(shadow_name)
+    SEARCH_CACHE.bump_generation()
+    if VECTOR_BACKEND == "numpy":
+        # embeddings possiblement recalculés (autre modèle): copie NumPy rechargée depuis la shadow
+        sync_numpy_index(reset=True)
+
+    if previous != shadow_name:
+        try:
+            client.delete_collection(previous)
+            CHROMA.forget(previous)
+        except Exception:
+            pass
+    try:
+        REBUILD_CHECKPOINT.unlink()
+    except OSError:
         pass
 
-    return {"status": "ok", "purged_file_id": file_id, "deleted_chunks": len(chunk_ids)}
+    result = {
+        "status": "ok",
+        "collection": shadow_name,
+        "previous_collection": previous,
+        "files_total": total,
+        **stats,
+        "errors": errors[:50],
+        "elapsed_seconds": round(time.perf_counter() - started, 1),
+    }
+    REBUILD_STATUS.clear()
+    REBUILD_STATUS.update({"state": "done", **{k: v for k, v in result.items() if k != "errors"}})
+    return result
+
+
+# ==============================================================================
+# 10) BULK INGEST: ingestion massive hors HTTP (pool + gros lots + checkpoint)
+# ==============================================================================
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".md", ".txt", ".json", ".xml")
+BULK_CHECKPOINT_DIR = DATA_DIR / "Cache" / "bulk_ingest"
+
+
+def iter_ingest_candidates(source: str) -> List[str]:
+    """
+    Fichiers supportés d'un dossier (récursif) ou d'un glob, triés (ordre stable
+    => reprise déterministe).
+    """
+    src = Path(source)
+    if src.is_dir():
+        paths = (p for p in src.rglob("*") if p.is_file())
+    elif src.is_file():
+        paths = iter([src])
+    else:
+        import glob as _glob
+        paths = (Path(p) for p in _glob.glob(source, recursive=True) if Path(p).is_file())
+    return sorted(str(p.resolve()) for p in paths if p.suffix.lower() in SUPPORTED_EXTENSIONS)
 
 
-def rebuild_chroma_from_sqlite() -> Dict:
+def _bulk_worker(path: str) -> Tuple[str, Optional[str], int, Optional[List[Chunk]], Optional[str]]:
+    """
+    Worker du pool: hash + extraction + chunking d'un fichier.
+    Retourne (path, file_id, size_bytes, chunks, erreur).
     """
-    Rebuild (concept) :
-    - Lis table files
-    - Recalcule embeddings pour chaque fichier (depuis stored_path)
-    - Réécrit collection Chroma
+    try:
+        file_id = sha256_file(path)
+        size_bytes = Path(path).stat().st_size
+        return path, file_id, size_bytes, load_file_chunks(path), None
+    except Exception as exc:
+        return path, None, 0, None, str(exc)
+
 
-    NOTE: ici c'est une ébauche. Un vrai rebuild:
-    - drop collection
-    - recreate
-    - bulk add
+_BY_NAME_COPY_RE = re.compile(r"^\d{8}_\d{6}__([0-9a-f]{12})$")
+
+
+def upload_original_names(uploads_dir: Optional[Path] = None) -> Dict[str, str]:
+    """
+    {sha256[:12]: nom d'origine} depuis les copies lisibles by_name/<stem>/<ts>__<sha12><ext>
+    écrites par store_upload() (by_sha256/<sha>.ext ne garde pas le nom).
     """
-    return {"status": "todo", "message": "rebuild_chroma_from_sqlite() non implémenté (stub)"}  # pragma: no cover
+    names: Dict[str, str] = {}
+    by_name = Path(uploads_dir or UPLOADS_DIR) / "by_name"
+    if not by_name.is_dir():
+        return names
+    for copy in by_name.glob("*/*"):
+        m = _BY_NAME_COPY_RE.match(copy.stem)
+        if m:
+            names.setdefault(m.group(1), copy.parent.name + copy.suffix.lower())
+    return names
+
+
+def default_bulk_checkpoint(source: str) -> Path:
+    tag = hashlib.sha256(str(Path(source).resolve()).encode("utf-8")).hexdigest()[:16]
+    return BULK_CHECKPOINT_DIR / f"{tag}.json"
+
+
+def bulk_ingest(
+    source: str,
+    workers: int = REBUILD_WORKERS,
+    embed_batch: int = REBUILD_EMBED_BATCH,
+    checkpoint_path: Optional[Path] = None,
+    reingest: bool = False,
+    progress: Optional[Callable[[int, int, Dict], None]] = None,
+) -> Dict:
+    """
+    Ingestion massive d'un dossier / glob, sans passer par l'API:
+    - hash + extraction + chunking dans un pool de process
+    - un seul client Chroma, embeddings par gros lots (cache disque d'abord)
+    - écritures SQLite groupées: 1 transaction par lot
+    - checkpoint JSON (chemins traités) => une reprise saute le déjà-fait
+    - contenu déjà présent dans files (même sha256) => skip, sauf reingest=True
+
+    progress: callback(fichiers_traités, total, stats) après chaque fichier.
+    """
+    ensure_sqlite_schema()
+    client = CHROMA.client()
+
+    checkpoint_path = Path(checkpoint_path) if checkpoint_path else default_bulk_checkpoint(source)
+    done: Dict[str, str] = {}
+    if checkpoint_path.exists():
+        try:
+            with open(checkpoint_path, "r", encoding="utf-8") as f:
+                done = (json.load(f) or {}).get("done", {})
+        except (OSError, ValueError):
+            done = {}
+
+    candidates = iter_ingest_candidates(source)
+    todo = [p for p in candidates if p not in done]
+    total = len(candidates)
+
+    known = METADATA_REPO.ingested_file_ids()
+    upload_names = upload_original_names()
+
+    stats = {"ingested": 0, "skipped": 0, "failed": 0, "chunks": 0, "resumed": total - len(todo)}
+    errors: List[Dict] = []
+    seen_ids: set = set()
+    batch: List[Tuple[str, str, int, List[Chunk]]] = []
+    batch_marks: Dict[str, str] = {}
+    batch_chunks = 0
+    processed = stats["resumed"]
+    started = time.perf_counter()
+
+    def save_checkpoint():
+        checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = checkpoint_path.with_suffix(".json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"source": source, "done": done, "stats": stats}, f)
+        os.replace(tmp, checkpoint_path)
+
+    def flush():
+        nonlocal batch, batch_marks, batch_chunks
+        if batch:
+            with index_write_lock():
+                # collection relue sous le verrou: un rebuild a pu basculer depuis le début
+                collection = CHROMA.collection()
+                ids: List[str] = []
+                texts: List[str] = []
+                metas: List[Dict] = []
+                rows: List[Tuple] = []
+                now = datetime.now(timezone.utc).isoformat()
+                ingested_at = time.time()
+                versions = METADATA_REPO.file_versions(b[1] for b in batch)
+                languages: Dict[str, Optional[str]] = {}
+                names: Dict[str, str] = {}
+                for path, file_id, _, chunks in batch:
+                    names[file_id] = upload_names.get(file_id[:12]) or Path(path).name
+                    languages[file_id] = _file_language(chunks)
+                    file_meta = _file_metadata(
+                        Path(path).suffix.lower(), versions.get(file_id, 1), ingested_at, languages[file_id]
+                    )
+                    for c in chunks:
+                        ids.append(f"{file_id}_{c.index}")
+                        texts.append(c.text)
+                        metas.append(_chunk_metadata(file_id, path, names[file_id], c, file_meta))
+                    rows.extend(_document_rows(file_id, path, chunks, now))
+
+                if ids:
+                    vectors = embed_chunk_texts(texts)
+                    _add_in_batches(client, collection, ids, texts, metas, vectors, upsert=True)
+                    if VECTOR_BACKEND == "numpy":
+                        NUMPY_INDEX.add(ids, vectors, [m["file_id"] for m in metas])
+
+                def _write_batch(cursor):
+                    for path, file_id, size_bytes, _ in batch:
+                        METADATA_REPO.upsert_file(
+                            cursor, file_id, names[file_id], path, Path(path).suffix.lower(),
+                            size_bytes, file_id, status="ingested", now=now, language=languages[file_id],
+                            ingested_at=ingested_at,
+                        )
+                    METADATA_REPO.replace_chunks(cursor, _DOCUMENT_COLUMNS, rows)
+                    METADATA_REPO.index_chunk_texts(cursor, list(zip(ids, texts)))
+
+                METADATA_REPO.write(_write_batch)
+                stats["ingested"] += len(batch)
+                stats["chunks"] += len(ids)
+                SEARCH_CACHE.bump_generation()
+
+        done.update(batch_marks)
+        save_checkpoint()
+        batch, batch_marks, batch_chunks = [], {}, 0
+
+    with _extraction_pool(workers) as pool:
+        for path, file_id, size_bytes, chunks, error in pool.map(_bulk_worker, todo, chunksize=4):
+            processed += 1
+            if error is not None:
+                stats["failed"] += 1
+                errors.append({"path": path, "error": error})
+                # pas de checkpoint: un échec sera retenté à la prochaine reprise
+            elif (file_id in known and not reingest) or file_id in seen_ids:
+                stats["skipped"] += 1
+                batch_marks[path] = "skipped"
+            else:
+                seen_ids.add(file_id)
+                if reingest and file_id in known:
+                    purge_file(file_id)
+                    known.discard(file_id)
+                batch.append((path, file_id, size_bytes, chunks or []))
+                batch_marks[path] = file_id
+                batch_chunks += len(chunks or [])
+                if batch_chunks >= embed_batch:
+                    flush()
+            if progress is not None:
+                progress(processed, total, stats)
+        flush()
+
+    return {
+        "status": "ok" if not errors else "partial",
+        "source": source,
+        "files_total": total,
+        **stats,
+        "errors": errors[:50],
+        "checkpoint": str(checkpoint_path),
+        "elapsed_seconds": round(time.perf_counter() - started, 1),
+    }
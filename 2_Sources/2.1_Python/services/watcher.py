@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+# PATH: services/watcher.py
+# Auteur: Bruno DELNOZ
+# Version: v1.0.2 – Date: 2026-02-09
+# Target usage: Ingestion incrémentale d'un dossier de dépôt (3_Data/inbox) surveillé en tâche de fond
+#
+# v1.0.2:
+# - Fix: au chargement de l'index, entrées dont le contenu n'est pas 'ingested' (job en erreur,
+#   annulé à l'arrêt, fichier illisible) oubliées => re-hashées et remises en file au premier scan
+#
+# v1.0.1:
+# - Fix flush(): hash, file_state et enqueue hors du verrou (lot pris puis validé sous le verrou);
+#   stats() ne reste plus bloqué pendant le hash d'un gros fichier
+# - scan(): parcours du dossier hors verrou
+#
+# v1.0.0:
+# - Événements noyau via watchfiles (inotify sous Linux) si installé, sinon polling (os.scandir)
+# - Index stat (mtime_ns, taille, inode) persisté dans SQLite (table watched_files):
+#   seuls les fichiers dont le stat a changé sont hashés
+# - Rafales absorbées: traitement quand le dossier est calme depuis NOXOZ_WATCH_DEBOUNCE_MS
+#   (ou au plus tard après NOXOZ_WATCH_MAX_WAIT_S), fichier encore en écriture => repoussé
+# - Renommage / déplacement dans le dossier (même inode + stat) => file_id repris sans re-hash
+# - Contenu déjà ingéré => index mis à jour, aucun job; sinon un job d'ingestion (services/jobs.py)
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from services.jobs import QueueFullError
+from services.metadata_repository import MetadataRepository
+
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
+
+WATCH_ENABLED = os.getenv("NOXOZ_WATCH_ENABLED", "1") == "1"
+WATCH_DIR = Path(os.getenv("NOXOZ_WATCH_DIR", str(PROJECT_ROOT / "3_Data" / "inbox")))
+# auto => watchfiles si importable, sinon polling
+WATCH_BACKENDS = ("auto", "watchfiles", "poll")
+WATCH_BACKEND = os.getenv("NOXOZ_WATCH_BACKEND", "auto")
+WATCH_POLL_S = float(os.getenv("NOXOZ_WATCH_POLL_S", "2"))
+WATCH_DEBOUNCE_MS = float(os.getenv("NOXOZ_WATCH_DEBOUNCE_MS", "1500"))
+WATCH_MAX_WAIT_S = float(os.getenv("NOXOZ_WATCH_MAX_WAIT_S", "30"))
+
+# fichiers temporaires d'éditeurs / de copies en cours: jamais ingérés
+_TEMP_SUFFIXES = (".part", ".tmp", ".crdownload", ".swp", "~")
+
+StatKey = Tuple[int, int, int]  # (mtime_ns, taille, inode)
+
+
+def stat_key(st: os.stat_result) -> StatKey:
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class DirectoryWatcher:
+    """
+    Surveille directory et transmet à enqueue(path, file_id) les fichiers nouveaux ou modifiés.
+
+    - hasher(path) -> file_id (sha256), appelé seulement si le stat diffère de l'index
+    - enqueue lève QueueFullError => fichier gardé en attente, réessayé au tour suivant
+    - fichier supprimé => sorti de l'index (le contenu ingéré reste dans Chroma / SQLite)
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        repo: MetadataRepository,
+        enqueue: Callable[[str, str], None],
+        hasher: Callable[[str], str],
+        extensions: Sequence[str],
+        debounce_s: float = WATCH_DEBOUNCE_MS / 1000.0,
+        poll_s: float = WATCH_POLL_S,
+        max_wait_s: float = WATCH_MAX_WAIT_S,
+        backend: str = WATCH_BACKEND,
+    ):
+        if backend not in WATCH_BACKENDS:
+            raise ValueError(f"NOXOZ_WATCH_BACKEND inconnu: {backend} (attendu: {', '.join(WATCH_BACKENDS)})")
+        self.directory = Path(directory).resolve()
+        self.repo = repo
+        self.enqueue = enqueue
+        self.hasher = hasher
+        self.extensions = tuple(e.lower() for e in extensions)
+        self.debounce_s = debounce_s
+        self.poll_s = poll_s
+        self.max_wait_s = max_wait_s
+        self.backend = backend
+        self.active_backend: Optional[str] = None
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # un seul flush() à la fois (lot traité hors de _lock)
+        self._index: Optional[Dict[str, Tuple[StatKey, Optional[str]]]] = None
+        self._pending: Dict[str, Tuple[StatKey, float]] = {}  # chemin -> (stat vu, 1re détection)
+        self._vanished: Dict[StatKey, str] = {}  # stat d'un fichier disparu -> file_id (renommages)
+        self._last_change = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.counters = {"scans": 0, "events": 0, "hashed": 0, "enqueued": 0, "already_ingested": 0,
+                         "renamed": 0, "removed": 0, "deferred": 0, "errors": 0}
+        self.last_error: Optional[str] = None
+
+    # --------------------------------------------------------------------------
+    # Détection (stat uniquement, aucun contenu lu)
+    # --------------------------------------------------------------------------
+    def _wanted(self, name: str) -> bool:
+        if name.startswith(".") or name.endswith(_TEMP_SUFFIXES):
+            return False
+        return os.path.splitext(name)[1].lower() in self.extensions
+
+    def _stat_tree(self, root: Path) -> Dict[str, StatKey]:
+        found: Dict[str, StatKey] = {}
+        stack = [str(root)]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as it:
+                    for entry in it:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if not entry.name.startswith("."):
+                                    stack.append(entry.path)
+                            elif entry.is_file() and self._wanted(entry.name):
+                                found[entry.path] = stat_key(entry.stat())
+                        except OSError:
+                            continue  # fichier disparu entre listing et stat
+            except OSError:
+                continue
+        return found
+
+    def _loaded_index(self) -> Dict[str, Tuple[StatKey, Optional[str]]]:
+        if self._index is None:
+            index = self.repo.watched_files(str(self.directory))
+            statuses = self.repo.file_statuses(file_id for _, file_id in index.values())
+            # stat connu mais contenu jamais ingéré (le job a échoué / été annulé après enqueue):
+            # entrée oubliée => le fichier repasse par flush() au prochain scan
+            self._index = {
+                path: entry for path, entry in index.items()
+                if entry[1] is not None and statuses.get(entry[1]) == "ingested"
+            }
+        return self._index
+
+    def _observe(self, seen: Dict[str, StatKey], gone: Iterable[str], now: float) -> None:
+        index = self._loaded_index()
+        removed: List[str] = []
+        for path in gone:
+            self._pending.pop(path, None)
+            entry = index.pop(path, None)
+            if entry is not None:
+                removed.append(path)
+                if entry[1]:
+                    self._vanished[entry[0]] = entry[1]
+        for path, key in seen.items():
+            known = index.get(path)
+            if known is not None and known[0] == key:
+                self._pending.pop(path, None)
+                continue
+            pending = self._pending.get(path)
+            if pending is None or pending[0] != key:
+                self._pending[path] = (key, pending[1] if pending else now)
+                self._last_change = now
+        if removed:
+            self.counters["removed"] += len(removed)
+            self.repo.write(lambda cur: MetadataRepository.delete_watched_files(cur, removed))
+
+    def scan(self, now: Optional[float] = None) -> int:
+        """
+        Parcours complet (démarrage, backend polling). Retourne le nombre de fichiers en attente.
+        """
+        now = time.monotonic() if now is None else now
+        # parcours du dossier hors verrou (stat seulement, aucun état partagé)
+        seen = self._stat_tree(self.directory) if self.directory.is_dir() else {}
+        with self._lock:
+            self.counters["scans"] += 1
+            gone = [p for p in self._loaded_index() if p not in seen]
+            self._observe(seen, gone, now)
+            return len(self._pending)
+
+    def touch(self, paths: Iterable[str], now: Optional[float] = None) -> int:
+        """
+        Chemins signalés par le noyau (watchfiles): seuls ceux-ci (et leurs sous-dossiers) sont re-statés.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            seen: Dict[str, StatKey] = {}
+            gone: List[str] = []
+            for raw in paths:
+                path = os.path.abspath(raw)
+                self.counters["events"] += 1
+                if os.path.isdir(path):
+                    seen.update(self._stat_tree(Path(path)))
+                    continue
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    # fichier ou dossier supprimé / renommé: toutes les entrées en dessous
+                    prefix = path + os.sep
+                    gone.extend(p for p in self._loaded_index() if p == path or p.startswith(prefix))
+                    gone.extend(p for p in self._pending if p == path or p.startswith(prefix))
+                    continue
+                if self._wanted(os.path.basename(path)):
+                    seen[path] = stat_key(st)
+            self._observe(seen, gone, now)
+            return len(self._pending)
+
+    # --------------------------------------------------------------------------
+    # Traitement (hash + mise en file d'ingestion)
+    # --------------------------------------------------------------------------
+    def flush(self, now: Optional[float] = None, force: bool = False) -> Dict[str, int]:
+        """
+        Traite les fichiers en attente si le dossier est calme (debounce) ou si l'attente
+        la plus ancienne dépasse max_wait_s. force=True ignore le debounce.
+
+        Hash / file_state / enqueue hors de self._lock (stats(), scan(), touch() jamais bloqués
+        par un gros fichier): lot pris sous le verrou, traité, puis validé sous le verrou.
+        """
+        now = time.monotonic() if now is None else now
+        done = {"enqueued": 0, "already_ingested": 0, "renamed": 0, "deferred": 0, "errors": 0}
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    self._vanished.clear()
+                    return done
+                quiet = now - self._last_change >= self.debounce_s
+                overdue = now - min(first for _, first in self._pending.values()) >= self.max_wait_s
+                if not (force or quiet or overdue):
+                    return done
+
+                ready: List[Tuple[str, StatKey, Optional[str]]] = []
+                for path, (key, first) in sorted(self._pending.items()):
+                    try:
+                        current = stat_key(os.stat(path))
+                    except OSError:
+                        del self._pending[path]
+                        continue
+                    if current != key:
+                        # encore en cours d'écriture: on attend le prochain tour calme
+                        self._pending[path] = (current, first)
+                        self._last_change = now
+                        continue
+                    ready.append((path, key, self._vanished.pop(key, None)))
+
+            # sans verrou: lecture du contenu, SQLite, file d'ingestion
+            results: List[Tuple[str, StatKey, Optional[str]]] = []
+            hashed = 0
+            for i, (path, key, file_id) in enumerate(ready):
+                try:
+                    if file_id is not None:
+                        done["renamed"] += 1
+                    else:
+                        file_id = self.hasher(path)
+                        hashed += 1
+                        state = self.repo.file_state(file_id)
+                        if state is not None and state["status"] == "ingested":
+                            done["already_ingested"] += 1
+                        else:
+                            self.enqueue(path, file_id)
+                            done["enqueued"] += 1
+                except QueueFullError:
+                    # file d'ingestion pleine: le reste attend le prochain tour
+                    done["deferred"] += len(ready) - i
+                    break
+                except Exception as exc:
+                    # illisible / erreur inattendue: indexé quand même (réessayé si le fichier change
+                    # ou au redémarrage, voir _loaded_index)
+                    done["errors"] += 1
+                    self.last_error = f"{path}: {exc}"
+                    file_id = None
+                results.append((path, key, file_id))
+
+            with self._lock:
+                index = self._loaded_index()
+                rows: List[Tuple[str, int, int, int, Optional[str]]] = []
+                for path, key, file_id in results:
+                    pending = self._pending.get(path)
+                    if pending is None or pending[0] != key:
+                        continue  # supprimé / modifié pendant le traitement: touch() / scan() a pris le relais
+                    del self._pending[path]
+                    index[path] = (key, file_id)
+                    rows.append((path, *key, file_id))
+
+                if not self._pending:
+                    self._vanished.clear()
+                if rows:
+                    self.repo.write(lambda cur: MetadataRepository.upsert_watched_files(cur, rows))
+                self.counters["hashed"] += hashed
+                for name, value in done.items():
+                    self.counters[name] += value
+        return done
+
+    # --------------------------------------------------------------------------
+    # Thread de surveillance
+    # --------------------------------------------------------------------------
+    def _resolve_backend(self) -> str:
+        if self.backend != "auto":
+            return self.backend
+        try:
+            import watchfiles  # noqa: F401
+            return "watchfiles"
+        except ImportError:
+            return "poll"
+
+    def _run_poll(self) -> None:
+        self.active_backend = "poll"
+        while not self._stop.is_set():
+            self.scan()
+            self.flush()
+            self._stop.wait(self.poll_s)
+
+    def _run_watchfiles(self) -> None:
+        import watchfiles
+
+        self.active_backend = "watchfiles"
+        # fichiers déposés pendant que le service était arrêté
+        self.scan()
+        self.flush()
+        for changes in watchfiles.watch(
+            self.directory,
+            stop_event=self._stop,
+            debounce=int(self.debounce_s * 1000),
+            rust_timeout=int(self.poll_s * 1000),
+            yield_on_timeout=True,  # lot vide => flush() du debounce même sans nouvel événement
+            raise_interrupt=False,
+        ):
+            if changes:
+                self.touch(path for _, path in changes)
+            self.flush()
+
+    def _run(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        backend = self._resolve_backend()
+        try:
+            if backend == "watchfiles":
+                try:
+                    self._run_watchfiles()
+                    return
+                except Exception as exc:
+                    # ex: limite inotify atteinte => on bascule en polling
+                    self.last_error = f"watchfiles: {exc}"
+            self._run_poll()
+        except Exception as exc:
+            self.counters["errors"] += 1
+            self.last_error = str(exc)
+            self.active_backend = None
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="noxoz-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+        self.active_backend = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            pending = len(self._pending)
+            indexed = len(self._index) if self._index is not None else None
+        return {
+            "enabled": self._thread is not None and self._thread.is_alive(),
+            "directory": str(self.directory),
+            "backend": self.active_backend or self.backend,
+            "debounce_ms": round(self.debounce_s * 1000),
+            "poll_s": self.poll_s,
+            "pending": pending,
+            "indexed": indexed,
+            **self.counters,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,62 @@
+import unittest
+
+from services.chunking import Block, approx_token_count, chunk_blocks, detect_language, markdown_blocks
+
+
+def _count(text: str) -> int:
+    # Compteur déterministe (pas de tokenizer HF en test)
+    return approx_token_count(text)
+
+
+class TestChunking(unittest.TestCase):
+    def test_offsets_point_into_full_text(self):
+        md = "# CV\n\nIntro.\n\n## Expérience\n\n" + "\n\n".join(
+            f"Mission {i}: " + "python fastapi sqlite " * 20 for i in range(8)
+        )
+        full, chunks = chunk_blocks(markdown_blocks(md), max_tokens=120, overlap_tokens=30, count=_count)
+
+        self.assertGreater(len(chunks), 1)
+        for i, chunk in enumerate(chunks):
+            self.assertEqual(chunk.index, i)
+            self.assertEqual(full[chunk.char_start:chunk.char_end], chunk.text)
+            self.assertLessEqual(chunk.token_count, 120)
+
+    def test_heading_starts_new_chunk(self):
+        md = "# A\n\nalpha beta.\n\n# B\n\ngamma delta."
+        _, chunks = chunk_blocks(markdown_blocks(md), max_tokens=200, overlap_tokens=0, count=_count)
+
+        self.assertEqual([c.section for c in chunks], ["A", "B"])
+        self.assertTrue(chunks[1].text.startswith("# B"))
+
+    def test_pdf_pages_are_boundaries(self):
+        blocks = [Block("page one text.", page=1), Block("page two text.", page=2)]
+        _, chunks = chunk_blocks(blocks, max_tokens=200, overlap_tokens=0, count=_count)
+
+        self.assertEqual([c.page for c in chunks], [1, 2])
+
+    def test_oversized_paragraph_is_split_with_overlap(self):
+        text = " ".join(f"Phrase numéro {i} du paragraphe." for i in range(200))
+        _, chunks = chunk_blocks([Block(text)], max_tokens=64, overlap_tokens=16, count=_count)
+
+        self.assertGreater(len(chunks), 5)
+        self.assertTrue(all(c.token_count <= 64 for c in chunks))
+        # overlap: chaque chunk démarre avant la fin du précédent
+        for prev, cur in zip(chunks, chunks[1:]):
+            self.assertLess(cur.char_start, prev.char_end)
+
+    def test_oversized_numeric_block_is_kept(self):
+        text = " ".join(["12345678"] * 400)
+        full, chunks = chunk_blocks([Block(text)], max_tokens=64, overlap_tokens=0, count=_count)
+
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(sum(c.text.count("12345678") for c in chunks), 400)
+        self.assertTrue(all(c.token_count <= 64 for c in chunks))
+
+    def test_detect_language(self):
+        self.assertEqual(detect_language("Je suis ingénieur et je travaille dans le cloud pour les clients de la banque."), "fr")
+        self.assertEqual(detect_language("I am an engineer and I work with the cloud for the clients of the bank."), "en")
+        self.assertIsNone(detect_language("Kubernetes CKA AWS"))
+
+
+if __name__ == "__main__":
+    unittest.main()
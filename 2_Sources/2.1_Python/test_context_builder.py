@@ -0,0 +1,39 @@
+import unittest
+
+from services.context_builder import build_context, context_window, model_max_tokens, parse_model_limits
+
+
+class TestContextBuilder(unittest.TestCase):
+    def test_limits_are_read_from_documentation(self):
+        self.assertEqual(model_max_tokens("mistral:7b"), 8192)
+        self.assertEqual(model_max_tokens("tinyllama:1.1b"), 2048)
+        self.assertEqual(
+            parse_model_limits("| **foo:1b** | 1.0 | `ollama pull foo:1b` | 32,000 | test |"), {"foo:1b": 32000}
+        )
+        # num_ctx demandé plafonné à la limite du modèle
+        self.assertEqual(context_window("tinyllama:1.1b", {"num_ctx": 8192}), 2048)
+        self.assertEqual(context_window("mistral:7b", {"num_ctx": 2048}), 2048)
+
+    def test_ranked_whole_chunks_within_budget(self):
+        word = "mot " * 100
+        candidates = [
+            {"id": "far", "text": word, "distance": 0.9},
+            {"id": "near", "text": word + "a", "distance": 0.1},
+            {"id": "dup", "text": word + "a", "distance": 0.2},
+            {"id": "small", "text": "court", "distance": 0.8},
+            {"id": "mid", "text": word + "b", "distance": 0.5},
+        ]
+        # assertLogs remplace les handlers: rien n'est écrit dans 4_Logs/context_builder.log
+        with self.assertLogs("noxoz.context_builder", "INFO") as logs:
+            plan = build_context("question ?", candidates, "mistral:7b", {"num_ctx": 1024}, reserve_tokens=800)
+
+        self.assertEqual([d["id"] for d in plan.docs], ["near", "small"])
+        self.assertLessEqual(plan.used_tokens, plan.budget)
+        reasons = {d["id"]: d["reason"] for d in plan.dropped}
+        self.assertEqual(reasons, {"dup": "duplicate", "mid": "budget", "far": "budget"})
+        self.assertEqual(plan.to_dict()["num_ctx"], 1024)
+        self.assertIn("dup(duplicate,", logs.output[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
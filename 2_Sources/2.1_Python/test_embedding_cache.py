@@ -0,0 +1,66 @@
+import itertools
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from services import embedding_cache
+from services.embedding_cache import EmbeddingCache, text_key
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Path(self.tmp.name) / "embeddings.db"
+        self.embedded = []
+        # horloge strictement croissante => ordre LRU déterministe
+        clock = itertools.count(1)
+        patcher = mock.patch.object(embedding_cache.time, "time", lambda: float(next(clock)))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _embed(self, texts):
+        self.embedded.extend(texts)
+        return [[float(len(t)), 0.5] for t in texts]
+
+    def test_hits_are_keyed_on_model_and_normalized_text(self):
+        cache = EmbeddingCache("model-a", self.db)
+        first = cache.embed_documents(["Bonjour  le monde", "CV"], self._embed)
+        # espaces différents => même clé sha256 => aucun forward pass
+        again = cache.embed_documents(["Bonjour le monde ", "CV", "nouveau"], self._embed)
+        self.assertEqual(again[:2], first)
+        self.assertEqual(self.embedded, ["Bonjour  le monde", "CV", "nouveau"])
+        self.assertEqual(text_key("a  b"), text_key(" a b"))
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (2, 3, 3))
+        cache.close()
+
+    def test_model_change_does_not_reuse_entries(self):
+        EmbeddingCache("model-a", self.db).embed_documents(["CV"], self._embed)
+        other = EmbeddingCache("model-b", self.db)
+        self.assertEqual(other.get_many(["CV"]), [None])
+        other.embed_documents(["CV"], self._embed)
+        self.assertEqual(self.embedded, ["CV", "CV"])
+        other.close()
+
+    def test_lru_eviction_at_size_cap(self):
+        cache = EmbeddingCache("model-a", self.db, max_entries=10)
+        texts = [f"chunk {i}" for i in range(10)]
+        for text in texts:
+            cache.put_many([text], self._embed([text]))
+        cache.get_many(["chunk 0"])  # le plus ancien redevient récent
+        cache.put_many(["chunk 10"], self._embed(["chunk 10"]))
+
+        # 11 > 10 => éviction jusqu'à 90% (9 entrées): chunk 1 et chunk 2 sortent
+        self.assertEqual(cache.stats()["entries"], 9)
+        self.assertEqual(cache.stats()["evictions"], 2)
+        found = cache.get_many(["chunk 0", "chunk 1", "chunk 2", "chunk 3", "chunk 10"])
+        self.assertEqual([v is not None for v in found], [True, False, False, True, True])
+        cache.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import threading
+import unittest
+from unittest import mock
+
+try:
+    from services import vector_store
+except ImportError:  # chromadb / langchain / pypdf absents
+    vector_store = None
+
+
+class _StubModel:
+    """embed_documents: un vecteur dérivé du texte; échoue si le lot contient "boom"."""
+
+    def __init__(self):
+        self.batches = []
+
+    def embed_documents(self, texts):
+        self.batches.append(list(texts))
+        if "boom" in texts:
+            raise RuntimeError("forward en échec")
+        return [[float(len(t)), float(ord(t[0]))] for t in texts]
+
+
+@unittest.skipIf(vector_store is None, "dépendances de services.vector_store non installées")
+class TestEmbeddingDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.model = _StubModel()
+        patcher = mock.patch.object(vector_store, "get_embeddings", lambda: self.model)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_concurrent_calls_share_one_batch(self):
+        dispatcher = vector_store.EmbeddingDispatcher(max_batch=64, max_wait_ms=300)
+        texts = ["a", "bb", "ccc", "dddd", "eeeee"]
+        results = {}
+        barrier = threading.Barrier(len(texts))
+
+        def _call(text):
+            barrier.wait()
+            results[text] = dispatcher.embed_query(text)
+
+        threads = [threading.Thread(target=_call, args=(t,)) for t in texts]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(5)
+
+        self.assertEqual(len(self.model.batches), 1)
+        self.assertEqual(sorted(self.model.batches[0]), texts)
+        # chaque appelant reçoit le vecteur de SON texte
+        for text in texts:
+            self.assertEqual(results[text], [float(len(text)), float(ord(text[0]))])
+        self.assertEqual(dispatcher.stats()["batch_size"]["count"], 1)
+
+    def test_failing_batch_only_errors_its_own_futures(self):
+        dispatcher = vector_store.EmbeddingDispatcher(max_batch=2, max_wait_ms=1000)
+        failing = [dispatcher._submit(["boom"]), dispatcher._submit(["x"])]
+        ok = [dispatcher._submit(["yy"]), dispatcher._submit(["z", "w"])]
+
+        for fut in failing:
+            with self.assertRaises(RuntimeError):
+                fut.result(5)
+        self.assertEqual(ok[0].result(5), [[2.0, float(ord("y"))]])
+        self.assertEqual(ok[1].result(5), [[1.0, float(ord("z"))], [1.0, float(ord("w"))]])
+        self.assertEqual(self.model.batches, [["boom", "x"], ["yy", "z", "w"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import time
+import unittest
+from unittest import mock
+
+try:
+    from services import embeddings
+except ImportError:  # langchain_community absent
+    embeddings = None
+
+
+class _FlakyModel:
+    """Modèle factice: les `failures` premiers chargements échouent."""
+    failures = 0
+
+    def __init__(self, model_name):
+        if _FlakyModel.failures > 0:
+            _FlakyModel.failures -= 1
+            raise OSError("modèle introuvable")
+        self.model_name = model_name
+
+    def embed_query(self, text):
+        return [0.0, 1.0]
+
+
+@unittest.skipIf(embeddings is None, "langchain_community non installé")
+class TestEmbeddingRegistry(unittest.TestCase):
+    def _wait_warm_up(self, registry):
+        deadline = time.monotonic() + 5
+        while registry._warmup_thread is not None and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_failed_warm_up_is_retried(self):
+        _FlakyModel.failures = 1
+        with mock.patch.object(embeddings, "HuggingFaceEmbeddings", _FlakyModel):
+            registry = embeddings.EmbeddingRegistry("stub", retry_s=0.05)
+            registry.start_warm_up()
+            self._wait_warm_up(registry)
+            self.assertFalse(registry.is_ready())
+            self.assertIn("introuvable", registry.stats()["error"])
+
+            # trop tôt: pas de nouvelle tentative
+            registry.start_warm_up()
+            self.assertIsNone(registry._warmup_thread)
+
+            time.sleep(0.06)
+            registry.start_warm_up()
+            self.assertIsNone(registry.stats()["error"])
+            self._wait_warm_up(registry)
+            self.assertTrue(registry.is_ready())
+
+    def test_get_after_failure_loads_and_warms_up(self):
+        _FlakyModel.failures = 1
+        with mock.patch.object(embeddings, "HuggingFaceEmbeddings", _FlakyModel):
+            registry = embeddings.EmbeddingRegistry("stub", retry_s=0)
+            registry.warm_up()
+            self.assertFalse(registry.is_ready())
+            self.assertEqual(registry.get().model_name, "stub")
+            self._wait_warm_up(registry)
+            self.assertTrue(registry.is_ready())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import asyncio
+import tempfile
+import threading
+import types
+import unittest
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+
+from test_ollama_client import _StubOllama
+
+try:
+    from api.endpoints import generate
+    from services import generation
+    from services.ollama_client import OllamaClient
+except ImportError:  # fastapi / chromadb / docx absents
+    generate = None
+
+
+class _FakeRequest:
+    """Seul is_disconnected() est utilisé par le flux SSE."""
+
+    def __init__(self):
+        self.disconnected = False
+
+    async def is_disconnected(self):
+        return self.disconnected
+
+
+def _no_context(prompt, model, options):
+    return types.SimpleNamespace(docs=[], to_dict=lambda: {}), dict(options or {})
+
+
+@unittest.skipIf(generate is None, "dépendances de api.endpoints.generate non installées")
+class TestSseDisconnect(unittest.IsolatedAsyncioTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _StubOllama)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    async def asyncSetUp(self):
+        _StubOllama.disconnected.clear()
+        self.client = OllamaClient(base_url=f"http://127.0.0.1:{self.server.server_address[1]}", model="slow")
+        self.scheduler = generation.GenerationScheduler(concurrency=1, queue_max=4)
+        for target, name, value in (
+            (generation, "OLLAMA", self.client),
+            (generation, "GENERATION_SCHEDULER", self.scheduler),
+            (generation, "_retrieve_context", _no_context),
+            (generate, "SSE_DISCONNECT_POLL_S", 0.05),
+        ):
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.request = _FakeRequest()
+
+    async def asyncTearDown(self):
+        await self.client.aclose()
+
+    def _body(self):
+        response = generate._sse_response(self.request, "long", "default", "slow", None, cache=False)
+        return response.body_iterator
+
+    async def _drain(self, body):
+        return [event async for event in body]
+
+    async def test_disconnect_mid_stream_closes_ollama_and_releases_slot(self):
+        body = self._body()
+        events = [await body.__anext__() for _ in range(3)]
+        self.assertEqual([e.split("\n")[0] for e in events], ["event: retrieval", "event: scheduled", "event: token"])
+
+        self.request.disconnected = True
+        self.assertEqual(await asyncio.wait_for(self._drain(body), 2), [])
+
+        # connexion HTTP fermée => Ollama arrête de générer
+        await asyncio.to_thread(_StubOllama.disconnected.wait, 5)
+        self.assertTrue(_StubOllama.disconnected.is_set())
+        self.assertEqual(self.scheduler.stats()["running"], 0)
+        self.assertEqual(self.scheduler.counters["cancelled"], 1)
+        self.assertEqual(self.client.stats()["cancelled"], 1)
+
+    async def test_disconnect_while_queued_is_noticed(self):
+        async with self.scheduler.slot():
+            body = self._body()
+            self.assertTrue((await body.__anext__()).startswith("event: retrieval"))
+            # le slot unique est pris: la génération attend en file, aucun événement n'arrive
+            self.request.disconnected = True
+            self.assertEqual(await asyncio.wait_for(self._drain(body), 2), [])
+            self.assertEqual(self.scheduler.queued(), 0)
+            self.assertEqual(self.scheduler.counters["cancelled"], 1)
+        self.assertEqual(self.scheduler.stats()["running"], 0)
+        self.assertEqual(self.client.stats()["requests"], 0)
+
+
+
+@unittest.skipIf(generate is None, "dépendances de api.endpoints.generate non installées")
+class TestWriteDocx(unittest.TestCase):
+    def test_same_template_same_second_gets_distinct_files(self):
+        from docx import Document
+
+        with tempfile.TemporaryDirectory() as tmp, mock.patch.object(generation, "OUTPUT_DIR", Path(tmp)):
+            first = generation.write_docx("première génération", "cv")
+            second = generation.write_docx("seconde génération", "cv")
+            self.assertNotEqual(first, second)
+            self.assertEqual(Document(first).paragraphs[0].text, "première génération")
+            self.assertEqual(Document(second).paragraphs[0].text, "seconde génération")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from services.generation_cache import GenerationCache, generation_key
+
+
+class TestGenerationCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Path(self.tmp.name) / "generations.db"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_key_depends_on_context_and_model(self):
+        base = generation_key("Rédige  une lettre ", "default", [("c1", 1), ("c2", 1)], "mistral:7b", {"temperature": 0})
+        self.assertEqual(base, generation_key("Rédige une lettre", "default", [("c1", 1), ("c2", 1)],
+                                              "mistral:7b", {"temperature": 0}))
+        self.assertNotEqual(base, generation_key("Rédige une lettre", "default", [("c1", 2), ("c2", 1)],
+                                                 "mistral:7b", {"temperature": 0}))
+        self.assertNotEqual(base, generation_key("Rédige une lettre", "default", [("c1", 1), ("c2", 1)],
+                                                 "llama3:8b", {"temperature": 0}))
+        self.assertNotEqual(base, generation_key("Rédige une lettre", "cv", [("c1", 1), ("c2", 1)],
+                                                 "mistral:7b", {"temperature": 0}))
+
+    def test_roundtrip_and_counters(self):
+        cache = GenerationCache(self.db)
+        self.assertIsNone(cache.get("k"))
+        cache.put("k", "Bonjour", "/out/doc.docx", model="m", template="t", stats={"eval_count": 3})
+
+        hit = cache.get("k")
+        self.assertEqual((hit["text"], hit["file_path"]), ("Bonjour", "/out/doc.docx"))
+        self.assertEqual(hit["stats"], {"eval_count": 3})
+        self.assertEqual((cache.stats()["hits"], cache.stats()["misses"]), (1, 1))
+        cache.close()
+
+    def test_age_and_size_eviction(self):
+        cache = GenerationCache(self.db, max_entries=10, ttl_s=3600)
+        cache.put("old", "x", None)
+        cache._connect().execute("UPDATE generation_cache SET created_at = ?", (time.time() - 7200,))
+        self.assertIsNone(cache.get("old"))
+
+        for i in range(15):
+            cache.put(f"k{i}", "texte", None)
+        self.assertLessEqual(cache.stats()["entries"], 10)
+        self.assertIsNotNone(cache.get("k14"))
+        self.assertIsNone(cache.get("k0"))
+        cache.close()
+
+    def test_disabled_cache_is_a_no_op(self):
+        cache = GenerationCache(self.db, enabled=False)
+        cache.put("k", "x", None)
+        self.assertIsNone(cache.get("k"))
+        self.assertFalse(self.db.exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import asyncio
+import unittest
+
+try:
+    from services.generation import (
+        DeadlineExceededError,
+        GenerationScheduler,
+        SchedulerBusyError,
+    )
+except ImportError:  # docx / chromadb absents
+    GenerationScheduler = None
+
+
+@unittest.skipIf(GenerationScheduler is None, "dépendances de services.generation non installées")
+class TestGenerationScheduler(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrency_is_bounded(self):
+        sched = GenerationScheduler(concurrency=2, queue_max=10)
+        running = []
+        peak = 0
+
+        async def _job():
+            nonlocal peak
+            async with sched.slot():
+                running.append(1)
+                peak = max(peak, len(running))
+                await asyncio.sleep(0.02)
+                running.pop()
+
+        await asyncio.gather(*[_job() for _ in range(6)])
+        self.assertEqual(peak, 2)
+        stats = sched.stats()
+        self.assertEqual(stats["completed"], 6)
+        self.assertEqual(stats["running"], 0)
+        self.assertEqual(stats["wait_ms"]["interactive"]["count"], 6)
+
+    async def test_interactive_goes_before_batch(self):
+        sched = GenerationScheduler(concurrency=1, queue_max=10)
+        order = []
+        gate = asyncio.Event()
+
+        async def _job(name, priority):
+            async with sched.slot(priority):
+                order.append(name)
+                await gate.wait()
+
+        first = asyncio.create_task(_job("first", "batch"))
+        await asyncio.sleep(0)
+        waiting = [
+            asyncio.create_task(_job("b1", "batch")),
+            asyncio.create_task(_job("b2", "batch")),
+            asyncio.create_task(_job("i1", "interactive")),
+        ]
+        await asyncio.sleep(0.01)
+        self.assertEqual(sched.stats()["queued"], {"interactive": 1, "batch": 2})
+        gate.set()
+        await asyncio.gather(first, *waiting)
+        self.assertEqual(order, ["first", "i1", "b1", "b2"])
+
+    async def test_deadline_in_queue_and_full_queue(self):
+        sched = GenerationScheduler(concurrency=1, queue_max=1)
+        release = asyncio.Event()
+
+        async def _hold():
+            async with sched.slot():
+                await release.wait()
+
+        holder = asyncio.create_task(_hold())
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(self._enter(sched, deadline_s=0.05))
+        await asyncio.sleep(0)
+        with self.assertRaises(SchedulerBusyError):
+            await self._enter(sched)
+        with self.assertRaises(DeadlineExceededError):
+            await waiter
+        release.set()
+        await holder
+
+        stats = sched.stats()
+        self.assertEqual((stats["rejected"], stats["expired"], stats["running"]), (1, 1, 0))
+        # le slot est de nouveau libre
+        await asyncio.wait_for(self._enter(sched), 1)
+
+    @staticmethod
+    async def _enter(sched, deadline_s=None):
+        async with sched.slot(deadline_s=deadline_s):
+            pass
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from services.health_snapshot import HealthSnapshot
+
+
+class TestHealthSnapshot(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.calls = {"fast": 0, "slow": 0, "async": 0}
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+
+    def _fast(self):
+        self.calls["fast"] += 1
+        return {"status": "ok"}
+
+    def _slow(self):
+        self.calls["slow"] += 1
+        self.release.wait(2)
+        return {"status": "ok", "late": True}
+
+    async def _async(self):
+        self.calls["async"] += 1
+        await asyncio.sleep(0.01)
+        return {"status": "ok"}
+
+    async def test_checks_run_concurrently_with_timeout_then_cached(self):
+        snap = HealthSnapshot({"fast": self._fast, "slow": self._slow, "async": self._async},
+                              ttl_s=60, timeout_s=0.1, refresh_s=0)
+        t0 = time.perf_counter()
+        first = await snap.get()
+        self.assertLess(time.perf_counter() - t0, 1.0)
+        self.assertEqual(first["slow"]["status"], "timeout")
+        self.assertEqual(first["fast"]["status"], "ok")
+        self.assertEqual(first["async"]["status"], "ok")
+        self.assertFalse(first["snapshot"]["cached"])
+
+        second = await snap.get()
+        self.assertTrue(second["snapshot"]["cached"])
+        self.assertEqual(self.calls, {"fast": 1, "slow": 1, "async": 1})
+
+        # check bloqué encore en cours: repris, pas relancé
+        forced = await snap.get(force=True)
+        self.assertEqual(forced["slow"]["status"], "timeout")
+        self.assertEqual(self.calls["slow"], 1)
+        self.release.set()
+        await asyncio.sleep(0.05)
+        self.assertTrue((await snap.get(force=True))["slow"]["late"])
+
+    async def test_concurrent_readers_share_one_refresh(self):
+        snap = HealthSnapshot({"async": self._async}, ttl_s=60, refresh_s=0)
+        results = await asyncio.gather(*[snap.get() for _ in range(10)])
+        self.assertEqual(self.calls["async"], 1)
+        self.assertEqual(sum(not r["snapshot"]["cached"] for r in results), 1)
+        self.assertEqual(snap.stats()["hits"], 9)
+
+    async def test_background_refresher_keeps_snapshot_warm(self):
+        snap = HealthSnapshot({"fast": self._fast}, ttl_s=0.2, refresh_s=0.05)
+        snap.start()
+        await asyncio.sleep(0.3)
+        self.assertGreaterEqual(self.calls["fast"], 3)
+        self.assertTrue((await snap.get())["snapshot"]["cached"])
+        await snap.stop()
+        self.assertFalse(snap.stats()["refresher"])
+
+
+if __name__ == "__main__":
+    unittest.main()
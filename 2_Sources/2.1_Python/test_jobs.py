@@ -0,0 +1,36 @@
+import threading
+import unittest
+
+from services.jobs import JobManager
+
+
+class TestJobManager(unittest.TestCase):
+    def test_shutdown_cancels_queued_jobs(self):
+        manager = JobManager(workers=1, max_pending=10)
+        started, release, finished = threading.Event(), threading.Event(), threading.Event()
+        done = []
+
+        def _slow(job):
+            started.set()
+            release.wait(5)
+            return {"ok": True}
+
+        running = manager.submit("upload", "a", _slow, on_done=lambda j: finished.set())
+        queued = [manager.submit("upload", name, lambda j: {"ok": True},
+                                 on_done=lambda j: done.append((j.label, j.status))) for name in ("b", "c")]
+        self.assertTrue(started.wait(5))
+
+        manager.shutdown(wait=False)
+        # jobs en file: terminés "cancelled" (plus de "queued" fantôme), compteur rendu
+        self.assertEqual([j.status for j in queued], ["cancelled", "cancelled"])
+        self.assertEqual(sorted(done), [("b", "cancelled"), ("c", "cancelled")])
+        self.assertEqual(manager.stats()["pending"], 1)
+
+        release.set()
+        self.assertTrue(finished.wait(5))
+        self.assertEqual(running.status, "success")
+        self.assertEqual(manager.stats()["pending"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+import sqlite3
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from services.metadata_repository import SCHEMA_VERSION, MetadataRepository
+
+
+class TestMetadataRepository(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Path(self.tmp.name) / "metadata.db"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_legacy_schema_is_migrated_once(self):
+        conn = sqlite3.connect(self.db)
+        conn.execute("CREATE TABLE files (file_id TEXT, original_name TEXT, stored_path TEXT, version INTEGER)")
+        conn.execute("INSERT INTO files VALUES ('a', 'old.pdf', '/x/a.pdf', 1)")
+        conn.execute("INSERT INTO files VALUES ('a', 'dup.pdf', '/x/a.pdf', 1)")
+        conn.execute("CREATE TABLE documents (chunk_id TEXT, file_id TEXT)")
+        conn.commit()
+        conn.close()
+
+        repo = MetadataRepository(self.db)
+        self.assertEqual(repo.migrate(), SCHEMA_VERSION)
+        self.assertIn("last_seen_at", repo.columns("files"))
+        self.assertIn("section", repo.columns("documents"))
+        self.assertEqual(repo.schema_version(), SCHEMA_VERSION)
+        # doublons legacy réduits à une ligne (contrainte d'unicité posée)
+        self.assertEqual(repo.connection().execute("SELECT COUNT(*) FROM files").fetchone()[0], 1)
+        repo.close_all()
+
+    def test_upsert_bumps_version_on_conflict(self):
+        repo = MetadataRepository(self.db)
+        repo.write(lambda cur: repo.upsert_file(cur, "f1", "cv.pdf", "/x/f1.pdf", ".pdf", 10, "f1",
+                                                status="ingesting"))
+
+        def _second(cur):
+            repo.upsert_file(cur, "f1", "cv2.pdf", "/x/f1.pdf", ".pdf", 10, "f1", bump_version=True)
+            repo.replace_chunks(cur, "chunk_id, file_id, chunk_index", [("f1_0", "f1", 0), ("f1_1", "f1", 1)])
+
+        repo.write(_second)
+
+        state = repo.file_state("f1")
+        self.assertEqual(state, {"status": "ingested", "stored_path": "/x/f1.pdf", "version": 2, "chunks": 2})
+        self.assertIsNone(repo.file_state("missing"))
+        repo.close_all()
+
+    def test_failed_write_only_rolls_back_itself(self):
+        repo = MetadataRepository(self.db)
+
+        def _failing(cur):
+            repo.upsert_file(cur, "f2", "a.md", "/x/a.md", ".md", 1, "f2")
+            raise RuntimeError("boom")
+
+        bad = repo.submit_write(_failing)
+        good = repo.submit_write(lambda cur: repo.upsert_file(cur, "f3", "b.md", "/x/b.md", ".md", 1, "f3"))
+        with self.assertRaises(RuntimeError):
+            bad.result(timeout=5)
+        good.result(timeout=5)
+
+        self.assertIsNone(repo.file_state("f2"))
+        self.assertIsNotNone(repo.file_state("f3"))
+        repo.close_all()
+
+    def test_fts_index_follows_chunks(self):
+        repo = MetadataRepository(self.db)
+        if not repo.has_fts():
+            self.skipTest("SQLite sans FTS5")
+
+        def _ingest(cur):
+            repo.upsert_file(cur, "f1", "cv.md", "/x/cv.md", ".md", 1, "f1")
+            repo.replace_chunks(cur, "chunk_id, file_id, chunk_index", [("f1_0", "f1", 0), ("f1_1", "f1", 1)])
+            repo.index_chunk_texts(cur, [("f1_0", "Mission chez BNP Paribas"), ("f1_1", "Certification CKA")])
+
+        repo.write(_ingest)
+        hits = repo.search_chunks('"bnp"', 5)
+        self.assertEqual([h["chunk_id"] for h in hits], ["f1_0"])
+        self.assertEqual(hits[0]["file_id"], "f1")
+        # réindexation du même chunk: pas de doublon
+        repo.write(lambda cur: repo.index_chunk_texts(cur, [("f1_0", "Mission chez AXA")]))
+        self.assertEqual(repo.search_chunks('"bnp"', 5), [])
+        self.assertEqual(repo.fts_counts(), (2, 2))
+
+        repo.write(lambda cur: repo.delete_file(cur, "f1"))
+        self.assertEqual(repo.fts_counts(), (0, 0))
+        repo.close_all()
+
+    def test_superseded_versions_by_original_name(self):
+        repo = MetadataRepository(self.db)
+
+        def _ingest(cur):
+            repo.upsert_file(cur, "v1", "cv.md", "/x/v1.md", ".md", 1, "v1", now="2026-02-01T00:00:00+00:00",
+                             language="fr")
+            repo.upsert_file(cur, "v2", "cv.md", "/x/v2.md", ".md", 1, "v2", now="2026-02-05T00:00:00+00:00")
+            repo.upsert_file(cur, "o1", "lettre.md", "/x/o1.md", ".md", 1, "o1")
+
+        repo.write(_ingest)
+        self.assertEqual(repo.superseded_file_ids(), ["v1"])
+        attrs = repo.file_attributes(["v1", "v2"])
+        self.assertEqual((attrs["v1"]["language"], attrs["v2"]["language"]), ("fr", None))
+        self.assertEqual(attrs["v2"]["ext"], ".md")
+        repo.close_all()
+
+    def test_ingested_at_only_moves_on_ingestion(self):
+        repo = MetadataRepository(self.db)
+        repo.write(lambda cur: repo.upsert_file(cur, "f1", "cv.md", "/x/f1.md", ".md", 1, "f1",
+                                                now="2026-02-01T00:00:00+00:00"))
+        ingested = repo.file_attributes(["f1"])["f1"]["ingested_at"]
+        self.assertEqual(ingested, 1769904000.0)
+
+        # changements de statut / réupload en cours: date d'ingestion inchangée
+        repo.write(lambda cur: repo.set_status(cur, "f1", "ingesting", "2026-02-03T00:00:00+00:00"))
+        repo.write(lambda cur: repo.upsert_file(cur, "f1", "cv.md", "/x/f1.md", ".md", 1, "f1", status="ingesting"))
+        self.assertEqual(repo.file_attributes(["f1"])["f1"]["ingested_at"], ingested)
+
+        repo.write(lambda cur: repo.set_status(cur, "f1", "ingested", ingested_at=1770000000.0))
+        self.assertEqual(repo.file_attributes(["f1"])["f1"]["ingested_at"], 1770000000.0)
+        repo.close_all()
+
+    def test_concurrent_writes_are_group_committed(self):
+        repo = MetadataRepository(self.db)
+        barrier = threading.Barrier(16)
+
+        def _worker(i):
+            barrier.wait()
+            for j in range(20):
+                repo.write(lambda cur: repo.upsert_file(cur, f"f{i}_{j}", "x.md", "/x", ".md", 1, "h"))
+
+        threads = [threading.Thread(target=_worker, args=(i,)) for i in range(16)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        count = repo.connection().execute("SELECT COUNT(*) FROM files").fetchone()[0]
+        stats = repo.writer.stats()
+        self.assertEqual(count, 320)
+        self.assertEqual(stats["writes"], 320)
+        # au moins un lot a regroupé plusieurs écritures
+        self.assertGreater(stats["batch_size"]["max"], 1)
+        repo.close_all()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+try:
+    import numpy as np
+    from services.numpy_index import NumpyIndex
+except ImportError:  # numpy absent de l'environnement de test
+    np = None
+
+from services.metadata_repository import MetadataRepository
+
+
+@unittest.skipIf(np is None, "numpy non installé")
+class TestNumpyIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.repo = MetadataRepository(Path(self.tmp.name) / "metadata.db")
+        self.dir = Path(self.tmp.name) / "numpy_index"
+        rng = np.random.default_rng(0)
+        self.vectors = rng.normal(size=(50, 8)).astype(np.float32)
+        self.ids = [f"f{i % 5}_{i}" for i in range(50)]
+
+    def tearDown(self):
+        self.repo.close_all()
+        self.tmp.cleanup()
+
+    def _exact(self, q, k, allowed=None):
+        m = self.vectors / np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        scores = m @ (q / np.linalg.norm(q))
+        order = [i for i in np.argsort(-scores) if allowed is None or i in allowed]
+        return [self.ids[i] for i in order[:k]]
+
+    def test_top_k_matches_brute_force_and_survives_reload(self):
+        index = NumpyIndex(self.dir, self.repo, initial_rows=16)
+        index.add(self.ids[:20], self.vectors[:20], [c.split("_")[0] for c in self.ids[:20]])
+        index.add(self.ids[20:], self.vectors[20:], [c.split("_")[0] for c in self.ids[20:]])
+        self.assertGreaterEqual(index.stats()["capacity"], 50)
+
+        q = self.vectors[7] + 0.1
+        self.assertEqual([c for c, _ in index.search(q, 5)], self._exact(q, 5))
+        # lignes candidates (filtres SQL) => seules celles-ci sont scannées
+        self.assertEqual([c for c, _ in index.search(q, 3, rows=[1, 2, 3, 40])],
+                         self._exact(q, 3, allowed={1, 2, 3, 40}))
+
+        reloaded = NumpyIndex(self.dir, self.repo)
+        self.assertEqual(len(reloaded), 50)
+        self.assertEqual(reloaded.search(q, 5), index.search(q, 5))
+
+    def test_deleted_rows_are_hidden_then_reused(self):
+        index = NumpyIndex(self.dir, self.repo, initial_rows=16)
+        index.add(self.ids[:10], self.vectors[:10], [c.split("_")[0] for c in self.ids[:10]])
+        self.assertEqual(index.delete_file("f1"), 2)  # f1_1, f1_6
+        hits = [c for c, _ in index.search(self.vectors[1], 10)]
+        self.assertNotIn("f1_1", hits)
+        self.assertEqual(len(hits), 8)
+
+        index.add(["new_0"], self.vectors[1:2], ["new"])
+        self.assertEqual(index.search(self.vectors[1], 1)[0][0], "new_0")
+        self.assertEqual(index.stats()["free_rows"], 1)
+        self.assertEqual(sorted(r[0] for r in self.repo.vector_row_map()), [0, 1, 2, 3, 4, 5, 7, 8, 9])
+
+    def test_quantized_storage_with_rescoring(self):
+        q = self.vectors[3] + 0.05
+        for dtype, max_bytes in (("float16", 8 * 2), ("int8", 8 + 4)):
+            index = NumpyIndex(self.dir / dtype, self.repo, initial_rows=64, dtype=dtype, rescore_factor=4)
+            index.add(self.ids, self.vectors, [c.split("_")[0] for c in self.ids])
+            self.assertLessEqual(index.stats()["bytes_per_vector"], max_bytes + 4)  # + en-tête .npy
+            self.assertGreater(index.stats()["rescore_bytes"], 0)
+            # re-score pleine précision (sidecar float32): ordre exact
+            hits = index.search(q, 5)
+            self.assertEqual([c for c, _ in hits], self._exact(q, 5))
+            self.assertEqual(index.rescored, 5 * 4)
+            self.repo.write(lambda cur: cur.execute("DELETE FROM vector_rows"))
+
+    def test_two_processes_sharing_the_index(self):
+        # API + CLI (bulk_ingest / rebuild) sur le même dossier et la même table vector_rows
+        api = NumpyIndex(self.dir, self.repo, initial_rows=16)
+        cli = NumpyIndex(self.dir, self.repo, initial_rows=16)
+        api.add(self.ids[:10], self.vectors[:10], ["a"] * 10)
+        cli.add(self.ids[10:30], self.vectors[10:30], ["b"] * 20)  # fichiers agrandis (os.replace)
+        api.add(self.ids[30:35], self.vectors[30:35], ["c"] * 5)
+
+        for index in (api, cli, NumpyIndex(self.dir, self.repo)):
+            self.assertEqual(len(index), 35)
+            for i in (0, 10, 29, 30, 34):
+                hit, score = index.search(self.vectors[i], 1)[0]
+                self.assertEqual(hit, self.ids[i])
+                self.assertAlmostEqual(score, 1.0, places=5)
+
+        cli.delete_file("b")
+        self.assertEqual(len(api), 15)
+        self.assertNotIn(self.ids[10], [c for c, _ in api.search(self.vectors[10], 15)])
+
+    def test_dtype_change_empties_index(self):
+        NumpyIndex(self.dir, self.repo).add(self.ids[:5], self.vectors[:5], ["f"] * 5)
+        converted = NumpyIndex(self.dir, self.repo, dtype="int8")
+        self.assertEqual(len(converted), 0)
+        self.assertEqual(self.repo.vector_row_map(), [])
+
+    def test_missing_rescore_sidecar_empties_index(self):
+        NumpyIndex(self.dir, self.repo, dtype="int8").add(self.ids[:5], self.vectors[:5], ["f"] * 5)
+        (self.dir / "full.npy").unlink()
+        reloaded = NumpyIndex(self.dir, self.repo, dtype="int8")
+        self.assertEqual(len(reloaded), 0)
+        self.assertEqual(self.repo.vector_row_map(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
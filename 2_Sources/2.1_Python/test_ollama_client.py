@@ -0,0 +1,181 @@
+import asyncio
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import httpx  # noqa: F401
+except ImportError:
+    httpx = None
+
+from services.ollama_client import OllamaClient, OllamaError
+
+
+class _StubOllama(BaseHTTPRequestHandler):
+    """
+    Faux serveur Ollama: NDJSON en chunked, comme /api/generate et /api/chat.
+    """
+    protocol_version = "HTTP/1.1"
+    requests_seen: list = []
+    disconnected = threading.Event()
+
+    def log_message(self, *args):
+        pass
+
+    def _send_lines(self, lines, delay=0.0):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for line in lines:
+                data = (json.dumps(line) + "\n").encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+                time.sleep(delay)
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            _StubOllama.disconnected.set()
+
+    def do_GET(self):
+        _StubOllama.requests_seen.append((self.path, None))
+        if self.path == "/api/tags":
+            body = {"models": [{"name": "stub:1b"}, {"name": "other:7b"}]}
+        elif self.path == "/api/ps":
+            body = {"models": [{"name": "stub:1b", "size_vram": 1024, "expires_at": "2026-02-09T10:00:00Z"}]}
+        else:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        _StubOllama.requests_seen.append((self.path, body))
+        done = {
+            "done": True, "model": body["model"], "done_reason": "stop",
+            "prompt_eval_count": 12, "eval_count": 3,
+            "total_duration": 9_000_000, "eval_duration": 3_000_000, "prompt_eval_duration": 2_000_000,
+        }
+        if body["model"] == "missing":
+            err = json.dumps({"error": "model 'missing' not found"}).encode()
+            self.send_response(404)
+            self.send_header("Content-Length", str(len(err)))
+            self.end_headers()
+            self.wfile.write(err)
+        elif body["model"] == "slow":
+            self._send_lines([{"response": "tok", "done": False}] * 200, delay=0.02)
+        elif self.path == "/api/chat":
+            self._send_lines([
+                {"message": {"role": "assistant", "content": "Bon"}, "done": False},
+                {"message": {"role": "assistant", "content": "jour"}, "done": False},
+                done,
+            ])
+        else:
+            self._send_lines([
+                {"response": "Hel", "done": False},
+                {"response": "lo", "done": False},
+                {"response": "!", "done": False},
+                done,
+            ])
+
+
+@unittest.skipIf(httpx is None, "httpx non installé")
+class TestOllamaClient(unittest.IsolatedAsyncioTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _StubOllama)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    async def asyncSetUp(self):
+        _StubOllama.requests_seen.clear()
+        self.client = OllamaClient(base_url=self.base_url, model="stub:1b", keep_alive="5m")
+
+    async def asyncTearDown(self):
+        await self.client.aclose()
+
+    async def test_generate_streams_tokens_and_records_stats(self):
+        tokens = []
+        result = await self.client.generate("dis bonjour", options={"temperature": 0}, on_token=tokens.append)
+
+        self.assertEqual(result["text"], "Hello!")
+        self.assertEqual(tokens, ["Hel", "lo", "!"])
+        self.assertEqual(result["stats"]["prompt_eval_count"], 12)
+        self.assertEqual(result["stats"]["eval_count"], 3)
+        self.assertEqual(result["stats"]["tokens_per_second"], 1000.0)
+
+        path, body = _StubOllama.requests_seen[-1]
+        self.assertEqual(path, "/api/generate")
+        self.assertEqual(body["options"], {"temperature": 0})
+        self.assertEqual(body["keep_alive"], "5m")
+        self.assertTrue(body["stream"])
+
+    async def test_chat_aggregates_message(self):
+        result = await self.client.chat([{"role": "user", "content": "salut"}], model="other:7b")
+
+        self.assertEqual(result["message"]["content"], "Bonjour")
+        self.assertEqual(_StubOllama.requests_seen[-1][1]["model"], "other:7b")
+        self.assertEqual(self.client.stats()["eval_tokens"], 3)
+
+    async def test_connection_is_reused(self):
+        await self.client.generate("a")
+        first = self.client._http()
+        await self.client.generate("b")
+        self.assertIs(self.client._http(), first)
+
+    async def test_http_error_raises(self):
+        with self.assertRaises(OllamaError):
+            await self.client.generate("x", model="missing")
+        self.assertEqual(self.client.stats()["errors"], 1)
+
+    async def test_cancel_closes_stream(self):
+        _StubOllama.disconnected.clear()
+        task = asyncio.create_task(self.client.generate("long", model="slow"))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertEqual(self.client.stats()["cancelled"], 1)
+        # le serveur voit la connexion fermée => la génération s'arrête côté Ollama
+        await asyncio.to_thread(_StubOllama.disconnected.wait, 5)
+        self.assertTrue(_StubOllama.disconnected.is_set())
+
+    async def test_probe_reports_models_loaded_and_latency(self):
+        first = await self.client.probe()
+        self.assertEqual(first["status"], "ok")
+        self.assertEqual(first["models"], ["stub:1b", "other:7b"])
+        self.assertEqual(first["loaded"][0]["name"], "stub:1b")
+        self.assertGreater(first["latency_ms"]["total"], 0)
+        pool = self.client._http()
+        await self.client.probe()
+        self.assertIs(self.client._http(), pool)
+        self.assertEqual(self.client.stats()["probe_ms"]["count"], 2)
+
+    async def test_probe_unreachable_is_an_error_status(self):
+        down = OllamaClient(base_url="http://127.0.0.1:9")
+        try:
+            result = await down.probe(timeout=0.5)
+        finally:
+            await down.aclose()
+        self.assertEqual(result["status"], "error")
+        self.assertEqual(down.stats()["probe_errors"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
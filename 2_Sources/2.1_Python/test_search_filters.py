@@ -0,0 +1,39 @@
+import unittest
+
+from services.search_filters import SearchFilters, to_timestamp
+
+
+class TestSearchFilters(unittest.TestCase):
+    def test_compiles_to_chroma_where(self):
+        filters = SearchFilters.from_dict({"ext": "PDF", "language": ["fr", "en"], "ingested_after": "2026-02-01"})
+        self.assertEqual(filters.to_where(), {"$and": [
+            {"ext": {"$eq": ".pdf"}},
+            {"language": {"$in": ["fr", "en"]}},
+            {"ingested_at": {"$gte": to_timestamp("2026-02-01T00:00:00+00:00")}},
+        ]})
+        self.assertEqual(SearchFilters.from_dict({"file_id": "f1"}).to_where(), {"file_id": {"$eq": "f1"}})
+        self.assertIsNone(SearchFilters().to_where())
+        self.assertEqual(SearchFilters().to_where(exclude_file_ids=["old"]), {"file_id": {"$nin": ["old"]}})
+
+    def test_sql_mirrors_where(self):
+        clause, params = SearchFilters.from_dict({"ext": [".md", "txt"], "file_id": "f1"}).to_sql(["old"])
+        self.assertEqual(clause, "d.file_id IN (?) AND f.ext IN (?, ?) AND d.file_id NOT IN (?)")
+        self.assertEqual(params, ["f1", ".md", ".txt", "old"])
+        self.assertEqual(SearchFilters().to_sql(), ("", []))
+        # dates: même champ que Chroma (ingested_at epoch), pas updated_at
+        clause, params = SearchFilters.from_dict({"ingested_after": "2026-02-01", "ingested_before": 1770000000}).to_sql()
+        self.assertEqual(clause, "f.ingested_at >= ? AND f.ingested_at <= ?")
+        self.assertEqual(params, [to_timestamp("2026-02-01"), 1770000000.0])
+
+    def test_invalid_filters_are_rejected(self):
+        with self.assertRaises(ValueError):
+            SearchFilters.from_dict({"author": "x"})
+        with self.assertRaises(ValueError):
+            SearchFilters.from_dict({"ingested_after": "hier"})
+        with self.assertRaises(ValueError):
+            SearchFilters.from_dict({"ingested_after": "2026-02-02", "ingested_before": "2026-02-01"})
+        self.assertTrue(SearchFilters.from_dict({"latest_only": "true"}).latest_only)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,222 @@
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest import mock
+
+try:
+    from services import ingestion, search_cache, vector_store as vs
+    from services.jobs import JobManager
+    from services.metadata_repository import MetadataRepository
+except ImportError:  # fastapi / chromadb / langchain / pypdf absents
+    vs = None
+
+
+def _stub_embeddings(texts):
+    return [[float(len(t)), float(sum(map(ord, t)) % 97), 1.0] for t in texts]
+
+
+class _IsolatedStore(unittest.TestCase):
+    """Stockage (SQLite, Chroma, pointeur, checkpoint, verrou) isolé dans un dossier temporaire."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        root = Path(self.tmp.name)
+        self.repo = MetadataRepository(root / "metadata.db")
+        self.chroma = vs.ChromaManager(root / "chroma")
+        patches = {
+            "METADATA_REPO": self.repo,
+            "CHROMA": self.chroma,
+            "ACTIVE_COLLECTION_FILE": root / "active_collection.json",
+            "REBUILD_CHECKPOINT": root / "rebuild_checkpoint.json",
+            "INDEX_LOCK_FILE": root / "index_write.lock",
+            "VECTOR_BACKEND": "chroma",
+            "embed_chunk_texts": _stub_embeddings,
+            "embed_query_cached": lambda query: _stub_embeddings([query])[0],
+            # threads au lieu de process spawn: les patches restent visibles des workers
+            "_extraction_pool": lambda workers: ThreadPoolExecutor(workers),
+        }
+        for name, value in patches.items():
+            patcher = mock.patch.object(vs, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(search_cache, "GENERATION_STAMP", root / "index.generation")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.files_dir = root / "files"
+        self.files_dir.mkdir()
+
+    def tearDown(self):
+        self.repo.close_all()
+        self.chroma.close()
+        self.tmp.cleanup()
+
+    def _file(self, name, text):
+        path = self.files_dir / name
+        path.write_text(text, encoding="utf-8")
+        return str(path)
+
+    def _document_file_ids(self):
+        rows = self.repo.connection().execute("SELECT DISTINCT file_id FROM documents;").fetchall()
+        return {r[0] for r in rows}
+
+
+@unittest.skipIf(vs is None, "dépendances de services.vector_store non installées")
+class TestRebuild(_IsolatedStore):
+    def test_rebuild_swaps_collection_and_documents(self):
+        ids = [vs.ingest_file(self._file(f"doc{i}.txt", f"Contenu du document {i}."))["file_id"] for i in range(3)]
+        previous = vs.active_collection_name()
+
+        result = vs.rebuild_chroma_from_sqlite(resume=False, workers=2, embed_batch=1)
+
+        self.assertEqual(result["status"], "ok")
+        self.assertEqual((result["files_done"], result["files_failed"]), (3, 0))
+        active = vs.active_collection_name()
+        self.assertNotEqual(active, previous)
+        self.assertEqual(result["collection"], active)
+        self.assertEqual(self._document_file_ids(), set(ids))
+        self.assertEqual(self.chroma.collection(active).count(), result["chunks"])
+        self.assertNotIn(previous, [getattr(c, "name", c) for c in self.chroma.client().list_collections()])
+        self.assertFalse(vs.REBUILD_CHECKPOINT.exists())
+        self.assertEqual(vs.REBUILD_STATUS["state"], "done")
+
+    def test_file_failing_extraction_is_marked_failed(self):
+        kept = vs.ingest_file(self._file("kept.txt", "Fichier conservé."))["file_id"]
+        lost_path = self._file("lost.txt", "Fichier disparu avant le rebuild.")
+        lost = vs.ingest_file(lost_path)["file_id"]
+        content = Path(lost_path).read_text(encoding="utf-8")
+        Path(lost_path).unlink()
+
+        result = vs.rebuild_chroma_from_sqlite(resume=False, workers=1, embed_batch=1)
+
+        self.assertEqual((result["files_done"], result["files_failed"]), (1, 1))
+        self.assertEqual(self.repo.file_statuses([kept, lost]), {kept: "ingested", lost: "failed"})
+        # réupload du même contenu: réingéré (plus de court-circuit already_ingested)
+        Path(lost_path).write_text(content, encoding="utf-8")
+        again = vs.ingest_file(lost_path)
+        self.assertEqual((again["status"], again["chunks"]), ("ok", 1))
+        self.assertEqual(self._document_file_ids(), {kept, lost})
+
+    def test_writes_during_rebuild_wait_for_the_swap(self):
+        kept = vs.ingest_file(self._file("kept.txt", "Fichier conservé."))["file_id"]
+        purged = vs.ingest_file(self._file("purged.txt", "Fichier purgé pendant le rebuild."))["file_id"]
+        late_path = self._file("late.txt", "Fichier uploadé pendant le rebuild.")
+        results = {}
+        writers = [
+            threading.Thread(target=lambda: results.update(late=vs.ingest_file(late_path))),
+            threading.Thread(target=lambda: results.update(purge=vs.purge_file(purged))),
+        ]
+        blocked = []
+
+        def on_progress(status):
+            if not writers[0].is_alive() and "late" not in results:
+                for t in writers:
+                    t.start()
+                time.sleep(0.2)
+                blocked.append(all(t.is_alive() for t in writers))
+
+        vs.rebuild_chroma_from_sqlite(resume=False, workers=1, embed_batch=1, progress=on_progress)
+        for t in writers:
+            t.join(10)
+
+        # ingest / purge ont attendu la bascule, puis écrit dans la nouvelle collection
+        self.assertEqual(blocked[:1], [True])
+        late = results["late"]["file_id"]
+        self.assertEqual(results["purge"]["status"], "ok")
+        self.assertEqual(self._document_file_ids(), {kept, late})
+        active = self.chroma.collection(vs.active_collection_name())
+        stored = {m["file_id"] for m in active.get(include=["metadatas"])["metadatas"]}
+        self.assertEqual(stored, {kept, late})
+
+
+@unittest.skipIf(vs is None, "dépendances de services.vector_store non installées")
+class TestOriginalName(_IsolatedStore):
+    def _upload(self, original_name, text):
+        # comme store_upload(): contenu rangé sous by_sha256/<sha>.ext
+        tmp = Path(self._file("tmp.txt", text))
+        file_id = vs.sha256_file(str(tmp))
+        stored = tmp.rename(self.files_dir / f"{file_id}.txt")
+        ingestion.ingest_stored_file({"file_id": file_id, "file_path": str(stored), "original_name": original_name})
+        return file_id
+
+    def _hits(self, filters):
+        return {d["file_id"] for d in vs.search_similar("rapport trimestriel", k=10, filters=filters)}
+
+    def test_latest_only_keeps_newest_version_of_an_upload_name(self):
+        old = self._upload("rapport.txt", "Rapport trimestriel, première version.")
+        new = self._upload("rapport.txt", "Rapport trimestriel, version corrigée.")
+        other = self._upload("annexe.txt", "Annexe du rapport trimestriel.")
+
+        names = dict(self.repo.connection().execute("SELECT file_id, original_name FROM files;").fetchall())
+        self.assertEqual(names, {old: "rapport.txt", new: "rapport.txt", other: "annexe.txt"})
+        self.assertEqual(self._hits({"original_name": "rapport.txt"}), {old, new})
+        self.assertEqual(self._hits({"latest_only": True}), {new, other})
+        self.assertEqual(self._hits({"original_name": "rapport.txt", "latest_only": True}), {new})
+
+    def test_bulk_ingest_recovers_upload_name_from_by_name_copy(self):
+        path = Path(self._file("tmp.txt", "Rapport trimestriel archivé."))
+        file_id = vs.sha256_file(str(path))
+        sha_dir = self.files_dir / "by_sha256"
+        sha_dir.mkdir()
+        path.rename(sha_dir / f"{file_id}.txt")
+        copy = self.files_dir / "by_name" / "rapport" / f"20260209_101500__{file_id[:12]}.txt"
+        copy.parent.mkdir(parents=True)
+        copy.write_text("Rapport trimestriel archivé.", encoding="utf-8")
+
+        with mock.patch.object(vs, "UPLOADS_DIR", self.files_dir):
+            result = vs.bulk_ingest(str(sha_dir), workers=1, checkpoint_path=self.files_dir / "bulk.json")
+
+        self.assertEqual(result["ingested"], 1)
+        self.assertEqual(self._hits({"original_name": "rapport.txt"}), {file_id})
+
+
+
+@unittest.skipIf(vs is None, "dépendances de services.vector_store non installées")
+class TestUploadRecovery(_IsolatedStore):
+    def _stored(self, name, text):
+        # comme store_upload(): by_sha256/<2>/<sha>.ext + copie by_name/<stem>/<ts>__<sha12>.ext
+        tmp = Path(self._file("tmp.txt", text))
+        file_id = vs.sha256_file(str(tmp))
+        sha_dir = self.files_dir / "by_sha256" / file_id[:2]
+        sha_dir.mkdir(parents=True, exist_ok=True)
+        stored = tmp.rename(sha_dir / f"{file_id}.txt")
+        copy = self.files_dir / "by_name" / Path(name).stem / f"20260209_101500__{file_id[:12]}.txt"
+        copy.parent.mkdir(parents=True, exist_ok=True)
+        copy.write_text(text, encoding="utf-8")
+        return file_id, stored
+
+    def test_uploads_cancelled_at_shutdown_are_requeued(self):
+        jobs = JobManager(workers=1)
+        for name, value in (("BY_SHA", self.files_dir / "by_sha256"), ("UPLOAD_ROOT", self.files_dir),
+                            ("METADATA_REPO", self.repo), ("INGEST_JOBS", jobs)):
+            patcher = mock.patch.object(ingestion, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        lost, lost_path = self._stored("rapport.txt", "Upload accepté puis annulé à l'arrêt.")
+        done, done_path = self._stored("annexe.txt", "Upload déjà ingéré.")
+        vs.ingest_file(str(done_path), file_id=done, original_name="annexe.txt")
+        broken, broken_path = self._stored("casse.txt", "Extraction en erreur.")
+        self.repo.write(lambda cur: self.repo.upsert_file(cur, broken, "casse.txt", str(broken_path), ".txt",
+                                                          1, broken, status="failed"))
+
+        result = ingestion.recover_pending_uploads()
+        jobs.shutdown(wait=True)
+
+        self.assertEqual((result["stored"], result["requeued"], result["deferred"]), (3, 1, 0))
+        self.assertEqual(self.repo.file_statuses([lost, done, broken]),
+                         {lost: "ingested", done: "ingested", broken: "failed"})
+        names = dict(self.repo.connection().execute("SELECT file_id, original_name FROM files;").fetchall())
+        self.assertEqual(names[lost], "rapport.txt")
+
+    def test_failed_ingestion_is_marked_failed(self):
+        path = self._file("vide.txt", "contenu")
+        with mock.patch.object(vs, "load_file_chunks", side_effect=RuntimeError("extraction")):
+            with self.assertRaises(RuntimeError):
+                vs.ingest_file(path)
+        self.assertEqual(self.repo.file_statuses([vs.sha256_file(path)]), {vs.sha256_file(path): "failed"})
+
+
+if __name__ == "__main__":
+    unittest.main()
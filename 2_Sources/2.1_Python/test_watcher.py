@@ -0,0 +1,139 @@
+import hashlib
+import os
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from services.jobs import QueueFullError
+from services.metadata_repository import MetadataRepository
+from services.watcher import DirectoryWatcher
+
+
+class TestDirectoryWatcher(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.inbox = Path(self.tmp.name) / "inbox"
+        self.inbox.mkdir()
+        self.repo = MetadataRepository(Path(self.tmp.name) / "metadata.db")
+        self.hashed = []
+        self.queued = []
+        self.queue_full = False
+        self.failing = set()  # jobs d'ingestion qui échouent (les autres réussissent)
+
+    def tearDown(self):
+        self.repo.close_all()
+        self.tmp.cleanup()
+
+    def _hash(self, path):
+        self.hashed.append(os.path.basename(path))
+        return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+    def _enqueue(self, path, file_id):
+        if self.queue_full:
+            raise QueueFullError("pleine")
+        name = os.path.basename(path)
+        self.queued.append(name)
+        if name not in self.failing:
+            self.repo.write(lambda cur: MetadataRepository.upsert_file(
+                cur, file_id, name, path, os.path.splitext(name)[1], 1, file_id))
+
+    def _watcher(self):
+        return DirectoryWatcher(self.inbox, self.repo, self._enqueue, self._hash, (".md", ".pdf"),
+                                debounce_s=1.0, max_wait_s=10.0, backend="poll")
+
+    def test_burst_is_debounced_then_only_changed_files_are_hashed(self):
+        sub = self.inbox / "cv"
+        sub.mkdir()
+        for i in range(20):
+            (sub / f"cv_{i:02d}.md").write_text(f"variante {i}")
+        (sub / "notes.log").write_text("ignoré")
+        (sub / "cv_99.md.part").write_text("copie en cours")
+
+        watcher = self._watcher()
+        self.assertEqual(watcher.scan(now=100.0), 20)
+        self.assertEqual(watcher.flush(now=100.5)["enqueued"], 0)  # rafale pas encore calme
+        self.assertEqual(watcher.flush(now=101.0)["enqueued"], 20)
+        self.assertEqual(len(self.hashed), 20)
+
+        # redémarrage: index relu depuis SQLite, rien de re-hashé
+        restarted = self._watcher()
+        self.assertEqual(restarted.scan(now=200.0), 0)
+
+        (sub / "cv_03.md").write_text("variante 3 modifiée")
+        os.rename(sub / "cv_05.md", self.inbox / "cv_05_final.md")
+        self.assertEqual(restarted.scan(now=300.0), 2)
+        done = restarted.flush(now=302.0)
+        self.assertEqual((done["enqueued"], done["renamed"]), (1, 1))
+        self.assertEqual(self.hashed[20:], ["cv_03.md"])
+        self.assertEqual(len(self.repo.watched_files(str(self.inbox))), 20)
+
+    def test_full_queue_and_known_content_are_not_lost(self):
+        for name in ("a.md", "b.md"):
+            (self.inbox / name).write_text(name)
+        watcher = self._watcher()
+        watcher.scan(now=0.0)
+        self.queue_full = True
+        self.assertEqual(watcher.flush(now=5.0)["deferred"], 2)
+        self.queue_full = False
+        self.assertEqual(watcher.flush(now=6.0)["enqueued"], 2)
+
+        # même contenu déjà ingéré => indexé sans job
+        file_id = hashlib.sha256(b"a.md").hexdigest()
+        self.repo.write(lambda cur: MetadataRepository.upsert_file(
+            cur, file_id, "a.md", "/x/a.md", ".md", 4, file_id))
+        (self.inbox / "copie.md").write_text("a.md")
+        watcher.touch([str(self.inbox / "copie.md")], now=10.0)
+        self.assertEqual(watcher.flush(now=20.0)["already_ingested"], 1)
+        self.assertEqual(self.queued, ["a.md", "b.md"])
+
+    def test_files_never_ingested_are_requeued_on_restart(self):
+        for name in ("ok.md", "perdu.md"):
+            (self.inbox / name).write_text(name)
+        # job de perdu.md en erreur (ou annulé à l'arrêt): stat indexé, contenu jamais ingéré
+        self.failing = {"perdu.md"}
+        watcher = self._watcher()
+        watcher.scan(now=0.0)
+        self.assertEqual(watcher.flush(now=5.0)["enqueued"], 2)
+
+        restarted = self._watcher()
+        self.assertEqual(restarted.scan(now=100.0), 1)
+        self.assertEqual(restarted.flush(now=105.0)["enqueued"], 1)
+        self.assertEqual(self.queued, ["ok.md", "perdu.md", "perdu.md"])
+
+    def test_stats_and_scan_do_not_wait_for_a_slow_hash(self):
+        for name in ("gros.pdf", "petit.md"):
+            (self.inbox / name).write_text(name)
+        hashing, release = threading.Event(), threading.Event()
+
+        def slow_hash(path):
+            hashing.set()
+            release.wait(5)
+            return self._hash(path)
+
+        watcher = DirectoryWatcher(self.inbox, self.repo, self._enqueue, slow_hash, (".md", ".pdf"),
+                                   debounce_s=1.0, max_wait_s=10.0, backend="poll")
+        watcher.scan(now=0.0)
+        flusher = threading.Thread(target=watcher.flush, kwargs={"now": 5.0})
+        flusher.start()
+        self.assertTrue(hashing.wait(5))
+
+        # pendant le hash: stats() / scan() répondent, un fichier modifié reste en attente
+        (self.inbox / "petit.md").write_text("petit.md modifié")
+        stats = []
+        reader = threading.Thread(target=lambda: stats.append(watcher.stats()))
+        reader.start()
+        reader.join(1)
+        self.assertEqual(stats[0]["pending"], 2)
+        self.assertEqual(watcher.scan(now=5.5), 2)
+        release.set()
+        flusher.join(5)
+
+        self.assertEqual(self.queued, ["gros.pdf", "petit.md"])
+        self.assertEqual(watcher.stats()["pending"], 1)
+        watcher.flush(now=7.0)
+        self.assertEqual(watcher.stats()["pending"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()